@@ -0,0 +1,100 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from src.alerter.rules import EVENTS, Rule, RuleIndex, tokenize
+from src.storage.db_manager import DBManager
+
+SITES = ("megaeletronicos", "mobilezone")
+BRANDS = ("apple", "samsung", "xiaomi", "motorola", "sony", "lg", "jbl", "lenovo", "asus", "hp")
+KINDS = ("iphone", "galaxy", "redmi", "moto", "playstation", "televisor", "parlante", "notebook",
+         "auricular", "smartwatch", "tablet", "monitor")
+EXTRAS = ("pro", "max", "ultra", "lite", "plus", "mini", "128gb", "256gb", "512gb", "negro", "blanco", "azul")
+
+
+def make_changes(n, seed=0):
+    rnd = random.Random(seed)
+    changes = []
+    for i in range(n):
+        name = " ".join([rnd.choice(BRANDS), rnd.choice(KINDS), str(rnd.randint(5, 20)),
+                         *rnd.sample(EXTRAS, 2)])
+        old = round(rnd.uniform(20, 2000), 2)
+        event = rnd.choice(EVENTS[:4])
+        price = round(old * rnd.uniform(0.6, 0.99), 2) if event == "drop" else old
+        changes.append((event, rnd.choice(SITES), str(100000 + i), name, price, old))
+    return changes
+
+
+def make_rules(n, changes, seed=1):
+    # A mix like real subscribers: 40% watch one product, 40% keywords with
+    # an optional ceiling, 20% broad site-wide drop thresholds.
+    rnd = random.Random(seed)
+    rules = []
+    for i in range(n):
+        chat = str(rnd.randint(1, max(1, n // 5)))
+        kind = rnd.random()
+        if kind < 0.4:
+            _, site, code, _, _, _ = rnd.choice(changes)
+            rules.append(Rule(i, chat, site=site, code=code, events="drop,back_in_stock,out_of_stock"))
+        elif kind < 0.8:
+            words = [rnd.choice(KINDS)] + ([rnd.choice(EXTRAS)] if rnd.random() < 0.7 else [])
+            rules.append(Rule(i, chat, site=rnd.choice(SITES + (None,)), keywords=" ".join(words),
+                              max_price=rnd.choice((None, 300.0, 800.0, 1500.0))))
+        else:
+            rules.append(Rule(i, chat, site=rnd.choice(SITES), min_drop_pct=rnd.choice((20, 30, 40, 50, 60)),
+                              events="drop"))
+    return rules
+
+
+def match_linear(rules, change):
+    event, site, code, name, price, old = change
+    tokens = tokenize(name)
+    chats = {}
+    for rule in rules:
+        if rule.chat_id not in chats and rule.matches(event, site, code, tokens, price, old):
+            chats[rule.chat_id] = rule.id
+    return list(chats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexed vs. linear matching of alert rules.")
+    parser.add_argument("--rules", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--changes", type=int, default=10_000)
+    parser.add_argument("--linear-sample", type=int, default=200,
+                        help="changes matched by full scan; its time is scaled up to --changes")
+    args = parser.parse_args()
+
+    changes = make_changes(args.changes)
+    for n in args.rules:
+        rules = make_rules(n, changes)
+        with tempfile.TemporaryDirectory() as tmp:
+            with DBManager(os.path.join(tmp, "bench.db")) as db:
+                db.initialize_database()
+                for r in rules:
+                    db.add_alert_rule(r.chat_id, site=r.site, code=r.code, keywords=" ".join(sorted(r.tokens)) or None,
+                                      max_price=r.max_price, min_drop_pct=r.min_drop_pct,
+                                      events=",".join(sorted(r.events)))
+                start = time.perf_counter()
+                index = RuleIndex.from_rows(db.get_alert_rules())
+                load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed = [index.match(*c) for c in changes]
+        match_s = time.perf_counter() - start
+        fanout = sum(len(chats) for chats in indexed)
+
+        sample = changes[:args.linear_sample]
+        start = time.perf_counter()
+        linear = [match_linear(rules, c) for c in sample]
+        linear_s = (time.perf_counter() - start) * len(changes) / max(1, len(sample))
+        assert all(sorted(a) == sorted(b) for a, b in zip(linear, indexed)), "index and scan disagree"
+
+        print(f"rules={n:>6d} changes={len(changes):>6d}  load {load:6.2f}s  "
+              f"indexed {match_s:6.2f}s ({len(changes) / match_s:>9.0f} changes/s)  "
+              f"linear ~{linear_s:7.1f}s  fan-out {fanout} alerts")
+
+
+if __name__ == "__main__":
+    main()
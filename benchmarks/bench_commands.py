@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.alerter import CommandBot, ProductIndex, TelegramSender
+from src.storage.db_manager import DBManager
+from benchmarks.bench_alert_rules import BRANDS, EXTRAS, KINDS
+from benchmarks.fake_telegram_server import FakeTelegramServer
+
+SITE = "benchsite"
+TOKEN = "TEST"
+
+
+def make_rows(n, seed=0):
+    rnd = random.Random(seed)
+    return [(str(100000 + i),
+             " ".join([rnd.choice(BRANDS), rnd.choice(KINDS), str(rnd.randint(5, 20)), *rnd.sample(EXTRAS, 2)]),
+             f"https://example.com/p/{i}", round(rnd.uniform(20, 2000), 2),
+             "in stock" if rnd.random() < 0.9 else "out of stock", f"cat{i % 20}")
+            for i in range(n)]
+
+
+def make_queries(n, distinct, seed=1):
+    rnd = random.Random(seed)
+    pool = []
+    for _ in range(distinct):
+        kind = rnd.random()
+        if kind < 0.3:
+            pool.append(f"/price {100000 + rnd.randrange(1000)}")
+        elif kind < 0.6:
+            pool.append(f"/search {rnd.choice(KINDS)} {rnd.choice(EXTRAS)}")
+        elif kind < 0.9:
+            pool.append(f"/cheapest {rnd.choice(BRANDS)} {rnd.choice(KINDS)}")
+        else:
+            pool.append(f"/history {100000 + rnd.randrange(1000)}")
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(args, db_file):
+    read_db = DBManager(db_file)
+    index = ProductIndex(read_db)
+    start = time.perf_counter()
+    await index.refresh_async()
+    print(f"load       {len(index):>7d} products in {time.perf_counter() - start:.3f}s")
+
+    # Incremental refresh after a run that changed a few products.
+    with DBManager(db_file) as db:
+        rows = make_rows(args.products)
+        rnd = random.Random(2)
+        changed = [(code, name, url, round(price * 0.9, 2), stock, cat)
+                   for code, name, url, price, stock, cat in rnd.sample(rows, int(len(rows) * args.change_rate))]
+        db.bulk_upsert_products(SITE, changed)
+    start = time.perf_counter()
+    n = await index.refresh_async()
+    print(f"refresh    {n:>7d} changed in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    with FakeTelegramServer() as server:
+        sender = TelegramSender(TOKEN, api_url=server.url, global_rate=1000, chat_rate=1000)
+        bot = CommandBot(TOKEN, index, sender, api_url=server.url, poll_timeout=5)
+        queries = make_queries(args.queries, args.distinct)
+
+        start = time.perf_counter()
+        answer_times = []
+        for q in queries:
+            t = time.perf_counter()
+            await bot.answer(q)
+            answer_times.append(time.perf_counter() - t)
+        print(f"answer     {len(queries):>7d} queries in {time.perf_counter() - start:.3f}s  "
+              f"p50 {pct(answer_times, 0.5) * 1000:.3f}ms  p99 {pct(answer_times, 0.99) * 1000:.3f}ms  "
+              f"cache {bot.cache.hits} hits / {bot.cache.misses} misses")
+
+        # End to end through the fake Bot API: push a message, wait for the reply.
+        bot.cache = type(bot.cache)(bot.cache.maxsize)
+        bot.start()
+        latencies = []
+        for i, q in enumerate(queries[:args.round_trips]):
+            chat = 1000 + i
+            t = time.perf_counter()
+            server.push_update(chat, q)
+            while not server.replies(chat):
+                await asyncio.sleep(0.0005)
+            latencies.append(time.perf_counter() - t)
+        await bot.stop()
+        await sender.close()
+        print(f"round trip {len(latencies):>7d} queries  p50 {statistics.median(latencies) * 1000:.1f}ms  "
+              f"p99 {pct(latencies, 0.99) * 1000:.1f}ms  ({server.requests} API calls)")
+    read_db.close_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat query latency against a local fake Bot API.")
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--change-rate", type=float, default=0.02)
+    parser.add_argument("--queries", type=int, default=10_000)
+    parser.add_argument("--distinct", type=int, default=500, help="distinct queries in the mix")
+    parser.add_argument("--round-trips", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        with DBManager(db_file) as db:
+            db.initialize_database()
+            rows = make_rows(args.products)
+            db.bulk_upsert_products(SITE, rows)
+            db.append_price_history(SITE, [(code, price, stock) for code, _, _, price, stock, _ in rows[:1000]],
+                                    ts=int(time.time()) - 86400)
+        asyncio.run(run(args, db_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.catalog_server import CatalogServer
+from benchmarks.fake_telegram_server import FakeTelegramServer
+
+SITES = ("megaeletronicos", "mobilezone")
+STAGES = ("fetch_seconds", "parse_seconds", "category_seconds", "db_write_seconds")
+
+
+def stage_latencies(run):
+    # Per-stage latency over all sites: mean and bucket-bound p50/p95, in ms.
+    from src.common.metrics import Histogram
+
+    out = {}
+    for name in STAGES:
+        merged = Histogram()
+        for (n, _), hist in run.histograms.items():
+            if n == name:
+                merged.merge(hist)
+        if merged.count:
+            out[name[:-len("_seconds")]] = {
+                "count": merged.count,
+                "mean_ms": merged.sum / merged.count * 1000,
+                "p50_ms": merged.quantile(0.5) * 1000,
+                "p95_ms": merged.quantile(0.95) * 1000,
+            }
+    return out
+
+
+def run_pipeline(db_file, categories, api_url, telegram_url, telegram_rate, digest, drain_timeout, queue):
+    # One full run_all_scrapers pass in a fresh process, so peak RSS covers
+    # this run only. Alerts go through the outbox to the fake Bot API and the
+    # run ends once they are delivered or drain_timeout passes.
+    os.environ["MOBILEZONE_API_URL"] = api_url
+    from src.alerter import TelegramSender, OutboxDispatcher
+    from src.common import metrics
+    from src.core import bot
+    from src.storage.db_manager import DBManager
+
+    logging.getLogger().setLevel(logging.WARNING)
+    alerter = bot.Alerter("bench", "1", digest=digest, api_url=telegram_url)
+
+    async def go(db):
+        sender = TelegramSender(alerter.bot_token, api_url=telegram_url,
+                                global_rate=telegram_rate, chat_rate=telegram_rate)
+        dispatcher = OutboxDispatcher(db, sender, digest=digest, poll_interval=0.1)
+        dispatcher.start()
+        try:
+            with bot.recorded_run(db, "bench", sender=sender) as run:
+                start = time.perf_counter()
+                await bot.run_all_scrapers_async(db, alerter, mobilezone_engine="api",
+                                                 categories=categories, dispatcher=dispatcher)
+                scraped = time.perf_counter() - start
+                await dispatcher.stop(drain_timeout=drain_timeout)
+                delivered = time.perf_counter() - start
+        finally:
+            await sender.close()
+        return run, scraped, delivered
+
+    with DBManager(db_file) as db, contextlib.redirect_stdout(io.StringIO()):
+        db.initialize_database()
+        started_at = time.time()
+        run, scraped, delivered = asyncio.run(go(db))
+        latency = db._execute(
+            "SELECT AVG(sent_at - created_at), MAX(sent_at - created_at), COUNT(*) FROM outbox"
+            " WHERE status = 'sent' AND created_at >= ?;", (started_at,), fetch='one')
+    row = run.to_row()
+    queue.put({
+        "scrape_s": scraped,
+        "total_s": delivered,
+        "items": row["items"],
+        "changed": row["changed"],
+        "requests": row["requests"],
+        "bytes": row["bytes"],
+        "retries": row["retries"],
+        "alerts_queued": row["alerts_queued"],
+        "alerts_sent": row["alerts_sent"],
+        "alert_latency_avg_s": latency[0] or 0.0,
+        "alert_latency_max_s": latency[1] or 0.0,
+        "items_per_s": row["items"] / scraped if scraped else 0.0,
+        "stages": stage_latencies(run),
+        "peak_rss_mb": metrics.peak_rss_mb(),
+    })
+
+
+def db_size(db_file):
+    return sum(os.path.getsize(db_file + suffix) for suffix in ("", "-wal")
+               if os.path.exists(db_file + suffix))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_size(size, args, ctx):
+    # Cold run into an empty database, then warm runs after moving
+    # change_rate of the catalog's prices.
+    per_category = max(1, size // (args.categories * len(args.sites)))
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp, \
+            CatalogServer(categories=args.categories, products_per_category=per_category,
+                          page_size=args.page_size, latency=args.latency, etags=args.etags) as server, \
+            FakeTelegramServer() as telegram:
+        db_file = os.path.join(tmp, "bench.db")
+        categories = {}
+        if "megaeletronicos" in args.sites:
+            categories["megaeletronicos"] = server.category_urls()
+        if "mobilezone" in args.sites:
+            categories["mobilezone"] = [f"cat-{c}" for c in range(args.categories)]
+        for n in range(args.runs):
+            if n:
+                server.advance(args.change_rate)
+            requests, sent, messages = server.requests, server.bytes_sent, len(telegram.messages)
+            queue = ctx.Queue()
+            proc = ctx.Process(target=run_pipeline, args=(
+                db_file, categories, server.url + "api/", telegram.url, args.telegram_rate,
+                args.digest, args.drain_timeout, queue))
+            proc.start()
+            result = queue.get()
+            proc.join()
+            result.update({
+                "size": size,
+                "products": per_category * args.categories * len(categories),
+                "run": n,
+                "label": "cold" if n == 0 else f"warm {n}",
+                "server_requests": server.requests - requests,
+                "server_bytes": server.bytes_sent - sent,
+                "telegram_messages": len(telegram.messages) - messages,
+                "db_bytes": db_size(db_file),
+            })
+            rows.append(result)
+            print(format_row(result))
+    return rows
+
+
+def format_row(r):
+    stages = r["stages"]
+    p95 = lambda name: f"{stages[name]['p95_ms']:6.0f}" if name in stages else "   n/a"
+    return (f"{r['products']:>7d} {r['label']:7s} {r['scrape_s']:7.2f}s {r['items_per_s']:9.0f} items/s  "
+            f"{r['changed']:>6d} changed  {r['alerts_queued']:>6d} alerts ({r['telegram_messages']} msgs, "
+            f"delivered +{r['total_s'] - r['scrape_s']:.1f}s)  p95 ms fetch {p95('fetch')} parse {p95('parse')} "
+            f"db {p95('db_write')}  RSS {r['peak_rss_mb']:6.1f} MiB  DB {r['db_bytes'] / 2**20:7.1f} MiB")
+
+
+def compare(rows, previous_file):
+    with open(previous_file) as f:
+        previous = {(r["products"], r["run"]): r for r in json.load(f)["results"]}
+    print(f"vs. {previous_file}:")
+    for r in rows:
+        old = previous.get((r["products"], r["run"]))
+        if old is None:
+            continue
+        ratio = lambda key: r[key] / old[key] if old[key] else float("nan")
+        print(f"{r['products']:>7d} {r['label']:7s} throughput x{ratio('items_per_s'):5.2f}  "
+              f"time x{ratio('scrape_s'):5.2f}  RSS x{ratio('peak_rss_mb'):5.2f}  DB x{ratio('db_bytes'):5.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full scrape-diff-alert pipeline against a local catalog "
+                                                 "and a fake Telegram Bot API.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="total products per catalog, split across sites and categories (up to 500000)")
+    parser.add_argument("--sites", nargs="+", choices=SITES, default=list(SITES))
+    parser.add_argument("--categories", type=int, default=20, help="categories per site")
+    parser.add_argument("--page-size", type=int, default=24)
+    parser.add_argument("--change-rate", type=float, default=0.02, help="fraction of prices moved between runs")
+    parser.add_argument("--runs", type=int, default=2, help="one cold run, then warm runs")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added per catalog response")
+    parser.add_argument("--etags", action="store_true", help="catalog sends ETags and answers 304")
+    parser.add_argument("--digest", action="store_true", help="pack alerts into digest messages")
+    parser.add_argument("--telegram-rate", type=float, default=1000.0,
+                        help="sender messages/s; Telegram's real limits would dominate the timings")
+    parser.add_argument("--drain-timeout", type=float, default=300.0)
+    parser.add_argument("--json", default="bench_end_to_end.json", help="write results to this file")
+    parser.add_argument("--compare", help="earlier --json output to compare against")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    for size in args.sizes:
+        rows.extend(bench_size(size, args, ctx))
+    if args.compare:
+        compare(rows, args.compare)
+    with open(args.json, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "args": vars(args),
+            "results": rows,
+        }, f, indent=2)
+    print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
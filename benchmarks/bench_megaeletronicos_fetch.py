@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.scraper import megaeletronicos_scraper as mega
+from benchmarks.catalog_server import CatalogServer
+
+THREAD_WORKERS = 5
+
+
+def thread_pool_engine(cat_urls):
+    # The previous engine: THREAD_WORKERS threads, sequential pages,
+    # module-level cureq.get per page.
+    all_products = []
+    with ThreadPoolExecutor(max_workers=THREAD_WORKERS) as exe:
+        futures = [exe.submit(mega.get_products_from_category, url) for url in cat_urls]
+        for fut in as_completed(futures):
+            all_products.extend(fut.result())
+    return all_products
+
+
+def async_engine(cat_urls, max_connections):
+    return asyncio.run(mega.scrape_categories(cat_urls, max_connections=max_connections))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare megaeletronicos fetch engines on a local server.")
+    parser.add_argument("--categories", type=int, default=8)
+    parser.add_argument("--products", type=int, default=600, help="products per category")
+    parser.add_argument("--page-size", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added per response")
+    parser.add_argument("--connections", type=int, default=mega.MAX_CONNECTIONS)
+    parser.add_argument("--server-cap", type=int, help="server answers 429 beyond this many requests in flight")
+    args = parser.parse_args()
+
+    engines = [
+        ("thread pool", thread_pool_engine),
+        ("async pooled", lambda urls: async_engine(urls, args.connections)),
+    ]
+    for label, engine in engines:
+        with CatalogServer(categories=args.categories, products_per_category=args.products,
+                           page_size=args.page_size, latency=args.latency,
+                           max_concurrent=args.server_cap) as server:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                products = engine(server.category_urls())
+            elapsed = time.perf_counter() - start
+            print(f"{label:14s} {server.requests:>5d} pages  {len(products):>7d} products  "
+                  f"{elapsed:6.2f}s  {server.requests / elapsed:8.1f} pages/s  {server.throttled} throttled")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+
+from src.scraper import mobilezone_api
+from benchmarks.catalog_server import CatalogServer
+
+
+def expected_products(server):
+    return {
+        p["code"]: p
+        for c in range(server.categories)
+        for p in (server.product(c, i) for i in range(server.products_per_category))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the mobilezone JSON-API engine against a local stub.")
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--products", type=int, default=1000, help="products per category")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--fixtures", help="serve recorded JSON from this directory instead")
+    args = parser.parse_args()
+
+    with CatalogServer(categories=args.categories, products_per_category=args.products,
+                       latency=args.latency, fixtures_dir=args.fixtures) as server:
+        os.environ["MOBILEZONE_API_URL"] = server.url + "api/"
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            products = asyncio.run(mobilezone_api.main())
+        elapsed = time.perf_counter() - start
+
+    print(f"api engine  {server.requests:>5d} requests  {len(products):>7d} products  "
+          f"{elapsed:6.2f}s  {len(products) / elapsed:10.0f} products/s")
+    keys = {"code", "name", "price", "stock_status", "url", "category"}
+    assert all(set(p) == keys for p in products), "schema mismatch"
+    if not args.fixtures:
+        expected = expected_products(server)
+        assert len(products) == len(expected), (len(products), len(expected))
+        for p in products:
+            e = expected[p["code"]]
+            assert p["name"] == e["name"] and p["price"] == e["price"], (p, e)
+            assert p["stock_status"] == ("In Stock" if e["in_stock"] else "Out of Stock"), (p, e)
+        print("all products match the served catalog")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from src.core.bot import Alerter, process_scraped_data
+from src.scraper import megaeletronicos_scraper as mega
+from src.scraper.page_cache import PageCache
+from src.storage.db_manager import DBManager
+from benchmarks.catalog_server import CatalogServer
+
+
+def run_once(db, server):
+    # One full megaeletronicos pass: fetch through the page cache, stage the
+    # cache rows and commit them together with the diff.
+    cache = PageCache(db, mega.SITE_NAME)
+    start = time.perf_counter()
+    requests, sent = server.requests, server.bytes_sent
+    with contextlib.redirect_stdout(io.StringIO()):
+        items = asyncio.run(mega.scrape_categories(server.category_urls(), cache=cache))
+        fetched = time.perf_counter() - start
+        cache.flush()
+        process_scraped_data(db, mega.SITE_NAME, items, Alerter(None, None))
+    elapsed = time.perf_counter() - start
+    return {
+        "pages": server.requests - requests,
+        "bytes": server.bytes_sent - sent,
+        "fetch_s": fetched,
+        "total_s": elapsed,
+        "summary": cache.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold vs. warm megaeletronicos runs through the page cache.")
+    parser.add_argument("--categories", type=int, default=8)
+    parser.add_argument("--products", type=int, default=600, help="products per category")
+    parser.add_argument("--page-size", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added per response")
+    parser.add_argument("--etags", action="store_true", help="server sends ETags and answers 304")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            CatalogServer(categories=args.categories, products_per_category=args.products,
+                          page_size=args.page_size, latency=args.latency, etags=args.etags) as server:
+        db = DBManager(os.path.join(tmp, "bench.db"))
+        db.initialize_database()
+        for n in range(args.runs):
+            r = run_once(db, server)
+            label = "cold" if n == 0 else f"warm {n}"
+            print(f"{label:7s} {r['pages']:>5d} pages  {r['bytes'] / 1024:9.1f} KiB  "
+                  f"fetch {r['fetch_s']:6.2f}s  total {r['total_s']:6.2f}s  {r['summary']}")
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from src.storage.db_manager import DBManager
+from src.storage.price_stats import DAY, ERROR_RATIO, MIN_POINTS, REF_POINTS, compute_stats, refresh_price_stats
+
+SITE = "benchsite"
+
+
+def build(db, products, points, error_rate, now, seed=0):
+    # A random walk of `points` observations per product over the last 90
+    # days; for error_rate of the products the latest one is 10x off.
+    rnd = random.Random(seed)
+    rows, history, errors = [], [], set()
+    for i in range(products):
+        code = str(100000 + i)
+        price = rnd.uniform(20, 2000)
+        ts = now - 90 * DAY
+        for j in range(points):
+            ts += rnd.uniform(0.2, 2 * 90 / points) * DAY
+            price = round(price * math.exp(rnd.gauss(0, 0.05)), 2)
+            history.append((SITE, code, int(min(ts, now)) - points + j, price, "in stock"))
+        if rnd.random() < error_rate:
+            errors.add(code)
+            last = history[-1]
+            history[-1] = last[:3] + (round(last[3] * rnd.choice((10, 0.1)), 2),) + last[4:]
+        rows.append((code, f"Product {i}", f"https://example.com/p/{i}", history[-1][3], "in stock", "cat"))
+    db.bulk_upsert_products(SITE, rows)
+    with db.transaction() as cur:
+        cur.executemany("INSERT OR REPLACE INTO price_history (site_name, product_code, ts, price_usd, stock_status)"
+                        " VALUES (?, ?, ?, ?, ?)", history)
+    return errors
+
+
+def loop_stats(series, now):
+    # The per-product Python version, for comparison.
+    out = []
+    for ts, prices in series:
+        median_all = statistics.median(prices)
+        clean = [p for p in prices if 1 / ERROR_RATIO < p / median_all < ERROR_RATIO]
+        prior = [p for p in prices[-REF_POINTS - 1:-1] if 1 / ERROR_RATIO < p / median_all < ERROR_RATIO]
+        flag = None
+        if len(prior) >= MIN_POINTS:
+            ref = statistics.median(prior)
+            off = prices[-1] / ref
+            if off >= ERROR_RATIO or off <= 1 / ERROR_RATIO:
+                flag = "scrape_error"
+        changes = [math.log(b / a) for a, b in zip(clean, clean[1:])]
+        out.append((min(clean), max(clean), statistics.median(clean[-REF_POINTS:]),
+                    statistics.pstdev(changes) if len(changes) >= 2 else None, flag))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized price stats vs. a per-product loop.")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--points", type=int, default=30, help="observations per product")
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    now = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        with DBManager(os.path.join(tmp, "bench.db")) as db:
+            db.initialize_database()
+            start = time.perf_counter()
+            errors = build(db, args.products, args.points, args.error_rate, now)
+            print(f"built {args.products} products x {args.points} observations in {time.perf_counter() - start:.1f}s")
+
+            start = time.perf_counter()
+            totals = refresh_price_stats(db, now=now)
+            refresh_s = time.perf_counter() - start
+            flagged = {r["product_code"] for r in db.get_price_stats(flag="scrape_error")}
+            print(f"refresh    {totals['products']:>8d} products, {totals['observations']} observations "
+                  f"in {refresh_s:.2f}s ({totals['observations'] / refresh_s:,.0f} obs/s)")
+            print(f"scrape errors: {len(flagged & errors)}/{len(errors)} injected found, "
+                  f"{len(flagged - errors)} false positives, {totals['outlier']} outliers")
+
+            keys = [(SITE, str(100000 + i)) for i in range(args.products)]
+            data = np.array(db.get_history_series(keys), dtype=float)
+            start = time.perf_counter()
+            compute_stats(data[:, 0].astype(np.int64), data[:, 1], data[:, 2], now=now)
+            vector_s = time.perf_counter() - start
+
+            series = {}
+            for i, ts, price in data.tolist():
+                series.setdefault(i, ([], []))
+                series[i][0].append(ts)
+                series[i][1].append(price)
+            start = time.perf_counter()
+            loop_stats(list(series.values()), now)
+            loop_s = time.perf_counter() - start
+            print(f"compute    vectorized {vector_s * 1000:8.1f}ms   per-product loop {loop_s * 1000:8.1f}ms "
+                  f"({loop_s / vector_s:.0f}x)")
+
+            # A typical run afterwards: a few percent of products change.
+            changed = random.Random(1).sample(range(args.products), max(1, args.products // 50))
+            db.bulk_upsert_products(SITE, [(str(100000 + i), f"Product {i}", "u", 1.0 + i, "in stock", "cat")
+                                           for i in changed])
+            start = time.perf_counter()
+            totals = refresh_price_stats(db)
+            print(f"incremental {totals['products']:>7d} products in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
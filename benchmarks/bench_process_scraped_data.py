@@ -0,0 +1,101 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+from src.core.bot import Alerter, process_scraped_data, parse_price, in_stock, out_stock
+from src.storage.db_manager import DBManager
+
+SITE = "benchsite"
+
+
+def make_items(n, seed=0, change_rate=0.0):
+    rnd = random.Random(seed)
+    items = []
+    for i in range(n):
+        price = 100.0 + (i % 500)
+        stock = "In Stock" if i % 10 else "Out of Stock"
+        if change_rate and rnd.random() < change_rate:
+            if rnd.random() < 0.5:
+                price = round(price * rnd.uniform(0.8, 1.2), 2)
+            else:
+                stock = "Out of Stock" if stock == "In Stock" else "In Stock"
+        items.append({
+            "code": str(100000 + i),
+            "name": f"Product {i}",
+            "price": price,
+            "stock_status": stock,
+            "url": f"https://example.com/p/{i}",
+        })
+    return items
+
+
+def process_scraped_data_rowwise(db, site, items, alerter):
+    # The original per-item path: one SELECT and one upsert+COMMIT per product.
+    for p in items:
+        code = p.get("code")
+        if not code:
+            continue
+        row = db.get_product(site, code)
+        stored = dict(row) if row else None
+        price = parse_price(p.get("price"))
+        stock = p.get("stock_status")
+        name = p.get("name", "Unknown")
+        url = p.get("url", "#")
+        old_stock_str = str(stored["last_stock_status"]).lower() if stored else ""
+        new_stock_str = str(stock).lower() if stock is not None else ""
+        if stored:
+            if out_stock(old_stock_str) and in_stock(new_stock_str):
+                alerter.queue_back_in_stock(site, name, price or 0.0, url)
+            elif in_stock(old_stock_str) and out_stock(new_stock_str):
+                alerter.queue_out_of_stock(site, name, price or 0.0, url)
+            elif price is not None and in_stock(new_stock_str) and in_stock(old_stock_str):
+                old_price = stored.get("last_price_usd")
+                if old_price is not None and price < old_price:
+                    alerter.queue_price_drop(site, name, old_price, price, url)
+                elif old_price is not None and price > old_price:
+                    alerter.queue_price_increase(site, name, old_price, price, url)
+        fallback = stored.get("last_price_usd", 0.0) if stored else 0.0
+        db.add_or_update_product(
+            site_name=site, product_code=code, name=name, url=url,
+            price_usd=price if price is not None else fallback,
+            stock_status=new_stock_str,
+        )
+
+
+def run_once(fn, n, change_rate, tmpdir):
+    db_file = os.path.join(tmpdir, f"{fn.__name__}_{n}.db")
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    with DBManager(db_file=db_file) as db:
+        db.initialize_database()
+        process_scraped_data(db, SITE, make_items(n), Alerter(None, None))
+
+        items = make_items(n, seed=1, change_rate=change_rate)
+        alerter = Alerter(None, None)
+        start = time.perf_counter()
+        fn(db, SITE, items, alerter)
+        elapsed = time.perf_counter() - start
+    return elapsed, len(alerter.t_msgs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the diff-and-upsert stage.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--change-rate", type=float, default=0.05)
+    parser.add_argument("--skip-rowwise", action="store_true")
+    args = parser.parse_args()
+
+    logging.getLogger("core.bot").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in args.sizes:
+            fns = [process_scraped_data] if args.skip_rowwise else [process_scraped_data_rowwise, process_scraped_data]
+            for fn in fns:
+                elapsed, alerts = run_once(fn, n, args.change_rate, tmpdir)
+                print(f"{fn.__name__:32s} n={n:>7d}  {elapsed:8.2f}s  {n / elapsed:>10.0f} items/s  alerts={alerts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.storage.db_manager import DBManager
+
+SITES = ("megaeletronicos", "mobilezone")
+BRANDS = ("Apple", "Samsung", "Xiaomi", "Motorola", "Sony", "LG", "JBL", "Lenovo", "Asus", "HP", "Canon", "Nikon")
+KINDS = ("Celular", "Televisor", "Parlante", "Notebook", "Auricular", "Reloj", "Tablet", "Monitor", "Cámara",
+         "Consola", "Impresora", "Proyector")
+EXTRAS = ("Pro", "Max", "Ultra", "Lite", "Plus", "Mini", "128GB", "256GB", "512GB", "Negro", "Blanco", "Azul",
+          "Edición Especial", "Inalámbrico", "Bluetooth")
+
+
+def make_names(n, seed=0):
+    rnd = random.Random(seed)
+    for i in range(n):
+        model = f"{rnd.choice('ABCDEFGHJKLMNPRSTXZ')}{rnd.randint(1, 999)}"
+        yield " ".join([rnd.choice(KINDS), rnd.choice(BRANDS), model, *rnd.sample(EXTRAS, 2)])
+
+
+def build(db, n, batch=20_000):
+    start = time.perf_counter()
+    rnd = random.Random(1)
+    pending = {site: [] for site in SITES}
+    for i, name in enumerate(make_names(n)):
+        site = SITES[i % len(SITES)]
+        stock = "in stock" if rnd.random() < 0.85 else "out of stock"
+        rows = pending[site]
+        rows.append((str(i), name, f"https://example.com/p/{i}", round(rnd.uniform(10, 3000), 2), stock, None))
+        if len(rows) == batch:
+            db.bulk_upsert_products(site, rows)
+            rows.clear()
+    for site, rows in pending.items():
+        db.bulk_upsert_products(site, rows)
+    return time.perf_counter() - start
+
+
+def timed(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FTS5 product search vs. a LIKE scan.")
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # The vocabulary is small, so plain words match thousands of rows each
+    # and show the cost of ranking many matches; model numbers are the
+    # selective case real catalogs mostly look like.
+    queries = ["canon e993", "samsung m630 256", "notebook lenovo x1", "camara canon", "consola sony",
+               "auricular bluetooth inal", "televisor lg negro", "edicion especial", "mo"]
+    with tempfile.TemporaryDirectory() as tmp:
+        with DBManager(os.path.join(tmp, "bench.db")) as db:
+            db.initialize_database()
+            elapsed = build(db, args.products)
+            print(f"built {args.products} products (with FTS triggers) in {elapsed:.1f}s")
+            for q in queries:
+                fts_s, found = timed(lambda: db.search_products(q, limit=20), args.repeat)
+                stock_s, _ = timed(lambda: db.search_products(q, site=SITES[0], in_stock=True, limit=20),
+                                   args.repeat)
+                like = "%" + "%".join(q.split()) + "%"
+                like_s, _ = timed(lambda: db._execute(
+                    "SELECT product_code FROM products WHERE name LIKE ? LIMIT 20;", (like,), fetch='all'), 1)
+                print(f"{q!r:28s} fts {fts_s * 1000:7.2f}ms  site+stock {stock_s * 1000:7.2f}ms  "
+                      f"LIKE first 20 {like_s * 1000:8.1f}ms  top: {found[0]['name'] if found else '-'}")
+            row = db.search_products("camara canon", limit=1)[0]
+            same_s, same = timed(lambda: db.find_same_model(row["site_name"], row["product_code"]), args.repeat)
+            print(f"find_same_model {same_s * 1000:.2f}ms for {row['name']!r}: "
+                  + "; ".join(f"{r['site_name']} {r['name']}" for r in same[:3]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from src.storage.db_manager import DAY, OBSERVATION_BUCKET, DBManager
+from src.storage.retention import compact
+
+SITE = "benchsite"
+
+
+def build(db, products, days, now, seed=0):
+    # One observation per product per hour for the last `days` days.
+    rnd = random.Random(seed)
+    prices = [rnd.uniform(20, 2000) for _ in range(products)]
+    start = int(now) - days * DAY
+    start -= start % OBSERVATION_BUCKET
+    for hour in range(days * 24):
+        ts = start + hour * OBSERVATION_BUCKET
+        rows = []
+        for i in range(products):
+            if rnd.random() < 0.02:
+                prices[i] = round(prices[i] * rnd.uniform(0.9, 1.1), 2)
+            rows.append((f"{100000 + i}", prices[i], "in stock" if rnd.random() < 0.9 else "out of stock"))
+        db.append_observations(SITE, rows, ts=ts)
+    return products * days * 24
+
+
+def writer(db, stop, waits):
+    # Stands in for a scrape: a batch of 200 observations every 50ms,
+    # timing how long each one takes to get through.
+    rnd = random.Random(2)
+    while not stop.is_set():
+        rows = [(f"w{rnd.randrange(10000)}", 10.0, "in stock") for _ in range(200)]
+        started = time.perf_counter()
+        db.append_observations("writer", rows)
+        waits.append(time.perf_counter() - started)
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Observation compaction throughput and space reclaimed.")
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--retain-days", type=float, default=7)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1000, 5000, 20000])
+    args = parser.parse_args()
+
+    now = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.db")
+        with DBManager(source) as db:
+            db.initialize_database()
+            start = time.perf_counter()
+            rows = build(db, args.products, args.days, now)
+        print(f"built {rows} observations in {time.perf_counter() - start:.1f}s, "
+              f"file {os.path.getsize(source) / 2**20:.1f} MiB")
+
+        for batch in args.batch:
+            path = os.path.join(tmp, f"bench{batch}.db")
+            shutil.copy(source, path)
+            with DBManager(path) as db:
+                stop, waits = threading.Event(), []
+                thread = threading.Thread(target=writer, args=(db, stop, waits))
+                thread.start()
+                report = compact(db, retain_days=args.retain_days, batch=batch, now=now)
+                stop.set()
+                thread.join()
+
+            waits.sort()
+            print(f"batch {batch:>6d}: {report['compacted']} rows -> {report['rollups']} rollups in "
+                  f"{report['compact_seconds']:.1f}s ({report['rows_per_second']:,.0f} rows/s), "
+                  f"longest batch {report['longest_batch_seconds'] * 1000:.0f}ms, "
+                  f"vacuum {report['vacuum_seconds']:.2f}s")
+            print(f"              DB {report['bytes_before'] / 2**20:.1f} -> {report['bytes_after'] / 2**20:.1f} MiB "
+                  f"(file {os.path.getsize(path) / 2**20:.1f} MiB); concurrent writes p50 "
+                  f"{waits[len(waits) // 2] * 1000:.1f}ms max {waits[-1] * 1000:.1f}ms over {len(waits)}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
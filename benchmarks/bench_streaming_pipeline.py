@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.catalog_server import CatalogServer
+
+SITE = "megaeletronicos"
+MODES = ("list", "stream")
+
+
+def measure(mode, db_file, cat_urls, queue, trace=False):
+    # Runs in a fresh process so ru_maxrss covers this mode only. RSS is
+    # dominated by libxml2 and curl buffers; with trace the Python heap peak,
+    # where the product lists live, is measured instead (timings then
+    # include tracemalloc overhead).
+    from src.core import bot
+    from src.scraper import megaeletronicos_scraper as mega
+    from src.storage.db_manager import DBManager
+
+    logging.getLogger("core.bot").setLevel(logging.WARNING)
+
+    class TimedAlerter(bot.Alerter):
+        # Records when the first alert is queued.
+        first_at = None
+
+        def __getattribute__(self, name):
+            if name.startswith("queue_") and object.__getattribute__(self, "first_at") is None:
+                self.first_at = time.perf_counter()
+            return object.__getattribute__(self, name)
+
+    alerter = TimedAlerter(None, None)
+    if trace:
+        tracemalloc.start()
+    with DBManager(db_file) as db, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        if mode == "list":
+            items = asyncio.run(mega.main(db=db, categories=cat_urls))
+            bot.process_scraped_data(db, SITE, items, alerter)
+        else:
+            asyncio.run(bot.run_all_scrapers_async(db, alerter, categories={SITE: cat_urls}))
+        elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 if trace else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    first = alerter.first_at - start if alerter.first_at else float("nan")
+    queue.put((elapsed, first, peak, len(alerter.t_msgs)))
+
+
+def seed(db_file, cat_urls, change_pct):
+    # Stores the whole catalog once, then moves change_pct% of the stored
+    # prices so the measured runs have price alerts to send.
+    from src.core import bot
+    from src.scraper import megaeletronicos_scraper as mega
+    from src.storage.db_manager import DBManager
+
+    with DBManager(db_file) as db, contextlib.redirect_stdout(io.StringIO()):
+        db.initialize_database()
+        items = asyncio.run(mega.main(categories=cat_urls))
+        bot.process_scraped_data(db, SITE, items, bot.Alerter(None, None))
+        db._execute("UPDATE products SET last_price_usd = last_price_usd + 1"
+                    " WHERE abs(random()) % 100 < ?;", (change_pct,))
+        db._execute("DELETE FROM http_cache;")
+    return len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whole-list vs. streaming scrape-to-diff on a local server.")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--products", type=int, default=1000, help="products per category")
+    parser.add_argument("--page-size", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds added per response")
+    parser.add_argument("--change-pct", type=int, default=5, help="percent of products with a new price")
+    parser.add_argument("--py-heap", action="store_true", help="also measure the Python heap peak")
+    args = parser.parse_args()
+    logging.getLogger("core.bot").setLevel(logging.WARNING)
+
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp, \
+            CatalogServer(categories=args.categories, products_per_category=args.products,
+                          page_size=args.page_size, latency=args.latency) as server:
+        seeded = os.path.join(tmp, "seed.db")
+        count = seed(seeded, server.category_urls(), args.change_pct)
+        print(f"{count} products in {args.categories} categories, {args.change_pct}% changed")
+        for mode in MODES:
+            line = ""
+            for trace in (False, True) if args.py_heap else (False,):
+                db_file = os.path.join(tmp, f"{mode}-{trace}.db")
+                shutil.copy(seeded, db_file)
+                queue = ctx.Queue()
+                proc = ctx.Process(target=measure, args=(mode, db_file, server.category_urls(), queue, trace))
+                proc.start()
+                elapsed, first, peak, alerts = queue.get()
+                proc.join()
+                if trace:
+                    line += f"  py-heap peak {peak / 1024:6.1f} MiB"
+                else:
+                    line = (f"{mode:7s} {elapsed:7.2f}s total  first alert {first:7.2f}s  "
+                            f"{alerts:>6d} alerts  peak RSS {peak / 1024:6.1f} MiB")
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
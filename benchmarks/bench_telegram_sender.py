@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import time
+
+from src.alerter.telegram_alerter import TelegramSender, pack_digest
+from benchmarks.fake_telegram_server import FakeTelegramServer
+
+TOKEN = "123:fake"
+
+
+def make_alerts(n):
+    return [
+        f"📉Price Drop Alert!\n\nProduct: Product {i}\nSite: benchsite\n"
+        f"Old Price: $110.00\nNew Price: $99.00\nURL: https://example.com/p/{i}"
+        for i in range(n)
+    ]
+
+
+def per_message_loop(server, chat_id, alerts):
+    # The old flush(): asyncio.run and a fresh client for every message.
+    async def _one(m):
+        async with TelegramSender(TOKEN, api_url=server.url, chat_rate=1e9, group_rate=1e9,
+                                  global_rate=1e9) as sender:
+            return await sender.send_message(chat_id, m)
+    return sum(asyncio.run(_one(m)) for m in alerts)
+
+
+async def persistent_sender(server, messages_by_chat, digest, rate):
+    async with TelegramSender(TOKEN, api_url=server.url, chat_rate=rate, group_rate=rate,
+                              global_rate=max(rate, 30)) as sender:
+        sent = await sender.send_all(messages_by_chat, digest=digest)
+        return sent, sender.throttled
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Telegram delivery against a fake Bot API.")
+    parser.add_argument("--alerts", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=5)
+    args = parser.parse_args()
+    alerts = make_alerts(args.alerts)
+
+    with FakeTelegramServer() as server:
+        start = time.perf_counter()
+        sent = per_message_loop(server, "-1", alerts)
+        elapsed = time.perf_counter() - start
+        print(f"per-message asyncio.run     {sent:>5d} sent  {elapsed:6.2f}s  {sent / elapsed:8.1f} msg/s")
+
+    with FakeTelegramServer() as server:
+        by_chat = {f"-{c + 1}": alerts[c::args.chats] for c in range(args.chats)}
+        start = time.perf_counter()
+        sent, _ = asyncio.run(persistent_sender(server, by_chat, digest=False, rate=1e9))
+        elapsed = time.perf_counter() - start
+        print(f"persistent sender, {args.chats} chats {sent:>5d} sent  {elapsed:6.2f}s  {sent / elapsed:8.1f} msg/s")
+
+    with FakeTelegramServer() as server:
+        start = time.perf_counter()
+        sent, _ = asyncio.run(persistent_sender(server, {"-1": alerts}, digest=True, rate=1e9))
+        elapsed = time.perf_counter() - start
+        print(f"digest mode                 {sent:>5d} sent  {elapsed:6.2f}s  "
+              f"({len(alerts)} alerts in {len(pack_digest(alerts))} messages)")
+
+    # Backoff: the server allows one message per 0.2s per chat and answers
+    # 429 retry_after=1 beyond that; the sender is configured too fast on purpose.
+    with FakeTelegramServer(min_interval=0.2, retry_after=1) as server:
+        start = time.perf_counter()
+        sent, throttled = asyncio.run(persistent_sender(server, {"-1": alerts[:20]}, digest=False, rate=50))
+        elapsed = time.perf_counter() - start
+        print(f"429 backoff                 {sent:>5d} sent  {elapsed:6.2f}s  throttled={throttled}"
+              f"  delivered={len(server.messages)}")
+
+
+if __name__ == "__main__":
+    main()
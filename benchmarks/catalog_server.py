@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+class BacklogHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connection bursts from a scraper
+    # opening dozens of connections at once; the dropped SYNs are retried
+    # after a second and show up as fake fetch latency.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+MEGA_CATEGORY_RE = re.compile(r"^/categoria/(?P<cat>\d+)$")
+MZ_SLUG_RE = re.compile(r"^cat-(?P<cat>\d+)$")
+
+
+class CatalogServer:
+    # Serves synthetic megaeletronicos-shaped category pages and a
+    # mobilezone-shaped JSON API (/api/categories, /api/products) from memory.
+    # With fixtures_dir, recorded JSON is served instead: categories.json and
+    # products/<category>/<page>.json. latency is added to every response to
+    # stand in for the network. With etags, responses carry an ETag and a
+    # matching If-None-Match gets an empty 304. advance() moves the prices of
+    # a random fraction of the catalog, to simulate the time between runs.
+    # With max_concurrent, requests beyond that many in flight get a 429
+    # with Retry-After: 1, like a site rate-limiting a scraper.
+    def __init__(self, host="127.0.0.1", port=0, categories=5, products_per_category=500,
+                 page_size=24, latency=0.0, pagination_window=5, fixtures_dir=None, etags=False,
+                 max_concurrent=None):
+        self.fixtures_dir = fixtures_dir
+        self.etags = etags
+        self.not_modified = 0
+        self.categories = categories
+        self.products_per_category = products_per_category
+        self.page_size = page_size
+        self.latency = latency
+        self.pagination_window = pagination_window
+        self.changes = []
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.throttled = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._httpd = BacklogHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def category_urls(self):
+        return [f"{self.url}categoria/{c}" for c in range(self.categories)]
+
+    def page_count(self):
+        return max(1, -(-self.products_per_category // self.page_size))
+
+    def advance(self, change_rate):
+        # Each product independently gets a new price with probability
+        # change_rate; the draw is a hash of (code, generation), so every
+        # page of a generation renders the same catalog.
+        self.changes.append(change_rate)
+
+    def product(self, cat, idx):
+        code = cat * 1_000_000 + idx
+        price = 50 + (code * 7919 % 200000) / 100
+        for gen, rate in enumerate(self.changes, 1):
+            draw = int.from_bytes(hashlib.blake2b(f"{code}:{gen}".encode(), digest_size=4).digest(), "big")
+            if draw < rate * 2**32:
+                price += 1 + (code + gen) % 5
+        return {
+            "code": str(code),
+            "name": f"Produto {cat}-{idx} Smartphone {idx % 97} GB",
+            "price": round(price, 2),
+            "in_stock": code % 11 != 0,
+        }
+
+    def render_mega_page(self, cat, page):
+        pages = self.page_count()
+        start = (page - 1) * self.page_size
+        end = min(start + self.page_size, self.products_per_category)
+        cards = []
+        for idx in range(start, end):
+            p = self.product(cat, idx)
+            badge = ('<span class="badge badge-in-stock">En stock</span>' if p["in_stock"]
+                     else '<span class="badge bg-danger">Sin stock</span>')
+            cards.append(
+                f'<div class="col"><a href="/producto/{p["code"]}"><div class="producto">'
+                f'<img src="/img/{p["code"]}.jpg" alt="">'
+                f'<h4 class="titulo">{p["name"]}</h4>'
+                f'<p class="codigo">Código: {p["code"]}</p>'
+                f'<p class="principal-br">U$ {p["price"]:.2f}</p>'
+                f'<p class="secundario">G$ {int(p["price"] * 7300):,}</p>'
+                f'{badge}</div></a></div>'
+            )
+        lo = max(1, page - self.pagination_window)
+        hi = min(pages, page + self.pagination_window)
+        links = "".join(f'<a href="?page={n}">{n}</a>' for n in range(lo, hi + 1))
+        last = '<div class="last active-search"></div>' if page >= pages else '<div class="last"></div>'
+        pagination = f'<div class="paginaciones">{links}{last}</div>' if pages > 1 else ""
+        return (
+            "<!DOCTYPE html><html><head><title>Mega Eletronicos</title></head><body>"
+            "<header><nav class='menu'>" + "".join(f"<a href='/m/{i}'>Menu {i}</a>" for i in range(40)) +
+            "</nav></header>"
+            f"<main><div class='row productos'>{''.join(cards)}</div>{pagination}</main>"
+            "<footer>" + "<p>Lorem ipsum dolor sit amet.</p>" * 30 + "</footer></body></html>"
+        ).encode("utf-8")
+
+    def render_mz_categories(self):
+        return json.dumps({"data": [{"slug": f"cat-{c}", "nombre": f"Categoria {c}"}
+                                    for c in range(self.categories)]}).encode("utf-8")
+
+    def render_mz_products(self, cat, page, limit):
+        start = (page - 1) * limit
+        end = min(start + limit, self.products_per_category)
+        items = []
+        for idx in range(start, end):
+            p = self.product(cat, idx)
+            items.append({"id": idx, "codigo": p["code"], "nombre": p["name"],
+                          "precio": f"$ {p['price']:,.2f}", "stock": 5 if p["in_stock"] else 0,
+                          "imagen": f"/img/{p['code']}.jpg"})
+        return json.dumps({"data": items, "total": self.products_per_category,
+                           "page": page, "per_page": limit}).encode("utf-8")
+
+    def _fixture(self, *parts):
+        path = os.path.join(self.fixtures_dir, *parts)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return 200, "application/json", f.read()
+        return 404, "application/json", b'{"data": []}'
+
+    def _route(self, path, query):
+        arg = lambda k, default: (query.get(k) or [default])[0]
+        m = MEGA_CATEGORY_RE.match(path)
+        if m and int(m.group("cat")) < self.categories:
+            page = int(arg("page", "1"))
+            return 200, "text/html; charset=utf-8", self.render_mega_page(int(m.group("cat")), page)
+        if path == "/api/categories":
+            if self.fixtures_dir:
+                return self._fixture("categories.json")
+            return 200, "application/json", self.render_mz_categories()
+        if path == "/api/products":
+            category, page = arg("category", ""), int(arg("page", "1"))
+            if self.fixtures_dir:
+                return self._fixture("products", category, f"{page}.json")
+            m = MZ_SLUG_RE.match(category)
+            if m and int(m.group("cat")) < self.categories:
+                return 200, "application/json", self.render_mz_products(
+                    int(m.group("cat")), page, int(arg("limit", str(self.page_size))))
+            return 200, "application/json", b'{"data": [], "total": 0}'
+        return 404, "text/plain", b"not found"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with server._lock:
+                    server.in_flight += 1
+                    over = server.max_concurrent is not None and server.in_flight > server.max_concurrent
+                    server.throttled += over
+                try:
+                    if over:
+                        status, ctype, body = 429, "text/plain", b"Too Many Requests"
+                    else:
+                        parts = urlsplit(self.path)
+                        status, ctype, body = server._route(parts.path, parse_qs(parts.query))
+                    if server.latency:
+                        time.sleep(server.latency)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                etag = f'"{hashlib.sha1(body).hexdigest()}"' if server.etags and status == 200 else None
+                if etag and self.headers.get("If-None-Match") == etag:
+                    status, body = 304, b""
+                with server._lock:
+                    server.requests += 1
+                    server.bytes_sent += len(body)
+                    server.not_modified += status == 304
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
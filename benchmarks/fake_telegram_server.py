@@ -0,0 +1,130 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+from benchmarks.catalog_server import BacklogHTTPServer
+
+METHOD_RE = re.compile(r"^/bot(?P<token>[^/]+)/(?P<method>\w+)$")
+
+
+class FakeTelegramServer:
+    # A local stand-in for the Bot API. It records every sendMessage call and
+    # answers 429 with retry_after when a chat is sent to faster than
+    # min_interval, or for the first throttle_first requests. getUpdates
+    # long-polls the messages queued with push_update().
+    def __init__(self, host="127.0.0.1", port=0, min_interval=0.0, retry_after=1, throttle_first=0):
+        self.min_interval = min_interval
+        self.retry_after = retry_after
+        self.throttle_first = throttle_first
+        self.messages = []
+        self.requests = 0
+        self.throttled = 0
+        self.updates = []
+        self._last_by_chat = {}
+        self._lock = threading.Lock()
+        self._new_update = threading.Condition(self._lock)
+        self._httpd = BacklogHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def push_update(self, chat_id, text):
+        # Queues a user's message for getUpdates; returns its update_id.
+        with self._lock:
+            update_id = len(self.updates) + 1
+            self.updates.append({"update_id": update_id, "message": {
+                "message_id": update_id, "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private" if int(chat_id) > 0 else "group"},
+            }})
+            self._new_update.notify_all()
+            return update_id
+
+    def replies(self, chat_id):
+        with self._lock:
+            return [text for chat, text in self.messages if chat == str(chat_id)]
+
+    def _get_updates(self, payload):
+        offset = int(payload.get("offset") or 0)
+        deadline = time.monotonic() + float(payload.get("timeout") or 0)
+        while True:
+            pending = [u for u in self.updates if u["update_id"] >= offset]
+            left = deadline - time.monotonic()
+            if pending or left <= 0:
+                return 200, {"ok": True, "result": pending[:100]}
+            self._new_update.wait(left)
+
+    def _handle(self, method, payload):
+        with self._lock:
+            self.requests += 1
+            if method == "getUpdates":
+                return self._get_updates(payload)
+            if method != "sendMessage":
+                return 200, {"ok": True, "result": True}
+
+            chat = str(payload.get("chat_id"))
+            now = time.monotonic()
+            last = self._last_by_chat.get(chat)
+            if self.requests <= self.throttle_first or (
+                    last is not None and now - last < self.min_interval):
+                self.throttled += 1
+                return 429, {"ok": False, "error_code": 429,
+                             "description": "Too Many Requests",
+                             "parameters": {"retry_after": self.retry_after}}
+            self._last_by_chat[chat] = now
+            self.messages.append((chat, payload.get("text")))
+            return 200, {"ok": True, "result": {"message_id": len(self.messages),
+                                                "chat": {"id": payload.get("chat_id")},
+                                                "text": payload.get("text")}}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                m = METHOD_RE.match(self.path.split("?")[0])
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b"{}"
+                try:
+                    payload = json.loads(raw or b"{}")
+                except ValueError:
+                    payload = {}
+                if not m:
+                    status, body = 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+                else:
+                    status, body = server._handle(m.group("method"), payload)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,173 @@
+import argparse
+import bisect
+import json
+import math
+import random
+import statistics
+
+from src.scheduler.adaptive import AdaptiveScheduler, MIN_INTERVAL, MAX_INTERVAL, HOUR
+from src.storage.db_manager import DBManager
+
+SITE = "sim"
+
+
+def synthetic_events(categories, hours, seed, median_rate, sigma):
+    # Change events per category as a Poisson process. Rates are log-normal,
+    # so a few categories (phones) change far more often than the long tail.
+    rng = random.Random(seed)
+    events, rates = {}, {}
+    for i in range(categories):
+        name = f"cat-{i}"
+        rate = median_rate * math.exp(rng.gauss(0, sigma))
+        t, times = 0.0, []
+        while True:
+            t += rng.expovariate(rate) * HOUR
+            if t >= hours * HOUR:
+                break
+            times.append(t)
+        events[name], rates[name] = times, rate
+    return events, rates, hours * HOUR
+
+
+def replayed_events(db_file):
+    # Rebuilds change times from recorded fetch results: the changes seen at
+    # a fetch are spread evenly over the time since the previous fetch.
+    with DBManager(db_file) as db:
+        rows = db.get_category_observations()
+    if not rows:
+        raise SystemExit(f"No category_observations in {db_file}")
+    start = min(r["ts"] for r in rows)
+    events, last_ts = {}, {}
+    for r in rows:
+        name = f"{r['site_name']}:{r['category']}"
+        prev = last_ts.get(name)
+        last_ts[name] = r["ts"]
+        times = events.setdefault(name, [])
+        if prev is None or not r["changed"]:
+            continue
+        step = (r["ts"] - prev) / r["changed"]
+        times.extend(prev - start + step * (k + 0.5) for k in range(r["changed"]))
+    horizon = max(r["ts"] for r in rows) - start
+    rates = {name: len(times) / max(horizon / HOUR, 1e-9) for name, times in events.items()}
+    for times in events.values():
+        times.sort()
+    return events, rates, horizon
+
+
+def simulate(events, horizon, policy, tick=60.0):
+    # policy(now) returns the categories to fetch at now; every pending
+    # change in a fetched category is detected with latency now - t.
+    cursor = {name: 0 for name in events}
+    latencies = {name: [] for name in events}
+    fetches = empty = 0
+    now = 0.0
+    while now <= horizon:
+        for name in policy(now):
+            times = events[name]
+            end = bisect.bisect_right(times, now)
+            found = times[cursor[name]:end]
+            latencies[name].extend(now - t for t in found)
+            cursor[name] = end
+            policy.observe(name, len(found), now)
+            fetches += 1
+            empty += not found
+        now += tick
+    missed = sum(len(events[n]) - cursor[n] for n in events)
+    return latencies, fetches, empty, missed
+
+
+class FixedPolicy:
+    def __init__(self, names, interval=HOUR):
+        self.names, self.interval, self.next_at = list(names), interval, 0.0
+
+    def __call__(self, now):
+        if now < self.next_at:
+            return []
+        self.next_at += self.interval
+        return self.names
+
+    def observe(self, name, changed, now):
+        pass
+
+
+class AdaptivePolicy:
+    def __init__(self, names, budget, min_interval, max_interval):
+        self.scheduler = AdaptiveScheduler(min_interval=min_interval, max_interval=max_interval,
+                                           hourly_budget=budget)
+        self.scheduler.sync_categories(SITE, list(names), now=0.0)
+
+    def __call__(self, now):
+        self.due = self.scheduler.due(now).get(SITE, [])
+        return self.due
+
+    def observe(self, name, changed, now):
+        self.scheduler.observe(SITE, name, changed, 1, now=now)
+        if name == self.due[-1]:
+            self.scheduler.rebalance()
+
+
+def report(label, events, rates, horizon, result):
+    latencies, fetches, empty, missed = result
+    flat = sorted(x for xs in latencies.values() for x in xs)
+    hot = sorted(rates, key=rates.get, reverse=True)[:max(1, len(rates) // 10)]
+    hot_flat = [x for n in hot for x in latencies[n]]
+    pct = lambda xs, q: xs[min(len(xs) - 1, int(q * len(xs)))] / 60 if xs else float("nan")
+    row = {
+        "policy": label,
+        "fetches": fetches,
+        "fetches_per_hour": fetches / (horizon / HOUR),
+        "empty_fetch_ratio": empty / fetches if fetches else 0.0,
+        "changes_detected": len(flat),
+        "changes_pending_at_end": missed,
+        "mean_latency_min": statistics.fmean(flat) / 60 if flat else float("nan"),
+        "p50_latency_min": pct(flat, 0.5),
+        "p95_latency_min": pct(flat, 0.95),
+        "hot_mean_latency_min": statistics.fmean(hot_flat) / 60 if hot_flat else float("nan"),
+    }
+    print(f"{label:22s} {fetches:>7d} fetches ({row['fetches_per_hour']:6.1f}/h, "
+          f"{row['empty_fetch_ratio']:4.0%} empty)  latency mean {row['mean_latency_min']:6.1f} min  "
+          f"p50 {row['p50_latency_min']:6.1f}  p95 {row['p95_latency_min']:6.1f}  "
+          f"hot 10% {row['hot_mean_latency_min']:6.1f}")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed hourly vs. adaptive per-category scheduling.")
+    parser.add_argument("--db", help="replay category_observations from this database instead of "
+                                     "generating synthetic changes")
+    parser.add_argument("--categories", type=int, default=80)
+    parser.add_argument("--hours", type=float, default=24 * 7)
+    parser.add_argument("--median-rate", type=float, default=0.1, help="changes per hour")
+    parser.add_argument("--sigma", type=float, default=1.8, help="log-normal spread of rates")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--budgets", type=float, nargs="+", default=[1.0, 0.75, 0.5],
+                        help="adaptive budgets as fractions of the fixed hourly volume")
+    parser.add_argument("--min-interval", type=float, default=MIN_INTERVAL / 60, help="minutes")
+    parser.add_argument("--max-interval", type=float, default=MAX_INTERVAL / 60, help="minutes")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.db:
+        events, rates, horizon = replayed_events(args.db)
+    else:
+        events, rates, horizon = synthetic_events(args.categories, args.hours, args.seed,
+                                                  args.median_rate, args.sigma)
+    names = sorted(events)
+    print(f"{len(names)} categories, {sum(map(len, events.values()))} changes over "
+          f"{horizon / HOUR:.0f}h")
+
+    rows = [report("fixed hourly", events, rates, horizon,
+                   simulate(events, horizon, FixedPolicy(names)))]
+    for fraction in args.budgets:
+        policy = AdaptivePolicy(names, budget=len(names) * fraction,
+                                min_interval=args.min_interval * 60, max_interval=args.max_interval * 60)
+        rows.append(report(f"adaptive {fraction:.0%} budget", events, rates, horizon,
+                           simulate(events, horizon, policy)))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
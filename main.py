@@ -1,6 +1,12 @@
 
-from src.scheduler.task_scheduler import start_scheduler
+import asyncio
+
+from src.scheduler.task_scheduler import start_scheduler, run_async_scheduler, use_async_runtime
 
 if __name__ == '__main__':
     print("Starting the Price Tracking Bot...")
-    start_scheduler()
+    # SCHEDULER_RUNTIME=thread falls back to the schedule-library loop.
+    if use_async_runtime():
+        asyncio.run(run_async_scheduler())
+    else:
+        start_scheduler()
@@ -1,2 +1,6 @@
-from .telegram_alerter import send_telegram_message, send_telegram_message_sync
+from .telegram_alerter import send_telegram_message, send_telegram_message_sync, TelegramSender, pack_digest
+from .outbox_dispatcher import OutboxDispatcher
+from .rules import Rule, RuleIndex
+from .read_model import ProductIndex
+from .commands import CommandBot
 from .email_alerter import send_email_alert, email_sender
\ No newline at end of file
@@ -0,0 +1,238 @@
+import asyncio
+import html
+import logging
+import time
+from collections import OrderedDict
+
+from curl_cffi.requests import AsyncSession
+
+from .telegram_alerter import TELEGRAM_API_URL, truncate_message
+
+logger = logging.getLogger("alerter.commands")
+
+POLL_TIMEOUT = 30
+# Questions asked while the bot was down are answered only if this recent.
+MAX_UPDATE_AGE = 300
+CACHE_SIZE = 512
+RESULT_LIMIT = 10
+HISTORY_LIMIT = 10
+
+HELP = (
+    "/price &lt;code&gt; — current price of a product\n"
+    "/search &lt;words&gt; — products with all the words in their name\n"
+    "/cheapest &lt;words&gt; — cheapest in-stock matches\n"
+    "/history &lt;code&gt; [site] — recent price changes"
+)
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+def _format_product(p) -> str:
+    price = f"${p['price']:.2f}" if p["price"] is not None else "n/a"
+    return (f"<b>{html.escape(p['name'])}</b>\n{price} · {html.escape(p['stock'] or 'unknown')} · {p['site']}"
+            f" · <code>{html.escape(p['code'])}</code>\n{html.escape(p['url'] or '')}")
+
+
+def _format_list(title, products) -> str:
+    if not products:
+        return f"{title}: nothing found."
+    return f"{title}:\n\n" + "\n\n".join(_format_product(p) for p in products)
+
+
+class CommandBot:
+    # Answers /price, /search, /cheapest and /history by long-polling the Bot
+    # API's getUpdates. Answers come from the ProductIndex (history from its
+    # read connection) and are cached per index version, so a repeated
+    # question costs one dict lookup until the next refresh changes
+    # something. Replies go out through the shared TelegramSender and its
+    # rate limits. allowed_chats, if given, limits who gets answers.
+    def __init__(self,
+                 bot_token: str,
+                 index,
+                 sender,
+                 api_url: str = TELEGRAM_API_URL,
+                 poll_timeout: float = POLL_TIMEOUT,
+                 cache_size: int = CACHE_SIZE,
+                 allowed_chats=None):
+        self.bot_token = bot_token
+        self.index = index
+        self.sender = sender
+        self.api_url = (api_url or TELEGRAM_API_URL).rstrip("/")
+        self.poll_timeout = poll_timeout
+        self.cache = LRUCache(cache_size)
+        self.allowed_chats = {str(c) for c in allowed_chats} if allowed_chats else None
+        self.offset = None
+        self.answered = 0
+        self._session = None
+        self._stop = asyncio.Event()
+        self._task = None
+        self._replies = set()
+        self.handlers = {
+            "price": self.cmd_price,
+            "search": self.cmd_search,
+            "cheapest": self.cmd_cheapest,
+            "history": self.cmd_history,
+            "start": self.cmd_help,
+            "help": self.cmd_help,
+        }
+
+    # --- commands --------------------------------------------------------
+    async def cmd_price(self, args):
+        if not args:
+            return "Usage: /price &lt;code&gt;"
+        found = self.index.lookup(args[0])
+        if not found:
+            return _format_list(f"Products matching '{html.escape(' '.join(args))}'",
+                                self.index.search(" ".join(args), limit=RESULT_LIMIT))
+        return "\n\n".join(_format_product(p) for p in found)
+
+    async def cmd_search(self, args):
+        if not args:
+            return "Usage: /search &lt;words&gt;"
+        query = " ".join(args)
+        return _format_list(f"Products matching '{html.escape(query)}'",
+                            self.index.search(query, limit=RESULT_LIMIT))
+
+    async def cmd_cheapest(self, args):
+        if not args:
+            return "Usage: /cheapest &lt;words&gt;"
+        query = " ".join(args)
+        return _format_list(f"Cheapest in stock for '{html.escape(query)}'",
+                            self.index.search(query, limit=RESULT_LIMIT, in_stock=True))
+
+    async def cmd_history(self, args):
+        if not args:
+            return "Usage: /history &lt;code&gt; [site]"
+        found = self.index.lookup(args[0], site=args[1] if len(args) > 1 else None)
+        if not found:
+            return f"No product with code <code>{html.escape(args[0])}</code>."
+        p = found[0]
+        rows = await asyncio.to_thread(self.index.db.get_history, p["site"], p["code"])
+        lines = [f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(ts))}  "
+                 + (f"${price:.2f}" if price is not None else "n/a") + f"  {html.escape(stock or '')}"
+                 for ts, price, stock in rows[-HISTORY_LIMIT:]]
+        return f"<b>{html.escape(p['name'])}</b> ({p['site']})\n" + ("\n".join(lines) or "No history yet.")
+
+    async def cmd_help(self, args):
+        return HELP
+
+    async def answer(self, text: str):
+        # The reply for one message, or None if it is not a known command.
+        if not text or not text.startswith("/"):
+            return None
+        parts = text.split()
+        command = parts[0][1:].split("@", 1)[0].lower()
+        handler = self.handlers.get(command)
+        if handler is None:
+            return None
+        args = parts[1:]
+        key = (self.index.version, command, " ".join(a.lower() for a in args))
+        reply = self.cache.get(key)
+        if reply is None:
+            reply = truncate_message(await handler(args))
+            self.cache.put(key, reply)
+        return reply
+
+    # --- polling ---------------------------------------------------------
+    async def get_updates(self) -> list:
+        if self._session is None:
+            self._session = AsyncSession()
+        payload = {"timeout": int(self.poll_timeout), "allowed_updates": ["message"]}
+        if self.offset is not None:
+            payload["offset"] = self.offset
+        resp = await self._session.post(f"{self.api_url}/bot{self.bot_token}/getUpdates", json=payload,
+                                        timeout=self.poll_timeout + 10)
+        body = resp.json()
+        if not body.get("ok"):
+            raise RuntimeError(f"getUpdates failed: {body.get('description')}")
+        return body.get("result") or []
+
+    async def handle_update(self, update):
+        self.offset = max(self.offset or 0, update["update_id"] + 1)
+        msg = update.get("message") or {}
+        chat_id = (msg.get("chat") or {}).get("id")
+        if chat_id is None:
+            return
+        if self.allowed_chats is not None and str(chat_id) not in self.allowed_chats:
+            return
+        if msg.get("date") and time.time() - msg["date"] > MAX_UPDATE_AGE:
+            return
+        try:
+            reply = await self.answer(msg.get("text") or "")
+        except Exception:
+            logger.exception(f"Command failed: {msg.get('text')!r}")
+            reply = "Sorry, that query failed."
+        if reply is None:
+            return
+        self.answered += 1
+        # Sent in the background so a chat's rate limit does not hold up
+        # polling for everyone else.
+        task = asyncio.create_task(self.sender.send_message(chat_id, reply))
+        self._replies.add(task)
+        task.add_done_callback(self._replies.discard)
+
+    async def run(self):
+        logger.info("Command handler started")
+        delay = 1.0
+        while not self._stop.is_set():
+            try:
+                updates = await self.get_updates()
+                delay = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Polling for commands failed: {e}; retrying in {delay:.0f}s")
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, 60.0)
+                continue
+            for update in updates:
+                await self.handle_update(update)
+        logger.info("Command handler stopped")
+
+    def start(self):
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        # A long poll in flight is cancelled rather than waited out.
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._replies:
+            await asyncio.gather(*self._replies, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        logger.info(f"Commands: {self.answered} answered, cache {self.cache.hits} hits / {self.cache.misses} misses")
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from itertools import groupby
+
+from .telegram_alerter import TelegramSender, digest_groups, truncate_message, DIGEST_SEPARATOR
+
+logger = logging.getLogger("alerter.outbox")
+
+
+class OutboxDispatcher:
+    def __init__(self,
+                 db,
+                 sender: TelegramSender,
+                 digest: bool = False,
+                 batch_size: int = 200,
+                 max_attempts: int = 5,
+                 retry_delay: float = 60,
+                 poll_interval: float = 2.0):
+        self.db = db
+        self.sender = sender
+        self.digest = digest
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self._stop = asyncio.Event()
+        self._task = None
+
+    async def _deliver_chat(self, chat_id, rows):
+        # Rows for one chat go out in id order; a digest covers several rows and
+        # its outcome is applied to all of them. After a failure the rest of the
+        # chat's rows are retried later rather than sent out of order.
+        messages = [r["message"] for r in rows]
+        groups = digest_groups(messages) if self.digest else [[i] for i in range(len(rows))]
+        sent, failed, deferred = [], [], []
+        for group in groups:
+            ids = [rows[i]["id"] for i in group]
+            if failed:
+                deferred.extend(ids)
+                continue
+            text = DIGEST_SEPARATOR.join(truncate_message(messages[i]) for i in group)
+            if await self.sender.send_message(chat_id, text):
+                sent.extend(ids)
+            else:
+                failed.extend(ids)
+        # The DB calls wait on the connection lock, which a scrape's batch
+        # writes hold from a worker thread, so they stay off the event loop.
+        if sent:
+            await asyncio.to_thread(self.db.mark_outbox_sent, sent)
+        if failed:
+            dead = await asyncio.to_thread(self.db.mark_outbox_failed, failed, "send failed",
+                                           self.max_attempts, self.retry_delay)
+            if dead:
+                logger.error(f"Dead-lettered {dead} alerts for chat {chat_id}")
+        if deferred:
+            await asyncio.to_thread(self.db.release_outbox, deferred, self.retry_delay)
+        return len(sent)
+
+    async def drain_once(self) -> int:
+        rows = await asyncio.to_thread(self.db.claim_outbox, self.batch_size)
+        if not rows:
+            return 0
+        rows.sort(key=lambda r: (r["chat_id"], r["id"]))
+        results = await asyncio.gather(*(
+            self._deliver_chat(chat_id, list(chat_rows))
+            for chat_id, chat_rows in groupby(rows, key=lambda r: r["chat_id"])
+        ))
+        logger.info(f"Delivered {sum(results)}/{len(rows)} queued alerts")
+        return len(rows)
+
+    async def drain(self) -> int:
+        total = 0
+        while True:
+            n = await self.drain_once()
+            if not n:
+                return total
+            total += n
+
+    async def run(self):
+        logger.info("Outbox dispatcher started")
+        while not self._stop.is_set():
+            try:
+                await self.drain()
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        logger.info("Outbox dispatcher stopped")
+
+    def start(self):
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self, drain_timeout: float = 60):
+        # Gives pending alerts up to drain_timeout to go out; whatever is left
+        # stays in the outbox for the next run.
+        self._stop.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        try:
+            await asyncio.wait_for(self.drain(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Outbox drain timed out; remaining alerts stay queued")
+        stats = await asyncio.to_thread(self.db.outbox_stats)
+        logger.info(
+            f"Outbox: {stats['pending']} pending, {stats['dead']} dead, "
+            f"avg latency {stats['avg_latency']:.1f}s (max {stats['max_latency']:.1f}s)"
+        )
+        return stats
@@ -0,0 +1,102 @@
+import asyncio
+
+from .rules import tokenize
+
+
+def _price_key(p):
+    return (p["price"] is None, p["price"] or 0.0, p["name"])
+
+
+class ProductIndex:
+    # An in-memory copy of the tracked products for answering chat queries:
+    # products by (site, code), by code alone and by name token. It reads
+    # through its own DBManager, so queries never wait on the scrape path's
+    # connection. refresh() only reads products whose changed_at is past
+    # the newest one already loaded, and version goes up whenever
+    # something changed, so callers can key caches on it.
+    def __init__(self, db):
+        self.db = db
+        self.products = {}
+        self.by_code = {}
+        self.by_token = {}
+        self.watermark = None
+        self.version = 0
+
+    def __len__(self):
+        return len(self.products)
+
+    def refresh(self) -> int:
+        return self.apply(self.db.get_products_changed_since(self.watermark))
+
+    async def refresh_async(self) -> int:
+        # Reads off the loop; applies on it, so queries never see a half
+        # applied refresh.
+        rows = await asyncio.to_thread(self.db.get_products_changed_since, self.watermark)
+        return self.apply(rows)
+
+    def apply(self, rows) -> int:
+        changed = 0
+        for r in rows:
+            key = (r["site_name"], r["product_code"])
+            old = self.products.pop(key, None)
+            if old is not None:
+                self._unindex(key, old)
+            if r["changed_at"] is not None and (self.watermark is None or r["changed_at"] > self.watermark):
+                self.watermark = r["changed_at"]
+            changed += 1
+            if not r["is_tracked"]:
+                continue
+            p = {
+                "site": r["site_name"],
+                "code": r["product_code"],
+                "name": r["name"],
+                "url": r["url"],
+                "price": r["last_price_usd"],
+                "stock": r["last_stock_status"] or "",
+                "category": r["category"],
+                "tokens": tokenize(r["name"]),
+            }
+            self.products[key] = p
+            self.by_code.setdefault(p["code"], set()).add(key)
+            for token in p["tokens"]:
+                self.by_token.setdefault(token, set()).add(key)
+        if self.watermark is None:
+            # Nothing carried a changed_at yet; later refreshes read from now on.
+            self.watermark = 0.0
+        if changed:
+            self.version += 1
+        return changed
+
+    def _unindex(self, key, p):
+        keys = self.by_code.get(p["code"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_code[p["code"]]
+        for token in p["tokens"]:
+            keys = self.by_token.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_token[token]
+
+    def lookup(self, code, site=None) -> list:
+        keys = self.by_code.get(str(code), ())
+        return sorted((self.products[k] for k in keys if site is None or k[0] == site), key=_price_key)
+
+    def search(self, query, limit=10, in_stock=False) -> list:
+        # Products with every word of query in their name, cheapest first.
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        sets = sorted((self.by_token.get(t, set()) for t in tokens), key=len)
+        keys = set(sets[0])
+        for s in sets[1:]:
+            keys &= s
+            if not keys:
+                return []
+        found = (self.products[k] for k in keys)
+        if in_stock:
+            # The scrapers store "In Stock".
+            found = (p for p in found if "in stock" in p["stock"].lower() and p["price"] is not None)
+        return sorted(found, key=_price_key)[:limit]
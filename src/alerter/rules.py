@@ -0,0 +1,181 @@
+import argparse
+import bisect
+import math
+import re
+
+from src.storage.db_manager import fold_name
+
+# Events a rule can subscribe to; the Alerter passes one with every alert it
+# queues. Rules that do not say get DEFAULT_EVENTS.
+EVENTS = ("drop", "increase", "back_in_stock", "out_of_stock", "delisted")
+DEFAULT_EVENTS = ("drop", "back_in_stock")
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text) -> frozenset:
+    # Lower-cased words folded the way product search folds them, so
+    # "Cámara" matches "camara" and "Straße" matches "strasse".
+    return frozenset(_TOKEN.findall(fold_name(str(text or ""))))
+
+
+def parse_events(value) -> frozenset:
+    if not value:
+        return frozenset(DEFAULT_EVENTS)
+    if isinstance(value, str):
+        value = value.replace(",", " ").split()
+    events = frozenset(e.strip().lower() for e in value)
+    unknown = events - set(EVENTS)
+    if unknown:
+        raise ValueError(f"Unknown alert events: {', '.join(sorted(unknown))}")
+    return events
+
+
+def drop_pct(old_price, price) -> float:
+    if not old_price or price is None or price >= old_price:
+        return 0.0
+    return (old_price - price) / old_price * 100
+
+
+class Rule:
+    # One subscriber rule. Every condition that is set must hold: site and
+    # product code match exactly, every keyword is a word of the product
+    # name, the new price is at most max_price, and for a "drop" the price
+    # fell by at least min_drop_pct percent (other events ignore it).
+    __slots__ = ("id", "chat_id", "site", "code", "tokens", "max_price", "min_drop_pct", "events")
+
+    def __init__(self, id, chat_id, site=None, code=None, keywords=None, max_price=None,
+                 min_drop_pct=None, events=None):
+        self.id = id
+        self.chat_id = str(chat_id)
+        self.site = site or None
+        self.code = str(code) if code else None
+        self.tokens = tokenize(keywords) if keywords else frozenset()
+        self.max_price = max_price
+        self.min_drop_pct = min_drop_pct
+        self.events = parse_events(events)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row["id"], row["chat_id"], site=row["site_name"], code=row["product_code"],
+                   keywords=row["keywords"], max_price=row["max_price"],
+                   min_drop_pct=row["min_drop_pct"], events=row["events"])
+
+    def matches(self, event, site, code, name_tokens, price=None, old_price=None) -> bool:
+        if event not in self.events:
+            return False
+        if self.site is not None and self.site != site:
+            return False
+        if self.code is not None and self.code != code:
+            return False
+        if self.tokens and not self.tokens <= name_tokens:
+            return False
+        if self.max_price is not None and (price is None or price > self.max_price):
+            return False
+        if self.min_drop_pct and event == "drop" and drop_pct(old_price, price) < self.min_drop_pct:
+            return False
+        return True
+
+
+class RuleIndex:
+    # Matches an alert against many rules without scanning them all. Each
+    # rule is indexed once, on its most selective condition:
+    #   - watchlist rules (with a product code) by (site, code);
+    #   - keyword rules by (site, event, longest keyword), the keyword
+    #     least likely to appear in a product name;
+    #   - the remaining, broad rules by (site, event), kept sorted by
+    #     min_drop_pct so a drop of p% only visits rules with a threshold
+    #     at or below p.
+    # Candidates are then checked in full with Rule.matches. A rule without
+    # a site is indexed under site None and looked up for every site.
+    def __init__(self, rules=()):
+        self.by_code = {}
+        self.by_token = {}
+        broad = {}
+        self.size = 0
+        for rule in rules:
+            self.size += 1
+            if rule.code is not None:
+                self.by_code.setdefault((rule.site, rule.code), []).append(rule)
+            elif rule.tokens:
+                token = max(rule.tokens, key=lambda t: (len(t), t))
+                for event in rule.events:
+                    self.by_token.setdefault((rule.site, event, token), []).append(rule)
+            else:
+                for event in rule.events:
+                    broad.setdefault((rule.site, event), []).append(rule)
+        self.broad = {}
+        for key, bucket in broad.items():
+            bucket.sort(key=lambda r: r.min_drop_pct or 0.0)
+            self.broad[key] = ([r.min_drop_pct or 0.0 for r in bucket], bucket)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(Rule.from_row(r) for r in rows)
+
+    def __len__(self):
+        return self.size
+
+    def candidates(self, event, site, code, name_tokens, price=None, old_price=None):
+        for s in (site, None):
+            if code is not None:
+                yield from self.by_code.get((s, code), ())
+            entry = self.broad.get((s, event))
+            if entry is not None:
+                thresholds, bucket = entry
+                limit = drop_pct(old_price, price) if event == "drop" else math.inf
+                yield from bucket[:bisect.bisect_right(thresholds, limit)]
+            if self.by_token:
+                for token in name_tokens:
+                    yield from self.by_token.get((s, event, token), ())
+
+    def match(self, event, site, code, name, price=None, old_price=None) -> list:
+        # Chat ids with at least one matching rule, in the order first matched.
+        name_tokens = tokenize(name) if self.by_token else frozenset()
+        chats = {}
+        for rule in self.candidates(event, site, code, name_tokens, price, old_price):
+            if rule.chat_id not in chats and rule.matches(event, site, code, name_tokens, price, old_price):
+                chats[rule.chat_id] = rule.id
+        return list(chats)
+
+
+def main(argv=None):
+    # Manages rules from the command line against the bot's database.
+    from src.storage.db_manager import DBManager
+
+    parser = argparse.ArgumentParser(description="Manage subscriber alert rules.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="add a rule for a chat")
+    add.add_argument("chat_id")
+    add.add_argument("--site")
+    add.add_argument("--code", help="watch a single product")
+    add.add_argument("--keywords", help="words that must all appear in the product name")
+    add.add_argument("--max-price", type=float)
+    add.add_argument("--min-drop", type=float, help="minimum price drop in percent")
+    add.add_argument("--events", help=f"comma-separated, from {', '.join(EVENTS)}")
+    ls = sub.add_parser("list", help="list rules")
+    ls.add_argument("--chat")
+    rm = sub.add_parser("remove", help="remove a rule")
+    rm.add_argument("rule_id", type=int)
+    parser.add_argument("--db", default=None)
+    args = parser.parse_args(argv)
+
+    with (DBManager(args.db) if args.db else DBManager()) as db:
+        db.initialize_database()
+        if args.command == "add":
+            parse_events(args.events)
+            rule_id = db.add_alert_rule(args.chat_id, site=args.site, code=args.code, keywords=args.keywords,
+                                        max_price=args.max_price, min_drop_pct=args.min_drop,
+                                        events=args.events)
+            print(f"Added rule {rule_id}")
+        elif args.command == "list":
+            for r in db.get_alert_rules(chat_id=args.chat):
+                print(f"{r['id']:>6}  chat={r['chat_id']} site={r['site_name'] or '*'} code={r['product_code'] or '*'}"
+                      f" keywords={r['keywords'] or '-'} max_price={r['max_price']} min_drop={r['min_drop_pct']}"
+                      f" events={r['events'] or ','.join(DEFAULT_EVENTS)}")
+        else:
+            print(f"Removed {db.remove_alert_rule(args.rule_id)} rule(s)")
+
+
+if __name__ == "__main__":
+    main()
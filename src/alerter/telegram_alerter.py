@@ -1,5 +1,184 @@
 import telegram
 import asyncio
+import logging
+import random
+import time
+
+from curl_cffi.requests import AsyncSession
+
+logger = logging.getLogger("alerter.telegram")
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+MAX_MESSAGE_LENGTH = 4096
+DIGEST_SEPARATOR = "\n\n➖➖➖\n\n"
+
+# Telegram's documented ceilings: ~30 messages/s per bot overall, ~1 message/s
+# to a single chat and 20 messages/minute to a single group.
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+GROUP_RATE = 20 / 60
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._tokens = 0.0
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def truncate_message(message: str, limit: int = MAX_MESSAGE_LENGTH) -> str:
+    return message if len(message) <= limit else message[:limit - 1] + "…"
+
+
+def digest_groups(messages, limit: int = MAX_MESSAGE_LENGTH, separator: str = DIGEST_SEPARATOR) -> list:
+    # Greedily packs consecutive messages; returns lists of message indexes.
+    groups = []
+    current, size = [], 0
+    for i, m in enumerate(messages):
+        length = min(len(m), limit)
+        if current and size + len(separator) + length <= limit:
+            current.append(i)
+            size += len(separator) + length
+        else:
+            if current:
+                groups.append(current)
+            current, size = [i], length
+    if current:
+        groups.append(current)
+    return groups
+
+
+def pack_digest(messages, limit: int = MAX_MESSAGE_LENGTH, separator: str = DIGEST_SEPARATOR) -> list:
+    messages = list(messages)
+    return [
+        separator.join(truncate_message(messages[i], limit) for i in group)
+        for group in digest_groups(messages, limit, separator)
+    ]
+
+
+class TelegramSender:
+    def __init__(self,
+                 bot_token: str,
+                 api_url: str = TELEGRAM_API_URL,
+                 global_rate: float = GLOBAL_RATE,
+                 chat_rate: float = CHAT_RATE,
+                 group_rate: float = GROUP_RATE,
+                 max_retries: int = 5,
+                 timeout: float = 30,
+                 max_clients: int = 10):
+        self.bot_token = bot_token
+        self.api_url = (api_url or TELEGRAM_API_URL).rstrip("/")
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_clients = max_clients
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._chats = {}
+        self._session = None
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self):
+        if self._session is None:
+            self._session = AsyncSession(max_clients=self.max_clients)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            # Group and channel ids are negative.
+            rate = self.group_rate if key.startswith("-") else self.chat_rate
+            bucket = self._chats[key] = TokenBucket(rate)
+        return bucket
+
+    async def send_message(self, chat_id, text: str, parse_mode: str = "HTML") -> bool:
+        await self.start()
+        url = f"{self.api_url}/bot{self.bot_token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": parse_mode}
+        chat_bucket = self._chat_bucket(chat_id)
+        delay = 1.0
+        for attempt in range(1, self.max_retries + 1):
+            await chat_bucket.acquire()
+            await self._global.acquire()
+            try:
+                resp = await self._session.post(url, json=payload, timeout=self.timeout)
+                body = resp.json()
+            except Exception as e:
+                logger.warning(f"Error sending Telegram message (attempt {attempt}/{self.max_retries}): {e}")
+            else:
+                if body.get("ok"):
+                    self.sent += 1
+                    return True
+                if resp.status_code == 429:
+                    retry_after = float((body.get("parameters") or {}).get("retry_after", delay))
+                    self.throttled += 1
+                    logger.warning(f"Telegram rate limit hit for chat {chat_id}, retrying after {retry_after:.0f}s")
+                    # The flood limit is per bot, so every chat waits it out.
+                    chat_bucket.pause(retry_after)
+                    self._global.pause(retry_after)
+                    continue
+                if resp.status_code < 500:
+                    logger.error(f"Telegram rejected message to {chat_id}: {body.get('description')}")
+                    break
+                logger.warning(f"Telegram server error {resp.status_code} (attempt {attempt}/{self.max_retries})")
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay + random.uniform(0, 0.1 * delay))
+                delay *= 2
+        self.failed += 1
+        return False
+
+    async def send_many(self, chat_id, messages, digest: bool = False) -> int:
+        if digest:
+            messages = pack_digest(messages)
+        sent = 0
+        for m in messages:
+            if await self.send_message(chat_id, m):
+                sent += 1
+        return sent
+
+    async def send_all(self, messages_by_chat: dict, digest: bool = False) -> int:
+        # Chats are rate limited independently, so deliver to them concurrently
+        # while keeping each chat's messages in order.
+        results = await asyncio.gather(*(
+            self.send_many(chat_id, messages, digest=digest)
+            for chat_id, messages in messages_by_chat.items()
+        ))
+        return sum(results)
 
 
 async def send_telegram_message(bot_token: str, chat_id: str, message: str):
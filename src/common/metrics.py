@@ -0,0 +1,281 @@
+import asyncio
+import bisect
+import contextvars
+import logging
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("metrics")
+
+# Upper bounds in seconds, Prometheus-style; +Inf is implicit.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current = contextvars.ContextVar("run_metrics", default=None)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation.
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def to_dict(self) -> dict:
+        return {"buckets": list(self.buckets), "counts": self.counts, "sum": self.sum, "count": self.count}
+
+
+class RunMetrics:
+    # Counters, latency histograms and stage timings for one scrape run,
+    # keyed by (name, site). Recorded from the loop and from to_thread
+    # workers, hence the lock. Instrumented code reaches the active run
+    # through the module-level helpers below, so nothing has to be threaded
+    # through call signatures and recording is a no-op outside a run.
+    def __init__(self, kind: str = "scrape"):
+        self.kind = kind
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.finished_at = None
+        self.status = "running"
+        self.counters = {}
+        self.histograms = {}
+        self.stages = []
+        self.discarded = False
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, site: str = None):
+        with self._lock:
+            key = (name, site)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, site: str = None):
+        with self._lock:
+            hist = self.histograms.get((name, site))
+            if hist is None:
+                hist = self.histograms[(name, site)] = Histogram()
+            hist.observe(value)
+
+    def add_stage(self, stage: str, started_at: float, duration: float, site: str = None,
+                  category: str = None, items: int = None, bytes: int = None):
+        with self._lock:
+            self.stages.append({"stage": stage, "site": site, "category": category,
+                                "started_at": started_at, "duration": duration,
+                                "items": items, "bytes": bytes})
+
+    @contextmanager
+    def stage(self, stage: str, site: str = None, category: str = None):
+        # Yields a dict the caller may fill with items/bytes.
+        extra = {}
+        started_at, started = time.time(), time.monotonic()
+        try:
+            yield extra
+        finally:
+            duration = time.monotonic() - started
+            self.add_stage(stage, started_at, duration, site=site, category=category,
+                           items=extra.get("items"), bytes=extra.get("bytes"))
+            self.observe(f"{stage}_seconds", duration, site=site)
+
+    def total(self, name: str) -> float:
+        return sum(v for (n, _), v in self.counters.items() if n == name)
+
+    def finish(self, status: str = "ok"):
+        self.finished_at = time.time()
+        self.status = status
+        self.counters[("peak_rss_mb", None)] = peak_rss_mb()
+
+    def to_row(self) -> dict:
+        # Shape of a `runs` row; see DBManager.record_run.
+        return {
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": (self.finished_at or time.time()) - self.started_at,
+            "status": self.status,
+            "items": int(self.total("items_parsed")),
+            "changed": int(self.total("items_changed")),
+            "alerts_queued": int(self.total("alerts_queued")),
+            "alerts_sent": int(self.total("alerts_sent")),
+            "bytes": int(self.total("bytes_downloaded")),
+            "requests": int(self.total("requests")),
+            "retries": int(self.total("retries")),
+            "peak_rss_mb": self.counters.get(("peak_rss_mb", None), 0.0),
+            "counters": {f"{n}{'|' + s if s else ''}": v for (n, s), v in self.counters.items()},
+            "histograms": {f"{n}{'|' + s if s else ''}": h.to_dict() for (n, s), h in self.histograms.items()},
+        }
+
+
+def current():
+    return _current.get()
+
+
+def begin_run(kind: str = "scrape"):
+    # Makes a new RunMetrics current for this task and the tasks and
+    # threads it starts. Returns (run, token); pass token to end_run.
+    run = RunMetrics(kind)
+    return run, _current.set(run)
+
+
+def end_run(token):
+    _current.reset(token)
+
+
+def inc(name: str, value: float = 1, site: str = None):
+    run = _current.get()
+    if run is not None:
+        run.inc(name, value, site=site)
+
+
+def observe(name: str, value: float, site: str = None):
+    run = _current.get()
+    if run is not None:
+        run.observe(name, value, site=site)
+
+
+def add_stage(stage: str, started_at: float, duration: float, site: str = None, category: str = None,
+              items: int = None, bytes: int = None):
+    run = _current.get()
+    if run is not None:
+        run.add_stage(stage, started_at, duration, site=site, category=category, items=items, bytes=bytes)
+        run.observe(f"{stage}_seconds", duration, site=site)
+
+
+@contextmanager
+def stage(name: str, site: str = None, category: str = None):
+    run = _current.get()
+    if run is None:
+        yield {}
+        return
+    with run.stage(name, site=site, category=category) as extra:
+        yield extra
+
+
+class MetricsRegistry:
+    # Process-wide totals over finished runs, rendered in the Prometheus
+    # text exposition format.
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.runs = {}
+        self._lock = threading.Lock()
+
+    def absorb(self, run: RunMetrics):
+        with self._lock:
+            key = (run.kind, run.status)
+            self.runs[key] = self.runs.get(key, 0) + 1
+            for (name, site), value in run.counters.items():
+                if name == "peak_rss_mb":
+                    continue
+                self.counters[(name, site)] = self.counters.get((name, site), 0) + value
+            for key, hist in run.histograms.items():
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(hist.buckets)
+                self.histograms[key].merge(hist)
+            self.gauges[("last_run_duration_seconds", run.kind)] = (run.finished_at or time.time()) - run.started_at
+            self.gauges[("last_run_timestamp_seconds", run.kind)] = run.finished_at or time.time()
+
+    def render(self) -> str:
+        def labels(**kw):
+            parts = [f'{k}="{v}"' for k, v in kw.items() if v is not None]
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines = []
+        with self._lock:
+            lines.append("# TYPE pricebot_runs_total counter")
+            for (kind, status), n in sorted(self.runs.items()):
+                lines.append(f"pricebot_runs_total{labels(kind=kind, status=status)} {n}")
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE pricebot_{name}_total counter")
+                for (n, site), value in sorted(self.counters.items(), key=lambda kv: str(kv[0])):
+                    if n == name:
+                        lines.append(f"pricebot_{name}_total{labels(site=site)} {value:g}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE pricebot_{name} histogram")
+                for (n, site), hist in sorted(self.histograms.items(), key=lambda kv: str(kv[0])):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                        cumulative += count
+                        lines.append(f"pricebot_{name}_bucket{labels(site=site, le=bound)} {cumulative}")
+                    lines.append(f"pricebot_{name}_sum{labels(site=site)} {hist.sum:g}")
+                    lines.append(f"pricebot_{name}_count{labels(site=site)} {hist.count}")
+            for name in sorted({n for n, _ in self.gauges}):
+                lines.append(f"# TYPE pricebot_{name} gauge")
+                for (n, kind), value in sorted(self.gauges.items()):
+                    if n == name:
+                        lines.append(f"pricebot_{name}{labels(kind=kind)} {value:g}")
+        lines.append("# TYPE pricebot_peak_rss_megabytes gauge")
+        lines.append(f"pricebot_peak_rss_megabytes {peak_rss_mb():g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    # Minimal HTTP endpoint on the running event loop: GET /metrics returns
+    # REGISTRY in Prometheus text format, anything else is a 404.
+    def __init__(self, host: str = "0.0.0.0", port: int = 9108, registry: MetricsRegistry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=10)
+            while (await asyncio.wait_for(reader.readline(), timeout=10)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
@@ -2,14 +2,22 @@ import asyncio
 import logging
 import re
 import time
+from contextlib import contextmanager
 from datetime import datetime
 import os
 
-from src.common import load_config
-from src.alerter import send_telegram_message_sync 
-from src.scraper.mobilezone_scraper import main as scrape_mobilezone_playwright
-from src.scraper.megaeletronicos_scraper import main as scrape_megaeletronicos
+from src.common import load_config, metrics
+from src.scheduler.adaptive import MAX_INTERVAL
+from src.alerter import TelegramSender, OutboxDispatcher, RuleIndex
+from src.scraper.mobilezone_scraper import (
+    main as scrape_mobilezone_playwright, create_pool, discover_categories as discover_mobilezone,
+)
+from src.scraper.megaeletronicos_scraper import (
+    main as scrape_megaeletronicos, discover_categories as discover_megaeletronicos,
+)
 from src.storage.db_manager import DBManager
+from src.storage.price_stats import assess_price_change, refresh_price_stats
+from src.storage.retention import compact, retention_settings
 
 
 logging.basicConfig(
@@ -19,19 +27,66 @@ logging.basicConfig(
 )
 logger = logging.getLogger("core.bot")
 
+# Page batches buffered between the scrapers and the differ. When it is full
+# the scrapers wait on put(), so a slow database throttles fetching instead
+# of growing memory.
+STREAM_QUEUE_SIZE = 64
+# Batches already waiting in the queue are merged, up to this many items, so
+# a backlog is stored in a few larger transactions rather than one per page.
+STREAM_MERGE_ITEMS = 2000
+# Categories checkpointed by an interrupted run are skipped by the next one
+# if they completed within this many seconds; older ones are scraped again.
+# A run that finishes, even with failed categories, clears every checkpoint.
+CHECKPOINT_MAX_AGE = 3600
+# Attempts for a category that failed on its own, after the site's first pass.
+CATEGORY_RETRIES = 2
+# A run that did not fetch a site's every category only delists products not
+# seen for this long. The adaptive scheduler visits every category at least
+# this often, so a product that moved has been found in its new one by then.
+DELIST_GRACE = MAX_INTERVAL
+
+# Runs reuse one event loop so the browser pool, which is bound to the loop
+# that launched it, stays warm between scheduler ticks. The scheduler never
+# runs two jobs at once, so the loop is only ever driven by one thread.
+_run_loop = None
+_browser_pool = None
+
+
+def get_run_loop():
+    global _run_loop
+    if _run_loop is None or _run_loop.is_closed():
+        _run_loop = asyncio.new_event_loop()
+    return _run_loop
+
+
+def get_browser_pool():
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = create_pool()
+    return _browser_pool
 
-async def scrape_with_retry(scraper_fn, max_retries=3, backoff=1.0):
+
+async def scrape_with_retry(scraper_fn, max_retries=3, backoff=1.0, remaining=None, **kwargs):
+    # remaining() returns the categories still to do before each retry, so
+    # a retry picks up where the failed attempt stopped; None retries the
+    # whole call as it was.
     delay = backoff
     for attempt in range(1, max_retries + 1):
+        if attempt > 1 and remaining is not None:
+            left = remaining()
+            if left is not None:
+                if not left:
+                    return []
+                kwargs["categories"] = left
         try:
-            result = scraper_fn()
+            result = scraper_fn(**kwargs)
             if asyncio.iscoroutine(result):
                 result = await result
             return result
         except Exception as e:
             if attempt == max_retries:
                 logger.error(f"{scraper_fn.__name__} failed after {attempt} attempts", exc_info=e)
-                return []
+                return None
             else:
                 logger.warning(
                     f"{scraper_fn.__name__} failed (attempt {attempt}/{max_retries}), retrying in {delay:.1f}s…"
@@ -41,22 +96,78 @@ async def scrape_with_retry(scraper_fn, max_retries=3, backoff=1.0):
 
 
 class Alerter:
-    def __init__(self, bot_token: str, chat_id: str):
+    # chat_id gets every alert. With subscriber rules loaded (load_rules),
+    # each alert is also routed to the chats whose rules match it, once per
+    # chat; those only go out through the outbox. Price changes that the
+    # product's price_stats mark as a likely scrape error are suppressed.
+    def __init__(self, bot_token: str, chat_id: str, digest: bool = False, api_url: str = None,
+                 delisted: bool = False):
         self.bot_token = bot_token
         self.chat_id = chat_id
+        self.digest = digest
+        self.api_url = api_url
+        self.delisted = delisted
+        self.rules = None
         self.t_msgs = []
+        self.routed = []
+        self.suppressed = 0
         self.e_msgs = []
 
-    def queue_price_drop(self, site, name, old, new, url):
+    @property
+    def use_outbox(self) -> bool:
+        return bool(self.bot_token and (self.chat_id or self.rules))
+
+    def load_rules(self, db: DBManager):
+        started = time.monotonic()
+        rows = db.get_alert_rules()
+        self.rules = RuleIndex.from_rows(rows) if rows else None
+        if rows:
+            logger.info(f"Loaded {len(rows)} alert rules in {time.monotonic() - started:.2f}s")
+
+    def take_pending(self) -> list:
+        msgs, self.t_msgs = self.t_msgs, []
+        return msgs
+
+    def enqueue(self, db: DBManager, ts: float = None, cursor=None) -> int:
+        # Moves the pending alerts into the outbox, for chat_id and for the
+        # subscribers they were routed to. Without an outbox they are left
+        # pending, for flush().
+        if not self.use_outbox:
+            return 0
+        msgs = self.take_pending()
+        routed, self.routed = self.routed, []
+        by_chat = {}
+        if self.chat_id:
+            by_chat[str(self.chat_id)] = msgs
+        for chat, txt in routed:
+            by_chat.setdefault(chat, []).append(txt)
+        return sum(db.enqueue_outbox(chat, chat_msgs, ts=ts, cursor=cursor) for chat, chat_msgs in by_chat.items())
+
+    def _queue(self, txt, event, site, code, name, price, old=None, broadcast=True):
+        # price is None when unknown, so max_price rules do not take it for $0.
+        if broadcast:
+            self.t_msgs.append(txt)
+        if self.rules is not None:
+            for chat in self.rules.match(event, site, code, name, price=price, old_price=old):
+                if chat != str(self.chat_id):
+                    self.routed.append((chat, txt))
+
+    def suppress(self, site, name, old, new, reason):
+        self.suppressed += 1
+        metrics.inc("alerts_suppressed", site=site)
+        logger.info(f"Suppressed {reason} alert for {name} on {site}: ${old:.2f} -> ${new:.2f}")
+
+    def queue_price_drop(self, site, name, old, new, url, code=None, notes=()):
         txt = (
             f"📉Price Drop Alert!\n\n"
             f"Product: {name}\n"
             f"Site: {site}\n"
             f"Old Price: ${old:.2f}\n"
             f"New Price: ${new:.2f}\n"
-            f"URL: {url}"
+            + "".join(f"{note}\n" for note in notes)
+            + f"URL: {url}"
         )
-        self.t_msgs.append(txt)
+        self._queue(txt, "drop", site, code, name, new, old)
         # self.e_msgs.append({
         #     "subject": f"Price Drop: {name}",
         #     "message": (
@@ -67,7 +178,7 @@ class Alerter:
         #         f'<a href="{url}">Buy now</a>'
         #     )
         # })
-    def queue_price_increase(self, site, name, old, new, url):
+    def queue_price_increase(self, site, name, old, new, url, code=None):
         txt = (
             f"📈Price Increase Alert!\n\n"
             f"Product: {name}\n"
@@ -76,7 +187,7 @@ class Alerter:
             f"New Price: ${new:.2f}\n"
             f"URL: {url}"
         )
-        self.t_msgs.append(txt)
+        self._queue(txt, "increase", site, code, name, new, old)
         # self.e_msgs.append({
         #     "subject": f"Price Increase: {name}",
         #     "message": (
@@ -88,15 +199,15 @@ class Alerter:
         #     )
         # })
 
-    def queue_back_in_stock(self, site, name, price, url):
+    def queue_back_in_stock(self, site, name, price, url, code=None):
         txt = (
             f"📦Back in Stock!\n\n"
             f"Product: {name}\n"
             f"Site: {site}\n"
-            f"Price: ${price:.2f}\n"
+            f"Price: ${price or 0.0:.2f}\n"
             f"URL: {url}"
         )
-        self.t_msgs.append(txt)
+        self._queue(txt, "back_in_stock", site, code, name, price)
         # self.e_msgs.append({
         #     "subject": f"Back in Stock: {name}",
         #     "message": (
@@ -106,15 +217,15 @@ class Alerter:
         #         f'<a href="{url}">Check it out</a>'
         #     )
         # })
-    def queue_out_of_stock(self, site, name, price, url):
+    def queue_out_of_stock(self, site, name, price, url, code=None):
         txt = (
             f"📦Out of Stock!\n\n"
             f"Product: {name}\n"
             f"Site: {site}\n"
-            f"Price: ${price:.2f}\n"
+            f"Price: ${price or 0.0:.2f}\n"
             f"URL: {url}"
         )
-        self.t_msgs.append(txt)
+        self._queue(txt, "out_of_stock", site, code, name, price)
         # self.e_msgs.append({
         #     "subject": f"Out of Stock: {name}",
         #     "message": (
@@ -125,61 +236,133 @@ class Alerter:
         #     )
         # })
 
-    def flush(self):
+    def queue_delisted(self, site, name, price, url, code=None):
+        txt = (
+            f"🚫Delisted!\n\n"
+            f"Product: {name}\n"
+            f"Site: {site}\n"
+            f"Last Price: ${price or 0.0:.2f}\n"
+            f"URL: {url}"
+        )
+        self._queue(txt, "delisted", site, code, name, price, broadcast=self.delisted)
+
+    async def flush_async(self, sender: TelegramSender = None):
         if self.bot_token and self.chat_id and self.t_msgs:
             logger.info(f"Sending {len(self.t_msgs)} Telegram alerts")
-            for m in self.t_msgs:
-                send_telegram_message_sync(self.bot_token, self.chat_id, m)
+            if sender is None:
+                async with TelegramSender(self.bot_token, api_url=self.api_url) as sender:
+                    sent = await sender.send_many(self.chat_id, self.t_msgs, digest=self.digest)
+            else:
+                sent = await sender.send_many(self.chat_id, self.t_msgs, digest=self.digest)
+            logger.info(f"Delivered {sent} Telegram messages for {len(self.t_msgs)} alerts")
+            self.t_msgs = []
+
+    def flush(self):
+        # For the synchronous entry points, on their shared run loop. Code
+        # already on an event loop (the asyncio runtime) awaits flush_async().
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            get_run_loop().run_until_complete(self.flush_async())
+        else:
+            raise RuntimeError("Alerter.flush() called from a running event loop; await flush_async() instead")
         # if self.e_msgs:
         #     logger.info(f"Sending {len(self.e_msgs)} email alerts")
         #     for e in self.e_msgs:
         #         email_sender(e["subject"], e["message"])
 
 
+def in_stock(s):
+    return "in stock" in s
+
+
+def out_stock(s):
+    return "out of stock" in s or "out stock" in s
+
+
+def parse_price(price):
+    if isinstance(price, (int, float)):
+        return price
+    try:
+        return float(re.sub(r"[^\d.]", "", str(price)))
+    except:
+        return None
+
+
 def process_scraped_data(db: DBManager, site: str, items: list, alerter: Alerter):
+    # Returns {category: [changed, total]} for the adaptive scheduler.
+    by_category = {}
     if not items:
         logger.info(f"No data from {site}")
-        return
+        return by_category
+
+    unchanged = [p for p in items if p.get("unchanged")]
+    unchanged_codes = [c for p in unchanged for c in p.get("codes") or ()]
+    if unchanged:
+        items = [p for p in items if not p.get("unchanged")]
+        skipped = sum(len(p.get("codes") or ()) for p in unchanged)
+        logger.info(f"Skipping {skipped} items on {len(unchanged)} unchanged pages from {site}")
+        for p in unchanged:
+            by_category.setdefault(p.get("category"), [0, 0])[1] += len(p.get("codes") or ())
 
     logger.info(f"Processing {len(items)} items from {site}")
+    stored_by_code = db.get_products_for_site(site)
+    rows, history = diff_items(site, items, stored_by_code, alerter, by_category)
+
+    now = time.time()
+    with metrics.stage("db_write", site) as stage, db.transaction() as cur:
+        db.bulk_upsert_products(site, rows, cursor=cur)
+        db.append_price_history(site, history, ts=now, cursor=cur)
+        db.append_observations(site, [(r[0], r[3], r[4]) for r in rows], ts=now, cursor=cur)
+        db.append_observations_from_products(site, unchanged_codes, ts=now, cursor=cur)
+        db.commit_page_cache(site, cursor=cur)
+        queued = alerter.enqueue(db, ts=now, cursor=cur)
+        stage["items"] = len(rows)
+    metrics.inc("items_changed", len(history), site=site)
+    metrics.inc("alerts_queued", queued, site=site)
+    logger.info(f"Stored {len(rows)} items from {site} ({len(history)} changed, {queued} alerts queued)")
+    return by_category
+
+
+def diff_items(site: str, items: list, stored_by_code: dict, alerter: Alerter, by_category: dict):
+    # Queues alerts for items that changed against stored_by_code and returns
+    # the product upsert rows and the price_history rows for them.
+    rows = []
+    history = []
     for p in items:
         code  = p.get("code")
         if not code:
             continue
 
-        stored = db.get_product(site, code)
-        price  = p.get("price")
+        counts = by_category.setdefault(p.get("category"), [0, 0])
+        counts[1] += 1
+        stored = stored_by_code.get(code)
+        price  = parse_price(p.get("price"))
         stock  = p.get("stock_status")
         name   = p.get("name", "Unknown")
         url    = p.get("url", "#")
 
-        if not isinstance(price, (int, float)):
-            try:
-                price = float(re.sub(r"[^\d.]", "", str(price)))
-            except:
-                price = None
-
-
         old_stock = stored.get("last_stock_status") if stored else None
         old_stock_str = str(old_stock).lower() if old_stock is not None else None
         new_stock_str = str(stock).lower() if stock is not None else ""
-        in_stock = lambda s: "in stock" in s
-        out_stock = lambda s: "out of stock" in s or "out stock" in s
 
         if stored:
             if out_stock(old_stock_str or "") and in_stock(new_stock_str):
-                alerter.queue_back_in_stock(site, name, price or 0.0, url)
+                alerter.queue_back_in_stock(site, name, price, url, code=code)
 
             elif in_stock(old_stock_str or "") and out_stock(new_stock_str):
-                alerter.queue_out_of_stock(site, name, price or 0.0, url)
+                alerter.queue_out_of_stock(site, name, price, url, code=code)
             else:
                 if price is not None and in_stock(new_stock_str) and in_stock(old_stock_str or ""):
                     old_price = stored.get("last_price_usd")
-                    if old_price is not None:
-                        if price < old_price:
-                            alerter.queue_price_drop(site, name, old_price, price, url)
-                        elif price > old_price:
-                            alerter.queue_price_increase(site, name, old_price, price, url)
+                    if old_price is not None and price != old_price:
+                        suppress, notes = assess_price_change(price, old_price, stored)
+                        if suppress:
+                            alerter.suppress(site, name, old_price, price, suppress)
+                        elif price < old_price:
+                            alerter.queue_price_drop(site, name, old_price, price, url, code=code, notes=notes)
+                        else:
+                            alerter.queue_price_increase(site, name, old_price, price, url, code=code)
         else:
             logger.info(f"New product: {name} (${price}) on {site}")
 
@@ -189,46 +372,513 @@ def process_scraped_data(db: DBManager, site: str, items: list, alerter: Alerter
             fallback_price = 0.0
 
         price_usd_val = price if price is not None else fallback_price
-        db.add_or_update_product(
-            site_name=site,
-            product_code=code,
-            name=name,
-            url=url,
-            price_usd=price_usd_val,
-            stock_status=new_stock_str,
-        )
+        rows.append((code, name, url, price_usd_val, new_stock_str, p.get("category")))
+        if (not stored
+                or stored.get("last_price_usd") != price_usd_val
+                or stored.get("last_stock_status") != new_stock_str):
+            history.append((code, price_usd_val, new_stock_str))
+            counts[0] += 1
+        # Later duplicates of the same code must diff against this row, as they
+        # did when every item was written back before the next one was read.
+        stored_by_code[code] = {
+            "last_price_usd": price_usd_val,
+            "last_stock_status": new_stock_str,
+        }
+    return rows, history
 
 
-async def run_all_scrapers_async(db: DBManager, alerter: Alerter):
+class StreamingDiff:
+    # Diffs and persists one site's page batches as they arrive. Stored state
+    # is read per batch and only the codes seen so far are kept, for dedup
+    # across pages and categories, so memory no longer grows with the size of
+    # the site's product list. Page-cache entries are promoted in finish(),
+    # once every batch of the run has been stored, and tracked products of
+    # the categories that were fully fetched but not seen are delisted then.
+    # {"failed": True, "category": c} items mark a category whose fetch
+    # failed part way; a None category means the whole site failed.
+    # {"done": True, "category": c, "pages": n} marks a category fully
+    # fetched: its checkpoint is written in the same transaction as the
+    # batch that ends it. resumed ({category: checkpoint}) are categories
+    # an interrupted run already stored; their counts are carried over and
+    # they are left out of delisting, since their codes were not seen here.
+    # partial marks a run over only some of the site's categories.
+    def __init__(self, db: DBManager, site: str, alerter: Alerter, started: float = None,
+                 resumed: dict = None, partial: bool = False):
+        self.db = db
+        self.site = site
+        self.alerter = alerter
+        self.started = started if started is not None else time.monotonic()
+        self.seen = set()
+        self.resumed = set(resumed or ())
+        self.partial = partial
+        self.by_category = {c: [cp["changed"] or 0, cp["items"] or 0] for c, cp in (resumed or {}).items()}
+        self.failed = set()
+        self.checkpoints = 0
+        self.delisted = 0
+        self.batches = 0
+        self.items = 0
+        self.duplicates = 0
+        self.changed = 0
+        self.alerts = 0
+        self.queued = 0
+        self.db_seconds = 0.0
+        self.first_alert_after = None
 
-    scrapers = {
-        "mobilezone":       scrape_mobilezone_playwright,
-        "megaeletronicos":  scrape_megaeletronicos,
+    def process_batch(self, batch: list):
+        self.batches += 1
+        items = []
+        done = []
+        unchanged = []
+        for p in batch:
+            if p.get("failed"):
+                self.failed.add(p.get("category"))
+                continue
+            if p.get("done"):
+                self.failed.discard(p["category"])
+                # Completed even if it turned out empty.
+                self.by_category.setdefault(p["category"], [0, 0])
+                done.append(p)
+                continue
+            if p.get("unchanged"):
+                codes = p.get("codes") or ()
+                self.seen.update(codes)
+                unchanged.extend(codes)
+                self.by_category.setdefault(p.get("category"), [0, 0])[1] += len(codes)
+                continue
+            code = p.get("code")
+            if not code or code in self.seen:
+                self.duplicates += bool(code)
+                continue
+            self.seen.add(code)
+            items.append(p)
+        if not items:
+            if done or unchanged:
+                with self.db.transaction() as cur:
+                    self.db.append_observations_from_products(self.site, unchanged, ts=time.time(), cursor=cur)
+                    self.db.store_checkpoints(self.site, self._checkpoint_rows(done), cursor=cur)
+                self.checkpoints += len(done)
+            return
+
+        stored_by_code = self.db.get_products_by_codes(self.site, [p["code"] for p in items])
+        pending_before = len(self.alerter.t_msgs)
+        rows, history = diff_items(self.site, items, stored_by_code, self.alerter, self.by_category)
+        new_alerts = len(self.alerter.t_msgs) - pending_before
+
+        now = time.time()
+        write_started = time.monotonic()
+        with self.db.transaction() as cur:
+            self.db.bulk_upsert_products(self.site, rows, cursor=cur)
+            self.db.append_price_history(self.site, history, ts=now, cursor=cur)
+            self.db.append_observations(self.site, [(r[0], r[3], r[4]) for r in rows], ts=now, cursor=cur)
+            self.db.append_observations_from_products(self.site, unchanged, ts=now, cursor=cur)
+            queued = self.alerter.enqueue(self.db, ts=now, cursor=cur)
+            self.db.store_checkpoints(self.site, self._checkpoint_rows(done), cursor=cur)
+        self.checkpoints += len(done)
+        elapsed = time.monotonic() - write_started
+        self.db_seconds += elapsed
+        metrics.observe("db_write_seconds", elapsed, site=self.site)
+        metrics.inc("items_changed", len(history), site=self.site)
+        metrics.inc("alerts_queued", queued, site=self.site)
+        self.queued += queued
+        self.items += len(rows)
+        self.changed += len(history)
+        self.alerts += new_alerts
+        if new_alerts and self.first_alert_after is None:
+            self.first_alert_after = time.monotonic() - self.started
+
+    def _checkpoint_rows(self, done):
+        rows = []
+        for p in done:
+            changed, total = self.by_category.get(p["category"], (0, 0))
+            rows.append((p["category"], p.get("pages"), total, changed))
+        return rows
+
+    def finish(self) -> dict:
+        self.db.commit_page_cache(self.site)
+        self.delist()
+        if self.batches:
+            # One stage row for the site's total write time; per-batch
+            # latencies are in the db_write_seconds histogram.
+            run = metrics.current()
+            if run is not None:
+                run.add_stage("db_write", time.time() - self.db_seconds, self.db_seconds,
+                              site=self.site, items=self.items)
+        if not self.batches:
+            logger.info(f"No data from {self.site}")
+        else:
+            logger.info(f"Stored {self.items} items from {self.site} in {self.batches} batches "
+                        f"({self.changed} changed, {self.alerts} alerts, {self.queued} queued, "
+                        f"{self.duplicates} duplicates skipped, {self.delisted} delisted, "
+                        f"{self.checkpoints} categories checkpointed)")
+        # Categories that failed are reported as None, whatever part of
+        # them was stored.
+        return {c: None if c in self.failed else counts for c, counts in self.by_category.items()}
+
+    def delist(self):
+        if None in self.failed:
+            logger.warning(f"Not delisting on {self.site}: the scrape failed")
+            return
+        categories = [c for c in self.by_category
+                      if c is not None and c not in self.failed and c not in self.resumed]
+        if self.failed:
+            logger.warning(f"Not delisting in {len(self.failed)} failed categories on {self.site}")
+        if not categories:
+            return
+        # A product missing here may have moved to a category this run did
+        # not fetch.
+        seen_before = time.time() - DELIST_GRACE if self.partial or self.failed else None
+        with self.db.transaction() as cur:
+            rows, skipped = self.db.delist_missing(self.site, self.seen, categories,
+                                                   seen_before=seen_before, cursor=cur)
+            if rows and (self.alerter.delisted or self.alerter.rules is not None):
+                for r in rows:
+                    self.alerter.queue_delisted(self.site, r["name"], r["last_price_usd"],
+                                                r["url"] or "#", code=r["product_code"])
+                self.queued += self.alerter.enqueue(self.db, ts=time.time(), cursor=cur)
+        for category in skipped:
+            logger.warning(f"Not delisting in {category} on {self.site}: too many products missing")
+        self.delisted = len(rows)
+        metrics.inc("items_delisted", len(rows), site=self.site)
+
+
+@contextmanager
+def recorded_run(db: DBManager, kind: str, sender: TelegramSender = None):
+    # Collects the metrics recorded inside the block into one RunMetrics and
+    # stores it as a `runs` row with its stages. A block nested in another
+    # run adds to the outer one. Alerts sent are counted as the change in
+    # sender.sent over the block, so with a long-lived dispatcher a run is
+    # credited with whatever went out while it ran. Setting run.discarded
+    # skips recording, for ticks that turned out to have nothing to do.
+    outer = metrics.current()
+    if outer is not None:
+        yield outer
+        return
+    run, token = metrics.begin_run(kind)
+    sent_before = sender.sent if sender is not None else 0
+    status = "error"
+    try:
+        yield run
+        status = "ok"
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    finally:
+        metrics.end_run(token)
+        if sender is not None:
+            run.inc("alerts_sent", sender.sent - sent_before)
+        run.finish(status)
+        if not run.discarded:
+            row = run.to_row()
+            try:
+                run_id = db.record_run(row, run.stages)
+            except Exception as e:
+                logger.error("Could not record run metrics", exc_info=e)
+                run_id = None
+            metrics.REGISTRY.absorb(run)
+            logger.info(f"Run {run_id} ({kind}, {status}) in {row['duration']:.1f}s: {row['items']} parsed, "
+                        f"{row['changed']} changed, {row['alerts_queued']} alerts queued, "
+                        f"{row['alerts_sent']} sent, {row['requests']} requests "
+                        f"({row['bytes'] / 2**20:.1f} MiB), {row['retries']} retries, "
+                        f"peak RSS {row['peak_rss_mb']:.0f} MiB")
+
+
+async def discover_all_categories(db: DBManager, sites=None, browser_pool=None, mobilezone_engine=None,
+                                  sessions=None):
+    sessions = sessions or {}
+    discoverers = {
+        "mobilezone":       (discover_mobilezone, {"pool": browser_pool, "engine": mobilezone_engine,
+                                                   "session": sessions.get("mobilezone")}),
+        "megaeletronicos":  (discover_megaeletronicos, {"db": db}),
     }
+    found = {}
+    for site, (fn, kwargs) in discoverers.items():
+        if sites is not None and site not in sites:
+            continue
+        try:
+            found[site] = await fn(**kwargs)
+        except Exception as e:
+            logger.error(f"Category discovery failed for {site}", exc_info=e)
+            found[site] = []
+    return found
+
+
+async def list_categories(db: DBManager, scrapers: dict, browser_pool=None, mobilezone_engine=None,
+                          sessions=None):
+    # Gives each site in scrapers (as built by run_all_scrapers_async, edited
+    # in place) that would scrape its whole catalog its category list up
+    # front, so checkpoints can be matched against it and a retry only asks
+    # for the categories that did not finish. A site whose discovery fails
+    # is left to discover on its own.
+    unlisted = [site for site, (_, kwargs) in scrapers.items() if kwargs.get("categories") is None]
+    if not unlisted:
+        return
+    found = await discover_all_categories(db, sites=unlisted, browser_pool=browser_pool,
+                                          mobilezone_engine=mobilezone_engine, sessions=sessions)
+    for site in unlisted:
+        if found.get(site):
+            fn, kwargs = scrapers[site]
+            scrapers[site] = (fn, dict(kwargs, categories=found[site]))
+
 
-    tasks = {
-        site: asyncio.create_task(scrape_with_retry(fn))
-        for site, fn in scrapers.items()
+def resume_from_checkpoints(db: DBManager, scrapers: dict) -> dict:
+    # Narrows scrapers (edited in place, with their categories listed) to
+    # the categories an interrupted run left undone, and returns the
+    # checkpoints being resumed from, {site: {category: checkpoint}}. Sites
+    # left with nothing are dropped.
+    checkpoints = db.get_checkpoints(max_age=CHECKPOINT_MAX_AGE)
+    if not checkpoints:
+        return {}
+    resumed = {}
+    for site in list(scrapers):
+        fn, kwargs = scrapers[site]
+        cats = kwargs.get("categories")
+        if site not in checkpoints or not cats:
+            continue
+        done = {c: cp for c, cp in checkpoints[site].items() if c in cats}
+        if not done:
+            continue
+        resumed[site] = done
+        left = [c for c in cats if c not in done]
+        logger.info(f"Resuming {site} from checkpoints: {len(done)} categories done, {len(left)} left")
+        metrics.inc("categories_resumed", len(done), site=site)
+        if left:
+            scrapers[site] = (fn, dict(kwargs, categories=left))
+        else:
+            del scrapers[site]
+    return resumed
+
+
+async def run_all_scrapers_async(db: DBManager, alerter: Alerter, browser_pool=None,
+                                  mobilezone_engine=None, categories=None, dispatcher=None,
+                                  sessions=None):
+    # categories ({site: [category, ...]}) limits the run to those sites and
+    # categories; None scrapes everything. A long-lived dispatcher and HTTP
+    # sessions ({site: session}) are reused as given; otherwise a dispatcher
+    # is started for this run only. Returns {site: {category: [changed,
+    # total]}}, with None for a category that failed. Categories
+    # checkpointed by an interrupted run are not scraped again; once this
+    # run finishes, every checkpoint is cleared.
+    sessions = sessions or {}
+    scrapers = {
+        "mobilezone":       (scrape_mobilezone_playwright, {"pool": browser_pool,
+                                                        "engine": mobilezone_engine,
+                                                        "session": sessions.get("mobilezone")}),
+        "megaeletronicos":  (scrape_megaeletronicos, {"db": db,
+                                                      "session": sessions.get("megaeletronicos")}),
     }
+    if categories is not None:
+        scrapers = {
+            site: (fn, dict(kwargs, categories=categories[site]))
+            for site, (fn, kwargs) in scrapers.items() if categories.get(site)
+        }
+
+    with recorded_run(db, "scrape", sender=dispatcher.sender if dispatcher is not None else None):
+        alerter.load_rules(db)
+        suppressed = alerter.suppressed
+        await list_categories(db, scrapers, browser_pool=browser_pool, mobilezone_engine=mobilezone_engine,
+                              sessions=sessions)
+        interrupted = db.begin_checkpointed_run()
+        resumed = resume_from_checkpoints(db, scrapers) if interrupted else {}
+        own_dispatcher = None
+        if alerter.use_outbox and dispatcher is None:
+            sender = TelegramSender(alerter.bot_token, api_url=alerter.api_url)
+            own_dispatcher = OutboxDispatcher(db, sender, digest=alerter.digest)
+            own_dispatcher.start()
 
+        # Scrapers stream page batches into a bounded queue; this coroutine
+        # diffs and stores them as they arrive, off the loop so fetching
+        # continues meanwhile. Each site puts None on the queue when it is done.
+        started = time.monotonic()
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
 
-    for site, task in tasks.items():
-        items = await task
-        process_scraped_data(db, site, items, alerter)
+        async def produce(site, fn, kwargs):
+            # Follows the done/failed markers going past, so a retry only
+            # asks for the categories that have not completed, and a
+            # category that failed alone is retried alone.
+            done, failed = set(), set()
+
+            async def sink(batch):
+                for p in batch:
+                    if p.get("done"):
+                        done.add(p["category"])
+                    elif p.get("failed"):
+                        failed.add(p.get("category"))
+                await queue.put((site, batch))
+
+            def undone():
+                # None (retry the whole site) only if discovery failed up front.
+                if kwargs.get("categories") is None:
+                    return None
+                return [c for c in kwargs["categories"] if c not in done]
+
+            try:
+                if await scrape_with_retry(fn, sink=sink, remaining=undone, **kwargs) is None:
+                    await queue.put((site, [{"failed": True, "category": None}]))
+                    return
+                for attempt in range(CATEGORY_RETRIES):
+                    retry = sorted(c for c in failed - done if c is not None)
+                    if not retry:
+                        break
+                    logger.warning(f"Retrying {len(retry)} failed categories on {site} "
+                                   f"(attempt {attempt + 1}/{CATEGORY_RETRIES})")
+                    metrics.inc("category_retries", len(retry), site=site)
+                    await asyncio.sleep(2 ** attempt)
+                    failed.clear()
+                    await scrape_with_retry(fn, max_retries=1, sink=sink, **dict(kwargs, categories=retry))
+            finally:
+                await queue.put((site, None))
+
+        tasks = [asyncio.create_task(produce(site, fn, kwargs)) for site, (fn, kwargs) in scrapers.items()]
+        diffs = {site: StreamingDiff(db, site, alerter, started=started, resumed=resumed.get(site),
+                                     partial=categories is not None)
+                 for site in scrapers}
+
+        results = {site: {c: [cp["changed"] or 0, cp["items"] or 0] for c, cp in cps.items()}
+                   for site, cps in resumed.items() if site not in scrapers}
+        try:
+            remaining = len(tasks)
+            while remaining:
+                pending = [await queue.get()]
+                size = len(pending[0][1] or ())
+                while size < STREAM_MERGE_ITEMS and not queue.empty():
+                    pending.append(queue.get_nowait())
+                    size += len(pending[-1][1] or ())
+                merged = {}
+                for site, batch in pending:
+                    if batch is not None:
+                        merged.setdefault(site, []).extend(batch)
+                        continue
+                    if site in merged:
+                        await asyncio.to_thread(diffs[site].process_batch, merged.pop(site))
+                    remaining -= 1
+                    results[site] = await asyncio.to_thread(diffs[site].finish)
+                for site, batch in merged.items():
+                    await asyncio.to_thread(diffs[site].process_batch, batch)
+            # Finished: failed categories are retried by the next run from
+            # scratch, not resumed, and the counts stored here are not
+            # replayed into it.
+            db.finish_checkpointed_run()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if own_dispatcher:
+                await own_dispatcher.stop()
+                await sender.close()
+                metrics.inc("alerts_sent", sender.sent)
+
+        # Stats for the products this run changed, which the next run's
+        # price alerts are judged against.
+        with metrics.stage("price_stats") as stage:
+            refreshed = await asyncio.to_thread(refresh_price_stats, db)
+            stage["items"] = refreshed["products"]
+        logger.info(f"Price stats: {refreshed['products']} products from {refreshed['observations']} observations, "
+                    f"{refreshed['scrape_error']} likely scrape errors, {refreshed['outlier']} outliers; "
+                    f"{alerter.suppressed - suppressed} alerts suppressed")
+
+        first = [d.first_alert_after for d in diffs.values() if d.first_alert_after is not None]
+        logger.info(f"Pipeline: {sum(d.batches for d in diffs.values())} batches in "
+                    f"{time.monotonic() - started:.1f}s, first alert after "
+                    + (f"{min(first):.1f}s" if first else "n/a")
+                    + f", peak RSS {metrics.peak_rss_mb():.0f} MiB")
+        return results
+
+def alerter_from_config(config):
+    bot_token = os.getenv("BOT_TOKEN") or config.get("TELEGRAM", "BOT_TOKEN", fallback=None)
+    chat_id   = os.getenv("CHAT_ID") or config.get("TELEGRAM", "CHAT_ID",   fallback=None)
+    api_url   = os.getenv("TELEGRAM_API_URL") or config.get("TELEGRAM", "API_URL", fallback=None)
+    digest    = (os.getenv("TELEGRAM_DIGEST") or config.get("TELEGRAM", "DIGEST", fallback="false")).lower() in ("1", "true", "yes")
+    delisted  = (os.getenv("TELEGRAM_DELISTED") or config.get("TELEGRAM", "DELISTED", fallback="false")).lower() in ("1", "true", "yes")
+    return Alerter(bot_token, chat_id, digest=digest, api_url=api_url, delisted=delisted)
 
 def run_all_scrapers():
     logger.info("=== Starting scraping run ===")
     config    = load_config()
-    bot_token = os.getenv("BOT_TOKEN") or config.get("TELEGRAM", "BOT_TOKEN", fallback=None)
-    chat_id   = os.getenv("CHAT_ID") or config.get("TELEGRAM", "CHAT_ID",   fallback=None)
-    alerter   = Alerter(bot_token, chat_id)
+    alerter   = alerter_from_config(config)
+    mz_engine = os.getenv("MOBILEZONE_ENGINE") or config.get("MOBILEZONE", "ENGINE", fallback=None)
 
     with DBManager() as db:
         db.initialize_database()
-        asyncio.run(run_all_scrapers_async(db, alerter))
+        get_run_loop().run_until_complete(
+            run_all_scrapers_async(db, alerter, browser_pool=get_browser_pool(),
+                                   mobilezone_engine=mz_engine)
+        )
 
     alerter.flush()
     logger.info("=== Scraping run complete ===")
 
+async def run_due_categories_async(db: DBManager, scheduler, alerter: Alerter, browser_pool=None,
+                                   mobilezone_engine=None, dispatcher=None, sessions=None):
+    # One adaptive-scheduler tick: refresh category lists that are due for
+    # rediscovery, scrape the categories whose interval has elapsed, and
+    # feed the per-category change counts back into the schedule.
+    if not scheduler.loaded:
+        scheduler.load(db)
+    with recorded_run(db, "adaptive", sender=dispatcher.sender if dispatcher is not None else None) as run:
+        stale = [site for site in ("mobilezone", "megaeletronicos") if scheduler.needs_discovery(site)]
+        if stale:
+            found = await discover_all_categories(db, sites=stale, browser_pool=browser_pool,
+                                                  mobilezone_engine=mobilezone_engine, sessions=sessions)
+            for site, cats in found.items():
+                scheduler.sync_categories(site, cats, db=db)
+
+        due = scheduler.due()
+        if not due:
+            run.discarded = not stale
+            return False
+        logger.info("=== Scraping due categories: "
+                    + ", ".join(f"{site} {len(cats)}" for site, cats in due.items()) + " ===")
+        results = {}
+        try:
+            results = await run_all_scrapers_async(db, alerter, browser_pool=browser_pool,
+                                                   mobilezone_engine=mobilezone_engine, categories=due,
+                                                   dispatcher=dispatcher, sessions=sessions)
+        finally:
+            scheduler.observe_run(due, results)
+            scheduler.save(db)
+            logger.info(scheduler.summary())
+        return True
+
+def run_due_categories(scheduler):
+    config    = load_config()
+    mz_engine = os.getenv("MOBILEZONE_ENGINE") or config.get("MOBILEZONE", "ENGINE", fallback=None)
+    alerter   = alerter_from_config(config)
+
+    with DBManager() as db:
+        db.initialize_database()
+        ran = get_run_loop().run_until_complete(
+            run_due_categories_async(db, scheduler, alerter, browser_pool=get_browser_pool(),
+                                     mobilezone_engine=mz_engine)
+        )
+
+    alerter.flush()
+    return ran
+
+def run_retention(db: DBManager, config) -> dict:
+    # Compacts observations past the retention window into daily rollups
+    # and reclaims the space; recorded as a "maintenance" run.
+    with recorded_run(db, "maintenance"):
+        with metrics.stage("compact") as stage:
+            report = compact(db, **retention_settings(config))
+            stage["items"] = report["compacted"]
+        metrics.inc("observations_compacted", report["compacted"])
+        metrics.inc("rollups_written", report["rollups"])
+        metrics.inc("bytes_reclaimed", max(0, report["bytes_before"] - report["bytes_after"]))
+    logger.info(f"Retention: compacted {report['compacted']} observations into {report['rollups']} daily rollups "
+                f"in {report['batches']} batches, {report['compact_seconds']:.1f}s "
+                f"({report['rows_per_second']:.0f} rows/s, longest batch {report['longest_batch_seconds'] * 1000:.0f}ms); "
+                f"DB {report['bytes_before'] / 2**20:.1f} -> {report['bytes_after'] / 2**20:.1f} MiB "
+                f"({report['pages_released']} pages released in {report['vacuum_seconds']:.1f}s)")
+    if not report["incremental"] and report["free_bytes"]:
+        logger.warning(f"{report['free_bytes'] / 2**20:.1f} MiB of free pages stay in the database file; run "
+                       f"`python -m src.storage.retention --enable-incremental-vacuum` once to return them")
+    return report
+
+def run_maintenance():
+    config = load_config()
+    with DBManager() as db:
+        db.initialize_database()
+        run_retention(db, config)
+        db.optimize()
+
 if __name__ == "__main__":
     run_all_scrapers()
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+
+from src.alerter import TelegramSender, OutboxDispatcher, CommandBot, ProductIndex
+from src.common import load_config
+from src.common.metrics import MetricsServer
+from src.core.bot import (
+    alerter_from_config, run_all_scrapers_async, run_due_categories_async, run_retention,
+)
+from src.scraper import megaeletronicos_scraper, mobilezone_api
+from src.scraper.mobilezone_scraper import create_pool
+from src.storage.db_manager import DBManager
+
+logger = logging.getLogger("core.runtime")
+
+
+class BotRuntime:
+    # Resources that live for the whole process under the asyncio scheduler
+    # and are shared by every run: one DB connection, the browser pool, one
+    # HTTP session per site, and the Telegram sender with an outbox
+    # dispatcher that keeps delivering between runs. With METRICS_PORT set
+    # it also serves the run metrics at /metrics, and with TELEGRAM_COMMANDS
+    # it answers chat queries from an in-memory product index, read through
+    # a second DB connection and refreshed after every run. Must be started
+    # and closed on the loop that uses it.
+    def __init__(self, config=None, db_file=None):
+        self.config = config if config is not None else load_config()
+        self.db_file = db_file
+        self.mobilezone_engine = (os.getenv("MOBILEZONE_ENGINE")
+                                  or self.config.get("MOBILEZONE", "ENGINE", fallback=None))
+        self.db = None
+        self.pool = None
+        self.sessions = {}
+        self.sender = None
+        self.dispatcher = None
+        self.metrics_port = int(os.getenv("METRICS_PORT")
+                                or self.config.get("METRICS", "PORT", fallback="0"))
+        self.metrics_host = (os.getenv("METRICS_HOST")
+                             or self.config.get("METRICS", "HOST", fallback="0.0.0.0"))
+        self.metrics_server = None
+        self.commands_enabled = (os.getenv("TELEGRAM_COMMANDS")
+                                 or self.config.get("TELEGRAM", "COMMANDS", fallback="false")
+                                 ).lower() in ("1", "true", "yes")
+        self.read_db = None
+        self.index = None
+        self.commands = None
+
+    async def start(self):
+        self.db = DBManager(self.db_file) if self.db_file else DBManager()
+        self.db.initialize_database()
+        self.pool = create_pool()
+        self.sessions = {
+            "megaeletronicos": megaeletronicos_scraper.create_session(),
+            "mobilezone": mobilezone_api.create_session(),
+        }
+        alerter = self.new_alerter()
+        # Subscriber rules alone are enough to need the outbox.
+        alerter.load_rules(self.db)
+        if alerter.use_outbox:
+            self.sender = TelegramSender(alerter.bot_token, api_url=alerter.api_url)
+            await self.sender.start()
+            self.dispatcher = OutboxDispatcher(self.db, self.sender, digest=alerter.digest)
+            self.dispatcher.start()
+        if self.metrics_port:
+            self.metrics_server = await MetricsServer(self.metrics_host, self.metrics_port).start()
+        if self.commands_enabled and alerter.bot_token:
+            await self.start_commands(alerter)
+        logger.info("Runtime started")
+        return self
+
+    def new_alerter(self):
+        return alerter_from_config(self.config)
+
+    async def start_commands(self, alerter):
+        self.read_db = DBManager(self.db_file) if self.db_file else DBManager()
+        self.index = ProductIndex(self.read_db)
+        loaded = await self.index.refresh_async()
+        if self.sender is None:
+            self.sender = TelegramSender(alerter.bot_token, api_url=alerter.api_url)
+            await self.sender.start()
+        self.commands = CommandBot(alerter.bot_token, self.index, self.sender, api_url=alerter.api_url)
+        self.commands.start()
+        logger.info(f"Answering commands from {loaded} products")
+
+    async def refresh_index(self):
+        if self.index is not None:
+            try:
+                changed = await self.index.refresh_async()
+            except Exception:
+                logger.exception("Product index refresh failed")
+                return
+            logger.info(f"Product index refreshed: {changed} changed, {len(self.index)} products")
+
+    async def run_all(self):
+        logger.info("=== Starting scraping run ===")
+        alerter = self.new_alerter()
+        await run_all_scrapers_async(self.db, alerter, browser_pool=self.pool,
+                                     mobilezone_engine=self.mobilezone_engine,
+                                     dispatcher=self.dispatcher, sessions=self.sessions)
+        await alerter.flush_async(self.sender)
+        await self.refresh_index()
+        logger.info("=== Scraping run complete ===")
+
+    async def run_due(self, scheduler):
+        alerter = self.new_alerter()
+        ran = await run_due_categories_async(self.db, scheduler, alerter, browser_pool=self.pool,
+                                             mobilezone_engine=self.mobilezone_engine,
+                                             dispatcher=self.dispatcher, sessions=self.sessions)
+        await alerter.flush_async(self.sender)
+        if ran:
+            await self.refresh_index()
+        return ran
+
+    async def maintenance(self):
+        # Compaction runs in bounded transactions on the shared connection,
+        # so a scrape running meanwhile only waits for one batch at a time.
+        await asyncio.to_thread(run_retention, self.db, self.config)
+        await asyncio.to_thread(self.db.optimize)
+        if self.pool is not None:
+            await self.pool.trim()
+        stats = await asyncio.to_thread(self.db.outbox_stats)
+        logger.info(f"Maintenance done; outbox pending={stats['pending']} dead={stats['dead']}")
+
+    async def close(self, drain_timeout=30):
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        if self.commands is not None:
+            await self.commands.stop()
+        if self.dispatcher is not None:
+            await self.dispatcher.stop(drain_timeout=drain_timeout)
+        if self.sender is not None:
+            await self.sender.close()
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions = {}
+        if self.pool is not None:
+            await self.pool.close()
+        if self.read_db is not None:
+            self.read_db.close_connection()
+        if self.db is not None:
+            self.db.close_connection()
+        logger.info("Runtime closed")
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
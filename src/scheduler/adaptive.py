@@ -0,0 +1,214 @@
+import heapq
+import math
+import time
+from collections import deque
+
+MIN_INTERVAL = 15 * 60
+MAX_INTERVAL = 6 * 3600
+# Half-life of the change-rate estimate; observations older than a few days
+# stop mattering.
+RATE_HALF_LIFE_HOURS = 72.0
+# Added to every category's rate so a category that has not changed lately
+# is still revisited between the bounds instead of pinned to MAX_INTERVAL.
+RATE_FLOOR = 0.01
+DISCOVERY_INTERVAL = 6 * 3600
+HOUR = 3600.0
+
+
+class AdaptiveScheduler:
+    # Schedules each (site, category) on its own interval from its observed
+    # change rate. Intervals are recomputed after every observation so that
+    # the fetches per hour across all categories fit hourly_budget (default:
+    # one per category, the volume of the old fixed hourly run), with each
+    # interval clamped to [min_interval, max_interval]. due() pops categories
+    # off a heap ordered by next due time and also enforces the budget over a
+    # sliding hour, so a burst of due categories is spread out rather than
+    # fetched at once.
+    def __init__(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, hourly_budget=None,
+                 half_life_hours=RATE_HALF_LIFE_HOURS, discovery_interval=DISCOVERY_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.hourly_budget = hourly_budget
+        self.decay = math.log(2) / half_life_hours
+        self.discovery_interval = discovery_interval
+        self.state = {}
+        self.heap = []
+        self.in_flight = set()
+        self.dispatched = deque()
+        self.discovered_at = {}
+        self.pending_observations = []
+        self.loaded = False
+
+    # --- persistence -----------------------------------------------------
+    def load(self, db):
+        for row in db.get_category_schedule():
+            key = (row["site_name"], row["category"])
+            self.state[key] = row
+        self.loaded = True
+        self.rebalance()
+
+    def save(self, db):
+        db.save_category_schedule(list(self.state.values()), self.pending_observations)
+        self.pending_observations = []
+
+    # --- categories ------------------------------------------------------
+    def needs_discovery(self, site, now=None):
+        now = time.time() if now is None else now
+        return now - self.discovered_at.get(site, 0) >= self.discovery_interval
+
+    def sync_categories(self, site, categories, now=None, db=None):
+        # New categories are due immediately; ones discovery no longer
+        # returns are forgotten. An empty list is treated as a failed
+        # discovery and leaves the known categories alone.
+        now = time.time() if now is None else now
+        if not categories:
+            return
+        self.discovered_at[site] = now
+        keep = set(categories)
+        for key in [k for k in self.state if k[0] == site and k[1] not in keep]:
+            del self.state[key]
+        for category in categories:
+            self.state.setdefault((site, category), {
+                "site_name": site, "category": category, "changes": 0.0, "exposure_hours": 0.0,
+                "fetches": 0, "failures": 0, "last_fetch_at": None, "last_change_at": None,
+                "interval": None, "next_due_at": now,
+            })
+        if db is not None:
+            db.delete_category_schedule(site, categories)
+        self.rebalance()
+
+    def categories(self, site=None):
+        return [k for k in self.state if site is None or k[0] == site]
+
+    # --- rates and intervals --------------------------------------------
+    def rate(self, key):
+        # Changes per hour, or None before the second successful fetch.
+        s = self.state[key]
+        if s["exposure_hours"] <= 0:
+            return None
+        return s["changes"] / s["exposure_hours"]
+
+    def budget(self):
+        return self.hourly_budget or len(self.state)
+
+    def rebalance(self):
+        # Mean alert latency is sum(rate_i / (2 * freq_i)) / sum(rate_i);
+        # minimizing it under sum(freq_i) = budget gives freq_i proportional
+        # to sqrt(rate_i). The scale factor is found by bisection with each
+        # frequency clamped to the interval bounds.
+        if not self.state:
+            self.heap = []
+            return
+        known = sorted(r for r in (self.rate(k) for k in self.state) if r is not None)
+        default_rate = known[len(known) // 2] if known else 1.0
+        weights = {}
+        for key in self.state:
+            r = self.rate(key)
+            weights[key] = math.sqrt((default_rate if r is None else r) + RATE_FLOOR)
+
+        f_min, f_max = HOUR / self.max_interval, HOUR / self.min_interval
+        budget = self.budget()
+        total = lambda c: sum(min(f_max, max(f_min, c * w)) for w in weights.values())
+        if total(0) >= budget:
+            scale = 0.0
+        else:
+            lo, hi = 0.0, f_max / min(weights.values())
+            if total(hi) <= budget:
+                scale = hi
+            else:
+                for _ in range(60):
+                    mid = (lo + hi) / 2
+                    if total(mid) > budget:
+                        hi = mid
+                    else:
+                        lo = mid
+                scale = lo
+
+        self.heap = []
+        for key, w in weights.items():
+            s = self.state[key]
+            s["interval"] = HOUR / min(f_max, max(f_min, scale * w))
+            if s["last_fetch_at"] is not None and s["failures"] == 0:
+                s["next_due_at"] = s["last_fetch_at"] + s["interval"]
+            if key not in self.in_flight:
+                heapq.heappush(self.heap, (s["next_due_at"], key))
+
+    # --- dispatch --------------------------------------------------------
+    def due(self, now=None):
+        # Categories to fetch now, grouped by site: {site: [category, ...]}.
+        now = time.time() if now is None else now
+        while self.dispatched and self.dispatched[0] <= now - HOUR:
+            self.dispatched.popleft()
+        allowance = math.ceil(self.budget()) - len(self.dispatched)
+        out = {}
+        while self.heap and self.heap[0][0] <= now and allowance > 0:
+            due_at, key = heapq.heappop(self.heap)
+            s = self.state.get(key)
+            if s is None or key in self.in_flight or due_at != s["next_due_at"]:
+                continue
+            self.in_flight.add(key)
+            self.dispatched.append(now)
+            out.setdefault(key[0], []).append(key[1])
+            allowance -= 1
+        return out
+
+    def next_wakeup(self, now=None):
+        now = time.time() if now is None else now
+        at = self.heap[0][0] if self.heap else now + self.min_interval
+        if self.dispatched and len(self.dispatched) >= math.ceil(self.budget()):
+            at = max(at, self.dispatched[0] + HOUR)
+        return max(at, now)
+
+    def observe(self, site, category, changed, total, now=None):
+        # changed=None records a failed fetch: it is retried after
+        # min_interval and does not touch the rate estimate.
+        now = time.time() if now is None else now
+        key = (site, category)
+        self.in_flight.discard(key)
+        s = self.state.get(key)
+        if s is None:
+            return
+        if changed is None:
+            s["failures"] += 1
+            s["next_due_at"] = now + self.min_interval
+            heapq.heappush(self.heap, (s["next_due_at"], key))
+            return
+
+        # The first fetch of a category reports everything as new, which
+        # says nothing about how often it changes.
+        if s["last_fetch_at"] is not None:
+            elapsed = max(0.0, (now - s["last_fetch_at"]) / HOUR)
+            keep = math.exp(-self.decay * elapsed)
+            s["changes"] = s["changes"] * keep + changed
+            s["exposure_hours"] = s["exposure_hours"] * keep + elapsed
+            if changed:
+                s["last_change_at"] = now
+            self.pending_observations.append((site, category, now, changed, total))
+        s["fetches"] += 1
+        s["failures"] = 0
+        s["last_fetch_at"] = now
+        s["next_due_at"] = now + (s["interval"] or self.min_interval)
+        heapq.heappush(self.heap, (s["next_due_at"], key))
+
+    def observe_run(self, dispatched, results, now=None):
+        # results is {site: {category: (changed, total)}} from one run;
+        # dispatched categories missing from it, or reported as None,
+        # failed. A category that completed empty is a fetch with no changes.
+        for site, categories in dispatched.items():
+            by_category = results.get(site) or {}
+            for category in categories:
+                changed, total = by_category.get(category) or (None, 0)
+                self.observe(site, category, changed, total, now=now)
+        self.rebalance()
+
+    def summary(self, now=None):
+        now = time.time() if now is None else now
+        if not self.state:
+            return "adaptive schedule: no categories"
+        intervals = sorted(s["interval"] or 0 for s in self.state.values())
+        fetches_per_hour = sum(HOUR / i for i in intervals if i)
+        return (f"adaptive schedule: {len(self.state)} categories, intervals "
+                f"{intervals[0] / 60:.0f}-{intervals[-1] / 60:.0f} min "
+                f"(median {intervals[len(intervals) // 2] / 60:.0f}), "
+                f"{fetches_per_hour:.1f}/{self.budget():.0f} fetches per hour planned, "
+                f"next in {max(0.0, self.next_wakeup(now) - now) / 60:.1f} min")
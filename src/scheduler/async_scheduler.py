@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import random
+import signal
+import time
+
+logger = logging.getLogger("scheduler")
+
+DEFAULT_JITTER = 0.1
+SHUTDOWN_TIMEOUT = 120
+
+
+class Job:
+    def __init__(self, name, fn, interval, jitter=DEFAULT_JITTER, run_at_start=True):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.run_at_start = run_at_start
+        self.task = None
+        self.runs = 0
+        self.skipped = 0
+
+    def next_delay(self):
+        # Spreads ticks by +/- jitter of the interval so restarts of several
+        # instances, and the sites' own caches, do not line up on the hour.
+        return max(0.0, self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+class AsyncScheduler:
+    # Runs coroutine jobs on fixed intervals inside one event loop. A job
+    # whose previous run is still going when its next tick comes is skipped,
+    # not stacked. On SIGINT/SIGTERM (or stop()) no new runs start, running
+    # ones get shutdown_timeout to finish and are then cancelled.
+    def __init__(self, shutdown_timeout=SHUTDOWN_TIMEOUT):
+        self.shutdown_timeout = shutdown_timeout
+        self.jobs = []
+        self._stopping = None
+
+    def add_job(self, name, fn, interval, jitter=DEFAULT_JITTER, run_at_start=True):
+        job = Job(name, fn, interval, jitter=jitter, run_at_start=run_at_start)
+        self.jobs.append(job)
+        return job
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    @property
+    def stopping(self):
+        return self._stopping is not None and self._stopping.is_set()
+
+    async def _run_job(self, job):
+        started = time.monotonic()
+        try:
+            result = await job.fn()
+            job.runs += 1
+            # Jobs return False when a tick had nothing to do.
+            if result is not False:
+                logger.info(f"Job {job.name} finished in {time.monotonic() - started:.1f}s")
+        except asyncio.CancelledError:
+            logger.warning(f"Job {job.name} cancelled")
+            raise
+        except Exception:
+            logger.exception(f"💥 Unhandled exception in job {job.name}")
+
+    async def _tick_loop(self, job):
+        delay = 0.0 if job.run_at_start else job.next_delay()
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if job.task is not None and not job.task.done():
+                job.skipped += 1
+                logger.warning(f"Previous {job.name} run still in progress ⏳ — skipping this interval")
+            else:
+                job.task = asyncio.create_task(self._run_job(job), name=job.name)
+            delay = job.next_delay()
+
+    def _install_signal_handlers(self, loop):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        self._install_signal_handlers(asyncio.get_running_loop())
+        loops = [asyncio.create_task(self._tick_loop(job)) for job in self.jobs]
+        for job in self.jobs:
+            logger.info(f"⏰ {job.name} every {job.interval:.0f}s (±{job.jitter:.0%})")
+        await self._stopping.wait()
+
+        logger.info("👋 Shutting down scheduler")
+        await asyncio.gather(*loops, return_exceptions=True)
+        running = [job.task for job in self.jobs if job.task is not None and not job.task.done()]
+        if running:
+            logger.info(f"Waiting up to {self.shutdown_timeout}s for {len(running)} running job(s)")
+            done, pending = await asyncio.wait(running, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -1,9 +1,14 @@
 import schedule
+import os
 import time
 import threading
 import logging
 from datetime import datetime
-from src.core.bot import run_all_scrapers
+from src.common import load_config
+from src.core.bot import run_all_scrapers, run_due_categories, run_maintenance
+from src.core.runtime import BotRuntime
+from src.scheduler.adaptive import AdaptiveScheduler, MIN_INTERVAL, MAX_INTERVAL
+from src.scheduler.async_scheduler import AsyncScheduler, DEFAULT_JITTER, SHUTDOWN_TIMEOUT
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,31 +17,65 @@ logging.basicConfig(
 )
 logger = logging.getLogger("scheduler")
 
+# How often the adaptive scheduler checks for due categories.
+ADAPTIVE_TICK_SECONDS = 60
+FIXED_INTERVAL_SECONDS = 3600
+MAINTENANCE_INTERVAL_SECONDS = 6 * 3600
+
 _run_lock = threading.Lock()
 
-def safe_run():
+def safe_run(job=run_all_scrapers, quiet=False):
     if _run_lock.locked():
-        logger.warning("Previous run still in progress ⏳ — skipping this interval")
+        if not quiet:
+            logger.warning("Previous run still in progress ⏳ — skipping this interval")
         return
 
     def _target():
         with _run_lock:
             try:
-                logger.info("🔁 Starting scraper job")
-                run_all_scrapers()
-                logger.info("✅ Scraper job complete")
+                if not quiet:
+                    logger.info("🔁 Starting scraper job")
+                job()
+                if not quiet:
+                    logger.info("✅ Scraper job complete")
             except Exception:
                 logger.exception("💥 Unhandled exception in scraper job")
 
     threading.Thread(target=_target, daemon=True).start()
 
+def _setting(config, key, fallback):
+    return os.getenv(f"SCHEDULER_{key}") or config.get("SCHEDULER", key, fallback=fallback)
+
+def create_adaptive_scheduler(config=None):
+    config = config if config is not None else load_config()
+    budget = float(_setting(config, "HOURLY_BUDGET", "0")) or None
+    return AdaptiveScheduler(
+        min_interval=float(_setting(config, "MIN_INTERVAL_MINUTES", str(MIN_INTERVAL / 60))) * 60,
+        max_interval=float(_setting(config, "MAX_INTERVAL_MINUTES", str(MAX_INTERVAL / 60))) * 60,
+        hourly_budget=budget,
+    )
+
 def start_scheduler():
+    config = load_config()
+    mode = _setting(config, "MODE", "adaptive").lower()
+    schedule.clear()
     logger.info(f"🚀 First run at {datetime.now()}")
-    safe_run()
 
-    schedule.clear()  
-    schedule.every().hour.do(safe_run)
-    logger.info(f"⏰ Scheduled every hour.")
+    if mode == "fixed":
+        safe_run()
+        schedule.every().hour.do(safe_run)
+        logger.info(f"⏰ Scheduled every hour.")
+    else:
+        # Every category starts out due, so the first tick is a full run;
+        # after that each category follows its own interval.
+        scheduler = create_adaptive_scheduler(config)
+        tick = lambda: safe_run(lambda: run_due_categories(scheduler), quiet=True)
+        tick()
+        schedule.every(ADAPTIVE_TICK_SECONDS).seconds.do(tick)
+        logger.info(f"⏰ Adaptive schedule, checking every {ADAPTIVE_TICK_SECONDS}s.")
+    # Shares the run lock with the scrape job, so it is skipped while a
+    # scrape is running and tried again at the next interval.
+    schedule.every(MAINTENANCE_INTERVAL_SECONDS).seconds.do(lambda: safe_run(run_maintenance, quiet=True))
 
     try:
         while True:
@@ -45,5 +84,30 @@ def start_scheduler():
     except KeyboardInterrupt:
         logger.info("👋 Scheduler stopped by user")
 
+def use_async_runtime(config=None):
+    config = config if config is not None else load_config()
+    return _setting(config, "RUNTIME", "async").lower() == "async"
+
+async def run_async_scheduler(config=None):
+    # The asyncio runtime: one loop for the process, with the scrape job,
+    # outbox dispatch and maintenance all running as tasks on it and the
+    # browser, HTTP sessions and DB connection kept across runs.
+    config = config if config is not None else load_config()
+    mode = _setting(config, "MODE", "adaptive").lower()
+    jitter = float(_setting(config, "JITTER", str(DEFAULT_JITTER)))
+    scheduler = AsyncScheduler(shutdown_timeout=float(_setting(config, "SHUTDOWN_TIMEOUT", str(SHUTDOWN_TIMEOUT))))
+    logger.info(f"🚀 First run at {datetime.now()}")
+
+    async with BotRuntime(config) as runtime:
+        if mode == "fixed":
+            scheduler.add_job("scrape", runtime.run_all, FIXED_INTERVAL_SECONDS, jitter=jitter)
+        else:
+            adaptive = create_adaptive_scheduler(config)
+            scheduler.add_job("scrape", lambda: runtime.run_due(adaptive), ADAPTIVE_TICK_SECONDS, jitter=jitter)
+        scheduler.add_job("maintenance", runtime.maintenance, MAINTENANCE_INTERVAL_SECONDS,
+                          jitter=jitter, run_at_start=False)
+        await scheduler.run()
+    logger.info("👋 Scheduler stopped")
+
 if __name__ == "__main__":
     start_scheduler()
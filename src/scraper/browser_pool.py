@@ -0,0 +1,152 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+
+class PooledPage:
+    def __init__(self, browser, ctx, page, state=None):
+        self.browser = browser
+        self.ctx = ctx
+        self.page = page
+        self.state = state
+        self.navigations = 0
+
+    def count_navigation(self, n: int = 1):
+        self.navigations += n
+
+    async def goto(self, url, **kwargs):
+        self.navigations += 1
+        return await self.page.goto(url, **kwargs)
+
+
+class BrowserPool:
+    # One Chromium shared by every caller. Context+page pairs are leased out,
+    # returned to an idle list and recycled after max_navigations so a long
+    # lived page cannot grow without bound. The browser is relaunched when it
+    # has disconnected, so a crash costs one attempt instead of the run.
+    # Playwright objects belong to the event loop that created them; when
+    # the pool is used from a different loop it starts over.
+    def __init__(self,
+                 size: int = 5,
+                 launch_args=None,
+                 user_agent: str = None,
+                 context_setup=None,
+                 max_navigations: int = 30,
+                 headless: bool = True):
+        self.size = size
+        self.launch_args = launch_args or []
+        self.user_agent = user_agent
+        self.context_setup = context_setup
+        self.max_navigations = max_navigations
+        self.headless = headless
+        self.launches = 0
+        self.recycled = 0
+        self._reset()
+
+    def _reset(self):
+        self._loop = None
+        self._pw = None
+        self._browser = None
+        self._idle = []
+        self._sem = None
+        self._launch_lock = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._reset()
+            self._loop = loop
+            self._sem = asyncio.Semaphore(self.size)
+            self._launch_lock = asyncio.Lock()
+
+        async with self._launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+            if self._browser is not None:
+                print("[Pool] Browser disconnected; relaunching")
+                await self._drop_idle()
+                self._browser = None
+            if self._pw is None:
+                self._pw = await async_playwright().start()
+            self._browser = await self._pw.chromium.launch(headless=self.headless, args=self.launch_args)
+            self.launches += 1
+            print(f"[Pool] Browser launched (#{self.launches})")
+            return self._browser
+
+    async def health_check(self) -> bool:
+        try:
+            await self.start()
+            # A round trip through the browser process, not just the socket.
+            ctx = await self._browser.new_context()
+            await ctx.close()
+            return True
+        except Exception as e:
+            print(f"[Pool] Health check failed: {e!r}; replacing browser")
+            await self._drop_idle()
+            if self._browser is not None:
+                try:
+                    await asyncio.wait_for(self._browser.close(), timeout=10)
+                except Exception:
+                    pass
+            self._browser = None
+            return False
+
+    @asynccontextmanager
+    async def lease(self):
+        await self.start()
+        async with self._sem:
+            await self.start()
+            slot = await self._checkout()
+            healthy = False
+            try:
+                yield slot
+                healthy = True
+            finally:
+                await self._checkin(slot, healthy)
+
+    async def _checkout(self):
+        while self._idle:
+            slot = self._idle.pop()
+            if slot.browser is self._browser and not slot.page.is_closed():
+                return slot
+            await self._close_slot(slot)
+        ctx = await self._browser.new_context(user_agent=self.user_agent)
+        state = await self.context_setup(ctx) if self.context_setup else None
+        page = await ctx.new_page()
+        return PooledPage(self._browser, ctx, page, state)
+
+    async def _checkin(self, slot, healthy):
+        if (healthy and slot.navigations < self.max_navigations
+                and slot.browser is self._browser and self._browser.is_connected()):
+            self._idle.append(slot)
+            return
+        self.recycled += 1
+        await self._close_slot(slot)
+
+    async def _close_slot(self, slot):
+        try:
+            await slot.page.close()
+            await slot.ctx.close()
+        except Exception:
+            pass
+
+    async def _drop_idle(self):
+        idle, self._idle = self._idle, []
+        for slot in idle:
+            await self._close_slot(slot)
+
+    async def trim(self):
+        # Closes idle contexts but keeps the browser running.
+        await self._drop_idle()
+
+    async def close(self):
+        await self._drop_idle()
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+        if self._pw is not None:
+            await self._pw.stop()
+        self._reset()
@@ -0,0 +1,271 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# "record" passes every request through and archives the response; "replay"
+# answers from the archive and never touches the network. Pick one with
+# SCRAPER_CAPTURE; SCRAPER_CAPTURE_DIR is the archive directory and
+# SCRAPER_REPLAY_LATENCY (seconds, optionally "base:jitter") is added to
+# every replayed response.
+MODES = ("record", "replay")
+DEFAULT_DIR = "captures"
+
+# Cache-busting query parameters left out of the request key, so a replayed
+# SPA that stamps its requests still finds them.
+IGNORED_PARAMS = ("_", "_ts", "cb")
+# Validators are stripped while recording, so the archive always holds a
+# full body; replay answers them itself.
+CONDITIONAL_HEADERS = ("if-none-match", "if-modified-since")
+# Bodies are stored decoded, so these no longer describe them.
+DROPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+class ReplayMiss(Exception):
+    # Not retried: the archive will not have the response on the next try either.
+    pass
+
+
+class ReplayHTTPError(Exception):
+    pass
+
+
+def canonical_url(url, params=None):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in IGNORED_PARAMS]
+    if params:
+        query += [(k, str(v)) for k, v in params.items() if k not in IGNORED_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path or "/", urlencode(sorted(query)), ""))
+
+
+def request_key(method, url, params=None, body=None):
+    h = hashlib.sha1(f"{method.upper()} {canonical_url(url, params)}".encode())
+    if body:
+        h.update(b"\n" + body)
+    return h.hexdigest()
+
+
+def _headers(headers):
+    return {k.lower(): v for k, v in (headers or {}).items() if k.lower() not in DROPPED_HEADERS}
+
+
+class ReplayResponse:
+    # The parts of a curl_cffi response the scrapers read.
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise ReplayHTTPError(f"HTTP {self.status_code} (replayed) for {self.url}")
+
+
+class CaptureArchive:
+    # One gzip file per request key under path/<key[:2]>/, holding a JSON
+    # header line (method, url, status, headers) and then the raw body.
+    # Recording a key again replaces it, so the archive holds the latest
+    # response for each request. Files are written to a temporary name and
+    # renamed, so a crashed recording leaves no half-written entries.
+    def __init__(self, path=DEFAULT_DIR, mode="replay", latency=0.0, jitter=0.0, seed=0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown capture mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.jitter = jitter
+        self.recorded = 0
+        self.hits = 0
+        self.misses = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + ".gz")
+
+    def put(self, key, method, url, status, headers, body):
+        header = {"method": method.upper(), "url": url, "status": status,
+                  "headers": _headers(headers), "recorded_at": time.time()}
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            f.write(body or b"")
+        os.replace(tmp, path)
+        with self._lock:
+            self.recorded += 1
+
+    def get(self, key):
+        try:
+            with gzip.open(self._file(key), "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        header, _, body = raw.partition(b"\n")
+        entry = json.loads(header)
+        entry["body"] = body
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def entries(self):
+        # Every archived response, in key order.
+        for sub in sorted(os.listdir(self.path)):
+            folder = os.path.join(self.path, sub)
+            if not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if name.endswith(".gz"):
+                    with gzip.open(os.path.join(folder, name), "rb") as f:
+                        header, _, body = f.read().partition(b"\n")
+                    entry = json.loads(header)
+                    entry["body"] = body
+                    yield entry
+
+    def next_delay(self):
+        if not self.latency and not self.jitter:
+            return 0.0
+        with self._lock:
+            return self.latency + self._rng.uniform(0, self.jitter)
+
+    def record(self, method, url, params, resp):
+        self.put(request_key(method, url, params), method, canonical_url(url, params),
+                 resp.status_code, dict(resp.headers), resp.content)
+
+    def replay(self, method, url, params=None, headers=None):
+        # Conditional requests are answered from the recorded validators, so
+        # the page cache sees the same 304s it would against the live site.
+        entry = self.get(request_key(method, url, params))
+        if entry is None:
+            raise ReplayMiss(f"No recorded response for {method.upper()} {canonical_url(url, params)}")
+        stored = entry["headers"]
+        sent = {k.lower(): v for k, v in (headers or {}).items()}
+        if entry["status"] == 200 and (
+                (sent.get("if-none-match") and sent["if-none-match"] == stored.get("etag"))
+                or (sent.get("if-modified-since") and sent["if-modified-since"] == stored.get("last-modified"))):
+            return ReplayResponse(url, 304, stored, b"")
+        return ReplayResponse(url, entry["status"], stored, entry["body"])
+
+    def get_sync(self, fetch, url, params=None, headers=None, **kwargs):
+        # For blocking callers: fetch is e.g. curl_cffi.requests.get.
+        if self.replaying:
+            delay = self.next_delay()
+            if delay:
+                time.sleep(delay)
+            return self.replay("GET", url, params, headers)
+        resp = fetch(url, params=params, headers=_strip_conditional(headers), **kwargs)
+        self.record("GET", url, params, resp)
+        return resp
+
+    def summary(self):
+        if self.replaying:
+            return f"capture replay from {self.path}: {self.hits} hits, {self.misses} misses"
+        return f"capture record to {self.path}: {self.recorded} responses"
+
+
+def _strip_conditional(headers):
+    if not headers:
+        return headers
+    return {k: v for k, v in headers.items() if k.lower() not in CONDITIONAL_HEADERS}
+
+
+class CaptureSession:
+    # Stands in for a curl_cffi AsyncSession. Recording passes requests to
+    # the wrapped session; replaying never uses it.
+    def __init__(self, session, archive):
+        self.session = session
+        self.archive = archive
+
+    async def get(self, url, params=None, headers=None, **kwargs):
+        if self.archive.replaying:
+            delay = self.archive.next_delay()
+            if delay:
+                await asyncio.sleep(delay)
+            return self.archive.replay("GET", url, params, headers)
+        resp = await self.session.get(url, params=params, headers=_strip_conditional(headers), **kwargs)
+        await asyncio.to_thread(self.archive.record, "GET", url, params, resp)
+        return resp
+
+    async def close(self):
+        await self.session.close()
+
+    async def __aenter__(self):
+        await self.session.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return await self.session.__aexit__(exc_type, exc_val, exc_tb)
+
+
+async def route_context(ctx, archive):
+    # Routes every request of a Playwright context through the archive.
+    # Handlers registered later run first, so resource blocking added after
+    # this only lets through (via route.fallback) what should be captured.
+    async def _route(route):
+        req = route.request
+        body = req.post_data_buffer
+        key = request_key(req.method, req.url, body=body)
+        if archive.replaying:
+            entry = await asyncio.to_thread(archive.get, key)
+            if entry is None:
+                await route.abort("internetdisconnected")
+                return
+            delay = archive.next_delay()
+            if delay:
+                await asyncio.sleep(delay)
+            await route.fulfill(status=entry["status"], headers=entry["headers"], body=entry["body"])
+            return
+        try:
+            resp = await route.fetch()
+            content = await resp.body()
+        except Exception:
+            await route.abort()
+            return
+        await asyncio.to_thread(archive.put, key, req.method, canonical_url(req.url), resp.status,
+                                resp.headers, content)
+        await route.fulfill(response=resp, body=content)
+
+    await ctx.route("**/*", _route)
+
+
+_archives = {}
+
+
+def from_env():
+    # The archive configured by SCRAPER_CAPTURE*, or None when capture is
+    # off. One instance per configuration, so its counters span a whole run.
+    mode = (os.getenv("SCRAPER_CAPTURE") or "").lower()
+    if mode not in MODES:
+        return None
+    path = os.getenv("SCRAPER_CAPTURE_DIR") or DEFAULT_DIR
+    base, _, jitter = (os.getenv("SCRAPER_REPLAY_LATENCY") or "0").partition(":")
+    key = (os.path.abspath(path), mode, float(base), float(jitter or 0))
+    if key not in _archives:
+        _archives[key] = CaptureArchive(path, mode, latency=key[2], jitter=key[3])
+    return _archives[key]
+
+
+def wrap_session(session, archive=None):
+    archive = archive or from_env()
+    return CaptureSession(session, archive) if archive is not None else session
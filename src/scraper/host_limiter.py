@@ -0,0 +1,178 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+# Defaults for a host nobody configured. Sites pass their own ceilings on
+# first use; every later get_limiter() for the same host shares that limiter.
+INITIAL_LIMIT = 4
+MIN_LIMIT = 1
+MAX_LIMIT = 10
+# Smoothed latency above this multiple of the best seen counts as the host
+# queueing our requests: growth stops and the limit eases down.
+LATENCY_FACTOR = 3.0
+DECREASE = 0.5
+BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+class HostLimiter:
+    # AIMD concurrency control for one host. Each healthy response adds
+    # 1/limit to the limit, so it grows by about one per round trip of the
+    # whole window; a 429, a 5xx, a timeout or a dropped connection halves it
+    # (at most once per smoothed round trip, so one burst of failures counts
+    # once) and pauses the host for Retry-After or an exponential backoff.
+    # max_rps spaces request starts regardless of the limit. Used as
+    # `async with limiter:` around the request itself; the caller reports
+    # the outcome with observe(), and an exception escaping the block counts
+    # as an error. Bound to the loop it is first used on, like BrowserPool.
+    def __init__(self, host: str, initial: int = INITIAL_LIMIT, min_limit: int = MIN_LIMIT,
+                 max_limit: int = MAX_LIMIT, max_rps: float = None, latency_factor: float = LATENCY_FACTOR,
+                 decrease: float = DECREASE, backoff: float = BACKOFF, max_backoff: float = MAX_BACKOFF):
+        self.host = host
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.max_rps = max_rps
+        self.latency_factor = latency_factor
+        self.decrease = decrease
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.latency_avg = None
+        self.latency_base = None
+        self.paused_until = 0.0
+        self.peak_limit = self.limit
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+        self._strikes = 0
+        self._last_decrease = 0.0
+        self._next_start = 0.0
+        self._loop = None
+        self.in_flight = 0
+        self._waiters = []
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self.in_flight = 0
+            self._waiters = []
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            fut = self._waiters.pop(0)
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+    async def acquire(self):
+        self._bind()
+        while self.in_flight >= int(self.limit):
+            fut = self._loop.create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+                else:
+                    self._wake()
+                raise
+        self.in_flight += 1
+        try:
+            # Wait out a pause and the rate ceiling while holding the slot,
+            # so paced requests do not pile up behind the limit as well.
+            now = time.monotonic()
+            start = max(now, self.paused_until, self._next_start)
+            if self.max_rps:
+                self._next_start = start + 1.0 / self.max_rps
+            if start > now:
+                await asyncio.sleep(start - now)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        self._wake()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.on_error()
+        self.release()
+
+    def observe(self, status: int, latency: float, retry_after=None):
+        now = time.monotonic()
+        if status == 429 or status >= 500:
+            self.throttled += 1
+            self._back_off(now, retry_after)
+            return
+        self.successes += 1
+        self._strikes = 0
+        self.latency_avg = latency if self.latency_avg is None else 0.8 * self.latency_avg + 0.2 * latency
+        # The baseline creeps up slowly so a host that got slower for good
+        # is not held down forever.
+        self.latency_base = (self.latency_avg if self.latency_base is None
+                             else min(self.latency_avg, self.latency_base * 1.001))
+        if self.latency_avg > self.latency_factor * self.latency_base:
+            if now - self._last_decrease > self.latency_avg:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * 0.9)
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+            self._wake()
+
+    def on_error(self):
+        self.errors += 1
+        self._back_off(time.monotonic())
+
+    def _back_off(self, now, retry_after=None):
+        if now - self._last_decrease > (self.latency_avg or 1.0):
+            self._last_decrease = now
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+        self._strikes += 1
+        pause = _parse_retry_after(retry_after)
+        if pause is None:
+            pause = min(self.max_backoff, self.backoff * 2 ** (self._strikes - 1)) * random.uniform(0.5, 1.0)
+        self.paused_until = max(self.paused_until, now + min(pause, self.max_backoff))
+
+    def retry_delay(self, attempt: int) -> float:
+        # Full-jitter exponential delay before retry number attempt + 1; a
+        # host pause is honoured by acquire() on top of it.
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def summary(self) -> str:
+        return (f"{self.host}: limit {self.limit:.1f} (peak {self.peak_limit:.1f}, max {self.max_limit}), "
+                f"{self.successes} ok, {self.throttled} throttled, {self.errors} errors")
+
+
+def _parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+_limiters = {}
+
+
+def get_limiter(url: str, **settings) -> HostLimiter:
+    # One limiter per host for the whole process. settings only apply when
+    # the limiter is created, except max_limit, which a caller with a larger
+    # connection pool may raise.
+    host = urlsplit(url).netloc or url
+    limiter = _limiters.get(host)
+    if limiter is None:
+        limiter = _limiters[host] = HostLimiter(host, **settings)
+    elif settings.get("max_limit", 0) > limiter.max_limit:
+        limiter.max_limit = settings["max_limit"]
+    return limiter
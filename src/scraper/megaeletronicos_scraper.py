@@ -3,10 +3,15 @@ import re
 import time
 import random
 from urllib.parse import urljoin
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from curl_cffi import requests as cureq
-from bs4 import BeautifulSoup
+from curl_cffi.requests import AsyncSession
+from bs4 import BeautifulSoup, UnicodeDammit
+from lxml import etree, html as lxml_html
+
+from src.common import metrics
+from src.scraper import capture, host_limiter
+from src.scraper.page_cache import PageCache, grid_fingerprint
 from playwright.async_api import async_playwright
 
 browser_args = [
@@ -25,18 +30,53 @@ USER_AGENT = (
     "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
 )
 BASE_URL = "https://www.megaeletronicos.com/"
+SITE_NAME = "megaeletronicos"
+
+# Ceiling for the host's adaptive concurrency limit (see host_limiter); also
+# the size of the AsyncSession connection pool.
+MAX_CONNECTIONS = 10
+# Request starts per second, however high the concurrency limit climbs.
+MAX_RPS = 10
+REQUEST_TIMEOUT = 30
+# Discovered category URLs are reused for this long before rediscovery.
+CATEGORY_CACHE_TTL = 24 * 3600
+
+PAGE_NUM_RE = re.compile(r"[?&]page=(\d+)")
+
+# "lxml" or "bs4"; both return identical product dicts.
+PARSER_BACKEND = "lxml"
+
 
-CONCURRENT_CATEGORIES = 5
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Precompiled equivalents of the BeautifulSoup lookups in parse_category_page_bs4.
+X_PRODUCTS = etree.XPath(f"//div[{_has_class('producto')}]")
+X_TITLE = etree.XPath(f"(.//h4[{_has_class('titulo')}])[1]")
+X_PARENT_A = etree.XPath("ancestor::a[1]")
+X_CODE = etree.XPath(f"(.//p[{_has_class('codigo')}])[1]")
+X_PRICE = etree.XPath(f"(.//p[{_has_class('principal-br')}])[1]")
+X_IN_STOCK = etree.XPath(f"boolean(.//span[{_has_class('badge-in-stock')}])")
+X_OUT_STOCK = etree.XPath(f"boolean(.//span[{_has_class('bg-danger')}])")
+X_PAGINATION = etree.XPath(f"(//div[{_has_class('paginaciones')}])[1]")
+X_LAST_ACTIVE = etree.XPath(f"boolean(//div[{_has_class('last')} and {_has_class('active-search')}])")
+X_PAGE_HREFS = etree.XPath(".//a/@href")
+X_MENU_CATEGORIES = etree.XPath(f"//div[{_has_class('menu-categories')}]//a")
+X_MENU_SUBCATEGORIES = etree.XPath(f"//div[{_has_class('menu-subcategories')}]")
+X_FIRST_HREF = etree.XPath("(.//a[@href])[1]/@href")
 
 
 def retry(max_retries=3, backoff_base=2, jitter=0.1):
+    # Blocking retries for the legacy thread-per-category path only; the
+    # async engine backs off through its HostLimiter.
     def decorator(fn):
         def wrapper(*args, **kwargs):
             for attempt in range(max_retries + 1):
                 try:
                     return fn(*args, **kwargs)
                 except Exception as e:
-                    if attempt == max_retries:
+                    if attempt == max_retries or isinstance(e, capture.ReplayMiss):
                         print(f"[ERROR] {fn.__name__} failed after {max_retries} retries: {e}")
                         if fn.__name__ == "get_category_page_data":
                             return [], True
@@ -75,11 +115,75 @@ async def get_categories(page):
     return links
 
 
-@retry(max_retries=3, backoff_base=2, jitter=0.2)
-def get_category_page_data(category_url):
-    print(f"Fetching: {category_url}")
-    resp = cureq.get(category_url, impersonate="chrome", timeout=30_000)
-    soup = BeautifulSoup(resp.content, "html.parser")
+def _text(el, strip=False):
+    # Mirrors BeautifulSoup.get_text(): comments are skipped, and with
+    # strip=True each text node is stripped and empty ones dropped.
+    if strip:
+        return "".join(t.strip() for t in el.itertext())
+    return "".join(el.itertext())
+
+
+def parse_category_page_lxml(content):
+    if isinstance(content, bytes):
+        # Decode exactly as BeautifulSoup would so both backends see the same text.
+        content = UnicodeDammit(content, is_html=True).unicode_markup
+    if not content.strip():
+        return [], True, 0
+    root = lxml_html.document_fromstring(content)
+
+    products = []
+    for product in X_PRODUCTS(root):
+        name_tags = X_TITLE(product)
+        if not name_tags:
+            continue
+        parent_a = X_PARENT_A(product)
+        url = parent_a[0].get("href") if parent_a else None
+
+        name = _text(name_tags[0], strip=True)
+
+        code_tags = X_CODE(product)
+        code = re.search(r"\d+", _text(code_tags[0]))[0] if code_tags else None
+
+        price = None
+        price_tags = X_PRICE(product)
+        if price_tags:
+            txt = re.sub(r'[^\d.]', "", _text(price_tags[0], strip=True))
+            price = float(txt) if txt else ''
+
+        if X_IN_STOCK(product):
+            stock_status = "In Stock"
+        elif X_OUT_STOCK(product):
+            stock_status = "Out of Stock"
+        else:
+            stock_status = "Out of Stock"
+
+        products.append({
+            "url": url,
+            "code": code,
+            "name": name,
+            "price": price,
+            "stock_status": stock_status,
+        })
+
+    pag = X_PAGINATION(root)
+    last = not pag or X_LAST_ACTIVE(root)
+    max_page = 0
+    if pag:
+        for href in X_PAGE_HREFS(pag[0]):
+            m = PAGE_NUM_RE.search(href)
+            if m:
+                max_page = max(max_page, int(m.group(1)))
+    return products, last, max_page
+
+
+def parse_category_page(content, backend=None):
+    if (backend or PARSER_BACKEND) == "bs4":
+        return parse_category_page_bs4(content)
+    return parse_category_page_lxml(content)
+
+
+def parse_category_page_bs4(content):
+    soup = BeautifulSoup(content, "html.parser")
 
     products = []
     for product in soup.find_all("div", class_="producto"):
@@ -120,9 +224,226 @@ def get_category_page_data(category_url):
 
     pag = soup.select_one("div.paginaciones")
     last = not pag or bool(soup.select_one("div.last.active-search"))
+    max_page = 0
+    if pag:
+        for a in pag.find_all("a", href=True):
+            m = PAGE_NUM_RE.search(a["href"])
+            if m:
+                max_page = max(max_page, int(m.group(1)))
+    return products, last, max_page
+
+
+def parse_menu_categories(content):
+    # The browser flow clicks every menu category and takes the first
+    # subcategory link it reveals. When the menu is server-rendered, those
+    # subcategory blocks are already in the HTML, one per category. Anything
+    # short of one link per category means the menu is built client-side,
+    # and an empty list is returned.
+    root = lxml_html.document_fromstring(content)
+    categories = X_MENU_CATEGORIES(root)
+    links = []
+    for group in X_MENU_SUBCATEGORIES(root):
+        hrefs = X_FIRST_HREF(group)
+        if hrefs and not hrefs[0].startswith(("#", "javascript:")):
+            full = urljoin(BASE_URL, hrefs[0])
+            if full not in links:
+                links.append(full)
+    if not links or len(links) < len(categories):
+        return []
+    return links
+
+
+async def get_categories_http():
+    async with capture.wrap_session(AsyncSession(impersonate="chrome")) as session:
+        resp = await session.get(BASE_URL, timeout=REQUEST_TIMEOUT)
+        resp.raise_for_status()
+    return parse_menu_categories(resp.content)
+
+
+async def get_categories_browser():
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True, args=browser_args)
+        ctx = await browser.new_context(user_agent=USER_AGENT,
+                                        viewport={"width": 1080, "height": 1800})
+        archive = capture.from_env()
+        if archive is not None:
+            await capture.route_context(ctx, archive)
+        page = await ctx.new_page()
+        try:
+            return await get_categories(page)
+        finally:
+            await browser.close()
+
+
+async def discover_categories(db=None, ttl=CATEGORY_CACHE_TTL):
+    # Fresh cache, then static HTML, then the browser. A stale cache is the
+    # last resort if both live paths fail.
+    with metrics.stage("discovery", site=SITE_NAME) as stage:
+        if db is not None:
+            cached = db.get_cached_categories(SITE_NAME, max_age=ttl)
+            if cached:
+                print(f"Using {len(cached)} cached categories.")
+                stage["items"] = len(cached)
+                return cached
+
+        cat_urls = []
+        try:
+            cat_urls = await get_categories_http()
+            print(f"Discovered {len(cat_urls)} categories over HTTP.")
+        except Exception as e:
+            print(f"[WARN] HTTP category discovery failed: {e}")
+
+        if not cat_urls:
+            print("Falling back to browser category discovery.")
+            try:
+                cat_urls = await get_categories_browser()
+            except Exception as e:
+                if db is None:
+                    raise
+                print(f"[WARN] Browser category discovery failed: {e}")
+
+        if db is not None:
+            if cat_urls:
+                db.store_cached_categories(SITE_NAME, cat_urls)
+            else:
+                cat_urls = db.get_cached_categories(SITE_NAME) or []
+                print(f"Using {len(cat_urls)} stale cached categories.")
+        stage["items"] = len(cat_urls)
+        return cat_urls
+
+
+@retry(max_retries=3, backoff_base=2, jitter=0.2)
+def get_category_page_data(category_url):
+    print(f"Fetching: {category_url}")
+    archive = capture.from_env()
+    if archive is not None:
+        resp = archive.get_sync(cureq.get, category_url, impersonate="chrome", timeout=REQUEST_TIMEOUT)
+    else:
+        resp = cureq.get(category_url, impersonate="chrome", timeout=REQUEST_TIMEOUT)
+    products, last, _ = parse_category_page(resp.content)
     return products, last
 
 
+async def fetch_category_page(session, limiter, page_url, max_retries=3, cache=None):
+    # With a PageCache, requests carry the stored validators. A 304, or a 200
+    # whose product grid hashes the same as last time, skips parsing and
+    # yields a single {"unchanged": True, ...} marker in place of products.
+    # A page that still fails after the retries yields a {"failed": True}
+    # marker, so its category is not taken as complete.
+    for attempt in range(max_retries + 1):
+        try:
+            headers = cache.conditional_headers(page_url) if cache else None
+            async with limiter:
+                print(f"Fetching: {page_url}")
+                started = time.monotonic()
+                resp = await session.get(page_url, timeout=REQUEST_TIMEOUT, headers=headers)
+                elapsed = time.monotonic() - started
+                limiter.observe(resp.status_code, elapsed, resp.headers.get("retry-after"))
+                metrics.observe("fetch_seconds", elapsed, site=SITE_NAME)
+            metrics.inc("requests", site=SITE_NAME)
+            metrics.inc("bytes_downloaded", len(resp.content), site=SITE_NAME)
+            entry = cache.lookup(page_url) if cache else None
+            if resp.status_code == 304 and entry:
+                metrics.inc("pages_unchanged", site=SITE_NAME)
+                return [cache.hit(page_url, not_modified=True)], entry["is_last"], entry["max_page"]
+            resp.raise_for_status()
+
+            fingerprint = grid_fingerprint(resp.content) if cache is not None else None
+            if entry and entry["content_hash"] == fingerprint:
+                metrics.inc("pages_unchanged", site=SITE_NAME)
+                return [cache.hit(page_url, not_modified=False)], entry["is_last"], entry["max_page"]
+            # Parsing is CPU-bound; keep it off the loop so other fetches proceed.
+            started = time.monotonic()
+            products, last, max_page = await asyncio.to_thread(parse_category_page, resp.content)
+            metrics.observe("parse_seconds", time.monotonic() - started, site=SITE_NAME)
+            metrics.inc("items_parsed", len(products), site=SITE_NAME)
+            if cache is not None:
+                cache.stage(page_url, resp.headers, fingerprint, last, max_page,
+                            [p["code"] for p in products if p.get("code")])
+            return products, last, max_page
+        except Exception as e:
+            if attempt == max_retries or isinstance(e, capture.ReplayMiss):
+                print(f"[ERROR] fetch_category_page failed after {max_retries} retries: {e}")
+                metrics.inc("fetch_errors", site=SITE_NAME)
+                return [{"failed": True, "url": page_url}], True, 0
+            metrics.inc("retries", site=SITE_NAME)
+            sleep_time = limiter.retry_delay(attempt)
+            print(f"[Retry {attempt+1}/{max_retries}] fetch_category_page error: {e}. "
+                  f"Sleeping {sleep_time:.1f}s before next try.")
+            await asyncio.sleep(sleep_time)
+
+
+async def get_products_from_category_async(session, limiter, category_url, cache=None, sink=None):
+    # Page 1 is fetched alone; after that every page number the pagination
+    # bar links to is fetched concurrently. Results past the first page that
+    # reports itself as last are dropped, so this degrades to sequential
+    # paging when the bar exposes no page numbers. With a sink, each page is
+    # awaited into it as soon as it is parsed and nothing is accumulated,
+    # and a category with no failed page ends with a {"done": True} marker.
+    all_products = []
+    count = 0
+    pages = 0
+    failed = False
+
+    async def emit(prods):
+        nonlocal count, pages, failed
+        for p in prods:
+            p["category"] = category_url
+            failed = failed or bool(p.get("failed"))
+        count += len(prods)
+        pages += 1
+        if sink is None:
+            all_products.extend(prods)
+        elif prods:
+            await sink(prods)
+
+    with metrics.stage("category", site=SITE_NAME, category=category_url) as stage:
+        prods, last, max_seen = await fetch_category_page(session, limiter, f"{category_url}?page=1",
+                                                          cache=cache)
+        await emit(prods)
+        next_page = 2
+        while not last:
+            upto = max(max_seen, next_page)
+            results = await asyncio.gather(*(
+                fetch_category_page(session, limiter, f"{category_url}?page={n}", cache=cache)
+                for n in range(next_page, upto + 1)
+            ))
+            for prods, page_last, page_max in results:
+                await emit(prods)
+                max_seen = max(max_seen, page_max)
+                if page_last:
+                    last = True
+                    break
+            next_page = upto + 1
+        stage["items"] = count
+    if sink is not None and not failed:
+        await sink([{"done": True, "category": category_url, "pages": pages}])
+    print(f"{count} items from {category_url}")
+    return all_products
+
+
+def create_session(max_connections=MAX_CONNECTIONS):
+    # Wrapped for record/replay when SCRAPER_CAPTURE is set (see capture).
+    return capture.wrap_session(AsyncSession(impersonate="chrome", max_clients=max_connections))
+
+
+async def scrape_categories(cat_urls, max_connections=MAX_CONNECTIONS, cache=None, sink=None, session=None):
+    # A caller-provided session (from create_session) is reused and left
+    # open, keeping its connections warm between runs.
+    if session is None:
+        async with create_session(max_connections) as session:
+            return await scrape_categories(cat_urls, max_connections, cache=cache, sink=sink,
+                                           session=session)
+    limiter = host_limiter.get_limiter(cat_urls[0] if cat_urls else BASE_URL,
+                                       max_limit=max_connections, max_rps=MAX_RPS)
+    results = await asyncio.gather(*(
+        get_products_from_category_async(session, limiter, url, cache=cache, sink=sink)
+        for url in cat_urls
+    ))
+    print(f"Concurrency {limiter.summary()}")
+    return [p for prods in results for p in prods]
+
+
 def get_products_from_category(category_url):
     page_num = 1
     all_products = []
@@ -137,36 +458,45 @@ def get_products_from_category(category_url):
     return all_products
 
 
-async def main():
+async def main(db=None, categories=None, sink=None, session=None):
+    # categories restricts the run to those category URLs (the adaptive
+    # scheduler passes the ones that are due); None discovers all of them.
+    # With a sink, page batches are streamed into it undeduplicated and an
+    # empty list is returned.
     start = time.time()
-    async with async_playwright() as pw:
-        browser = await pw.chromium.launch(headless=True, args=browser_args)
-        ctx = await browser.new_context(user_agent=USER_AGENT,
-                                        viewport={"width": 1080, "height": 1800})
-        page = await ctx.new_page()
-        cat_urls = await get_categories(page)
-        await browser.close()
-
-    print(f"Found {len(cat_urls)} categories. Spawning {CONCURRENT_CATEGORIES} workers...")
+    if categories is not None:
+        cat_urls = list(categories)
+    else:
+        cat_urls = await discover_categories(db)
 
-    all_products = []
-    with ThreadPoolExecutor(max_workers=CONCURRENT_CATEGORIES) as exe:
-        futures = {exe.submit(get_products_from_category, url): url
-                   for url in cat_urls}
-        for fut in as_completed(futures):
-            all_products.extend(fut.result())
+    print(f"Found {len(cat_urls)} categories. Fetching with up to {MAX_CONNECTIONS} connections, {MAX_RPS} req/s...")
+    cache = PageCache(db, SITE_NAME) if db is not None else None
+    all_products = await scrape_categories(cat_urls, cache=cache, sink=sink, session=session)
+    if cache is not None:
+        cache.flush()
+        print(cache.summary())
+    archive = capture.from_env()
+    if archive is not None:
+        print(archive.summary())
+    if sink is not None:
+        print(f"Total time: {time.time() - start:.1f}s")
+        return []
 
     print(f"Done! Total products scraped: {len(all_products)}")
     print(f"Total time: {time.time() - start:.1f}s")
     unique = {}
+    unchanged = []
     for prod in all_products:
+        if prod.get("unchanged") or prod.get("failed"):
+            unchanged.append(prod)
+            continue
         code =  prod.get("code") 
         if code not in unique:
             unique[code] = prod
 
     deduped_list = list(unique.values())
-    print(f"Unique items: {len(deduped_list)}")
-    return deduped_list
+    print(f"Unique items: {len(deduped_list)} (+{len(unchanged)} unchanged pages)")
+    return deduped_list + unchanged
 
 
 if __name__ == "__main__":
@@ -0,0 +1,270 @@
+import asyncio
+import os
+import time
+from urllib.parse import urljoin
+
+from curl_cffi.requests import AsyncSession
+
+from src.common import metrics
+from src.scraper import capture, host_limiter
+
+SITE_NAME = "mobilezone"
+BASE_URL = "https://www.mobilezone.com.py/"
+# The SPA's backend. Both the base URL and the paths can be overridden, since
+# they come from the site's own network traffic rather than a published API.
+API_URL = "https://www.mobilezone.com.py/api/"
+CATEGORIES_PATH = "categories"
+PRODUCTS_PATH = "products"
+
+PAGE_SIZE = 48
+# Ceiling for the host's adaptive concurrency limit; the browser engine
+# shares the same limiter, since both hit the same host.
+MAX_CONNECTIONS = 10
+MAX_RPS = 10
+REQUEST_TIMEOUT = 30
+
+# Field names seen across the SPA's payloads, in order of preference.
+CODE_KEYS = ("codigo", "code", "sku", "id")
+NAME_KEYS = ("nombre", "name", "descripcion", "title")
+PRICE_KEYS = ("precio_usd", "price_usd", "precio", "price")
+STOCK_KEYS = ("stock", "disponible", "in_stock", "available")
+LIST_KEYS = ("data", "items", "products", "results", "categories")
+CATEGORY_KEYS = ("slug", "query", "id")
+
+
+def get_api_url():
+    url = os.getenv("MOBILEZONE_API_URL") or API_URL
+    return url if url.endswith("/") else url + "/"
+
+
+def _first(raw, keys):
+    for k in keys:
+        if raw.get(k) not in (None, ""):
+            return raw[k]
+    return None
+
+
+def _items(payload):
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for k in LIST_KEYS:
+            if isinstance(payload.get(k), list):
+                return payload[k]
+    return []
+
+
+def _page_count(payload, page_size):
+    if not isinstance(payload, dict):
+        return 1
+    for k in ("pages", "totalPages", "total_pages", "last_page"):
+        if payload.get(k):
+            return int(payload[k])
+    total = payload.get("total") or payload.get("count")
+    if total:
+        return max(1, -(-int(total) // page_size))
+    return 1
+
+
+def parse_price(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        txt = value.replace("$", "").replace(" ", "").replace(",", "")
+        try:
+            return float(txt)
+        except ValueError:
+            return None
+    return None
+
+
+def parse_stock(value):
+    if value is None:
+        return "In Stock"
+    if isinstance(value, str):
+        return "Out of Stock" if value.strip().lower() in ("0", "false", "no", "agotado") else "In Stock"
+    return "In Stock" if value else "Out of Stock"
+
+
+def parse_product(raw):
+    # Same dict schema as the browser engine.
+    if not isinstance(raw, dict):
+        return None
+    code = _first(raw, CODE_KEYS)
+    name = _first(raw, NAME_KEYS)
+    if code is None or not name:
+        return None
+    code = str(code)
+    return {
+        "code": code,
+        "name": str(name).strip(),
+        "price": parse_price(_first(raw, PRICE_KEYS)),
+        "stock_status": parse_stock(_first(raw, STOCK_KEYS)),
+        "url": urljoin(BASE_URL, f"product/{code}"),
+    }
+
+
+def category_url(slug):
+    # Categories are keyed by their page URL, as the browser engine finds
+    # them, so checkpoints, schedules and retries carry over between engines.
+    return urljoin(BASE_URL, f"query/{slug}")
+
+
+def category_slug(category):
+    return category.rsplit("/query/", 1)[1] if "/query/" in category else category
+
+
+def parse_categories(payload):
+    slugs = []
+    for raw in _items(payload):
+        if isinstance(raw, str):
+            slug = raw
+        elif isinstance(raw, dict):
+            slug = _first(raw, CATEGORY_KEYS)
+            href = raw.get("href") or raw.get("url")
+            if slug is None and isinstance(href, str) and "/query/" in href:
+                slug = href.rsplit("/query/", 1)[1]
+        else:
+            slug = None
+        if slug is not None and str(slug) not in slugs:
+            slugs.append(str(slug))
+    return slugs
+
+
+async def fetch_json(session, limiter, url, params=None, max_retries=3):
+    for attempt in range(max_retries + 1):
+        try:
+            async with limiter:
+                started = time.monotonic()
+                resp = await session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+                elapsed = time.monotonic() - started
+                limiter.observe(resp.status_code, elapsed, resp.headers.get("retry-after"))
+                metrics.observe("fetch_seconds", elapsed, site=SITE_NAME)
+            metrics.inc("requests", site=SITE_NAME)
+            metrics.inc("bytes_downloaded", len(resp.content), site=SITE_NAME)
+            resp.raise_for_status()
+            return resp.json()
+        except Exception as e:
+            if attempt == max_retries or isinstance(e, capture.ReplayMiss):
+                metrics.inc("fetch_errors", site=SITE_NAME)
+                raise
+            metrics.inc("retries", site=SITE_NAME)
+            sleep_time = limiter.retry_delay(attempt)
+            print(f"[Retry {attempt+1}/{max_retries}] {url} error: {e}. "
+                  f"Sleeping {sleep_time:.1f}s before next try.")
+            await asyncio.sleep(sleep_time)
+
+
+async def get_categories(session, limiter, api_url):
+    payload = await fetch_json(session, limiter, urljoin(api_url, CATEGORIES_PATH))
+    cats = parse_categories(payload)
+    print(f"Discovered {len(cats)} categories.")
+    return cats
+
+
+async def get_products_from_category(session, limiter, api_url, category, page_size=PAGE_SIZE, sink=None):
+    # With a sink, each page is parsed and awaited into it as its response
+    # arrives and an empty list is returned, ending with a {"done": True}
+    # marker. A category that fails part way yields a {"failed": True}
+    # marker instead.
+    url = urljoin(api_url, PRODUCTS_PATH)
+    params = {"category": category_slug(category), "page": 1, "limit": page_size}
+    category = category_url(params["category"])
+    products = []
+    count = 0
+
+    async def emit(payload):
+        nonlocal count
+        started = time.monotonic()
+        batch = []
+        for raw in _items(payload):
+            p = parse_product(raw)
+            if p:
+                p["category"] = category
+                batch.append(p)
+        metrics.observe("parse_seconds", time.monotonic() - started, site=SITE_NAME)
+        metrics.inc("items_parsed", len(batch), site=SITE_NAME)
+        count += len(batch)
+        if sink is None:
+            products.extend(batch)
+        elif batch:
+            await sink(batch)
+
+    try:
+        with metrics.stage("category", site=SITE_NAME, category=category) as stage:
+            first = await fetch_json(session, limiter, url, params)
+            await emit(first)
+            page_count = _page_count(first, page_size)
+            tasks = [asyncio.create_task(fetch_json(session, limiter, url, dict(params, page=n)))
+                     for n in range(2, page_count + 1)]
+            try:
+                for fut in asyncio.as_completed(tasks):
+                    await emit(await fut)
+            finally:
+                # A failed page ends the category; the pages still in
+                # flight are cancelled rather than left running.
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            stage["items"] = count
+        if sink is not None:
+            await sink([{"done": True, "category": category, "pages": page_count}])
+    except Exception as e:
+        print(f"[ERROR] category {category} failed: {e}")
+        marker = {"failed": True, "category": category}
+        if sink is not None:
+            await sink([marker])
+            return []
+        return [marker]
+
+    print(f"[Cat] Done {category}: {count} products")
+    return products
+
+
+def get_limiter(api_url, max_connections=MAX_CONNECTIONS):
+    return host_limiter.get_limiter(api_url, max_limit=max_connections, max_rps=MAX_RPS)
+
+
+def create_session(max_connections=MAX_CONNECTIONS):
+    headers = {"Accept": "application/json", "Referer": BASE_URL}
+    return capture.wrap_session(AsyncSession(impersonate="chrome", max_clients=max_connections,
+                                             headers=headers))
+
+
+async def discover(max_connections=MAX_CONNECTIONS, session=None):
+    if session is None:
+        async with create_session(max_connections) as session:
+            return await discover(max_connections, session=session)
+    with metrics.stage("discovery", site=SITE_NAME) as stage:
+        api_url = get_api_url()
+        cats = await get_categories(session, get_limiter(api_url, max_connections), api_url)
+        stage["items"] = len(cats)
+    return [category_url(slug) for slug in cats]
+
+
+async def main(max_connections=MAX_CONNECTIONS, categories=None, sink=None, session=None):
+    # A caller-provided session (from create_session) is reused and left
+    # open; otherwise one is opened for this call.
+    if session is None:
+        async with create_session(max_connections) as session:
+            return await main(max_connections, categories=categories, sink=sink, session=session)
+    start = time.time()
+    api_url = get_api_url()
+    limiter = get_limiter(api_url, max_connections)
+    if categories is not None:
+        cats = list(categories)
+    else:
+        with metrics.stage("discovery", site=SITE_NAME) as stage:
+            cats = await get_categories(session, limiter, api_url)
+            stage["items"] = len(cats)
+    results = await asyncio.gather(*(
+        get_products_from_category(session, limiter, api_url, cat, sink=sink) for cat in cats
+    ))
+    print(f"Concurrency {limiter.summary()}")
+    all_products = [p for sub in results for p in sub]
+    print(f"Finished scraping {len(all_products)} items in {time.time() - start:.1f}s")
+    return all_products
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,13 +1,16 @@
 import asyncio
+import os
 import re
 import time
 from urllib.parse import urljoin
 
-from playwright.async_api import (
-    async_playwright,
-    Error as PlaywrightError
-)
+from playwright.async_api import Error as PlaywrightError
+
+from src.common import metrics
+from src.scraper import capture, host_limiter, mobilezone_api
+from src.scraper.browser_pool import BrowserPool
 
+SITE_NAME = "mobilezone"
 BASE_URL = "https://www.mobilezone.com.py/"
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -25,60 +28,200 @@ browser_args = [
     '--disable-gpu'
 ]
 
+# Pages in the browser pool, and the ceiling for the host's adaptive limit
+# on navigations in flight (see host_limiter).
 MAX_CONCURRENT = 5
+MAX_RPS = 5
+
+# "browser" drives the SPA with Playwright; "api" calls the JSON endpoints the
+# SPA itself uses, without Chromium (see mobilezone_api).
+ENGINES = ("browser", "api")
+DEFAULT_ENGINE = "browser"
+
+CATEGORY_LINKS_XPATH = '//*[@id="root"]/div[2]/div[2]/div/div/div/div/a'
+PRODUCT_GRID_XPATH = '//*[@id="root"]/div[3]/div[1]/div[4]/div[2]/div'
+NEXT_BUTTON_XPATH = '//*[@id="root"]/div[3]/div[1]/nav/ul/li[4]/button'
+
+TRACKER_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "facebook.net", "facebook.com/tr", "connect.facebook", "hotjar.com",
+    "clarity.ms", "tiktok.com", "googleadservices.com",
+)
+
+# "full" is the original behaviour: load everything and wait for networkidle.
+# "lean" aborts resources the text scrape never reads and waits on the
+# product grid itself. Pick one with MOBILEZONE_PROFILE; MOBILEZONE_MEASURE=1
+# adds downloaded bytes to the per-category log line.
+PROFILES = {
+    "full": {"block": (), "block_trackers": False, "targeted_waits": False},
+    "lean": {"block": ("image", "media", "font", "stylesheet"), "block_trackers": True,
+             "targeted_waits": True},
+}
+DEFAULT_PROFILE = "lean"
+
+# What the SPA shows instead of the grid for a category without products.
+EMPTY_STATE_TEXTS = ("No se encontraron productos", "No hay productos")
+
+WAIT_FOR_GRID_JS = """
+([xpath, emptyTexts]) => {
+    const el = document.evaluate(xpath, document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (el && el.textContent.includes("Cód:")) return true;
+    const root = document.getElementById("root");
+    return !!root && emptyTexts.some(t => root.textContent.includes(t));
+}
+"""
+
+WAIT_FOR_NEW_GRID_JS = """
+([xpath, previous]) => {
+    const el = document.evaluate(xpath, document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    return !!el && el.textContent.includes("Cód:") && el.textContent !== previous;
+}
+"""
+
+
+def get_profile(name=None):
+    name = name or os.getenv("MOBILEZONE_PROFILE") or DEFAULT_PROFILE
+    profile = dict(PROFILES.get(name, PROFILES[DEFAULT_PROFILE]))
+    profile["name"] = name if name in PROFILES else DEFAULT_PROFILE
+    profile["measure"] = os.getenv("MOBILEZONE_MEASURE", "").lower() in ("1", "true", "yes")
+    return profile
+
 
-async def get_category_urls(playwright, max_retries: int = 4):
+def is_tracker(url):
+    return any(host in url for host in TRACKER_HOSTS)
+
+
+async def apply_profile(ctx, profile, stats):
+    blocked_types = set(profile["block"])
+    block_trackers = profile["block_trackers"]
+
+    if blocked_types or block_trackers:
+        async def _route(route):
+            req = route.request
+            if req.resource_type in blocked_types or (block_trackers and is_tracker(req.url)):
+                stats["blocked"] += 1
+                await route.abort()
+            else:
+                # Hands the request to the capture route when one is set up.
+                await route.fallback()
+        await ctx.route("**/*", _route)
+
+    if profile["measure"]:
+        async def _finished(request):
+            try:
+                sizes = await request.sizes()
+                stats["bytes"] += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+                stats["requests"] += 1
+            except PlaywrightError:
+                pass
+        ctx.on("requestfinished", _finished)
+
+
+def new_stats():
+    return {"bytes": 0, "requests": 0, "blocked": 0}
+
+
+def get_limiter():
+    return host_limiter.get_limiter(BASE_URL, max_limit=MAX_CONCURRENT, max_rps=MAX_RPS)
+
+
+def observe_navigation(limiter, resp, started):
+    # resp is None when the SPA re-rendered without a document request.
+    if resp is None:
+        limiter.observe(200, time.monotonic() - started)
+    else:
+        limiter.observe(resp.status, time.monotonic() - started, resp.headers.get("retry-after"))
+
+async def get_category_urls(pool, max_retries: int = 4, profile=None):
+    profile = profile or get_profile()
+    limiter = get_limiter()
     for attempt in range(1, max_retries + 1):
-        browser = await playwright.chromium.launch(headless=True, args=browser_args)
-        ctx     = await browser.new_context(user_agent=USER_AGENT)
-        page    = await ctx.new_page()
         try:
-            await page.goto(BASE_URL, timeout=120_000)
-            print('page loaded')
-            links = await page.locator('xpath=//*[@id="root"]/div[2]/div[2]/div/div/div/div/a').all()
-            urls = set()
-            for a in links:
-                href = await a.get_attribute("href")
-                if href and href.startswith("/query/"):
-                    urls.add(urljoin(BASE_URL, href))
-            print(f"Discovered {len(urls)} categories.")
-            return list(urls)
+            async with pool.lease() as slot:
+                page = slot.page
+                wait_until = "domcontentloaded" if profile["targeted_waits"] else "load"
+                category_links = page.locator(f'xpath={CATEGORY_LINKS_XPATH}')
+                async with limiter:
+                    started = time.monotonic()
+                    resp = await slot.goto(BASE_URL, timeout=120_000, wait_until=wait_until)
+                    await category_links.first.wait_for(state="attached", timeout=60_000)
+                    observe_navigation(limiter, resp, started)
+                print('page loaded')
+                links = await category_links.all()
+                urls = set()
+                for a in links:
+                    href = await a.get_attribute("href")
+                    if href and href.startswith("/query/"):
+                        urls.add(urljoin(BASE_URL, href))
+                print(f"Discovered {len(urls)} categories.")
+                return list(urls)
         except PlaywrightError as e:
             print(f"get_category_urls failed (attempt {attempt}/{max_retries}): {e!r}")
             if attempt == max_retries:
                 raise
-            backoff = 2 ** (attempt - 1)
-            print(f"  retrying in {backoff}s…")
+            backoff = limiter.retry_delay(attempt - 1)
+            print(f"  retrying in {backoff:.1f}s…")
             await asyncio.sleep(backoff)
-        finally:
-            await page.close()
-            await ctx.close()
-            await browser.close()
-
-async def scrape_one_category(browser, url, sem, max_retries: int = 4):
-    async with sem:
-        for attempt in range(1, max_retries + 1):
-            ctx  = await browser.new_context(user_agent=USER_AGENT)
-            page = await ctx.new_page()
-            products = []
-            page_num = 1
-            current_url = url
-            try:
-                while True:
-                    print(f"[Cat] {current_url} — Page {page_num}")
+
+async def wait_for_grid(page, profile):
+    # Waits for the product grid, or for the empty-state message of a
+    # category without products, which is read as zero cards.
+    if profile["targeted_waits"]:
+        await page.wait_for_function(WAIT_FOR_GRID_JS, arg=[PRODUCT_GRID_XPATH, list(EMPTY_STATE_TEXTS)],
+                                     timeout=60_000)
+    else:
+        await page.wait_for_load_state('networkidle')
+
+
+async def wait_for_next_page(page, profile, previous_text):
+    if profile["targeted_waits"]:
+        await page.wait_for_function(WAIT_FOR_NEW_GRID_JS, arg=[PRODUCT_GRID_XPATH, previous_text],
+                                     timeout=60_000)
+    else:
+        await page.wait_for_load_state('networkidle')
+
+
+async def scrape_one_category(pool, url, max_retries: int = 4, profile=None, sink=None):
+    # With a sink, every grid page is awaited into it as it is read, then a
+    # {"done": True} marker, and an empty list is returned. A retried
+    # category re-sends its early pages; the consumer deduplicates by code.
+    profile = profile or get_profile()
+    limiter = get_limiter()
+    for attempt in range(1, max_retries + 1):
+        try:
+            async with pool.lease() as slot:
+                started = time.time()
+                stats = slot.state or new_stats()
+                before = dict(stats)
+                page = slot.page
+                products = []
+                count = 0
+                page_num = 1
+                current_url = url
+                wait_until = "domcontentloaded" if profile["targeted_waits"] else "load"
+                async with limiter:
+                    page_started = time.monotonic()
+                    resp = None
                     try:
-                        await page.goto(current_url, timeout=120_000)
+                        resp = await slot.goto(current_url, timeout=120_000, wait_until=wait_until)
                     except PlaywrightError as e:
                         if "net::ERR_ABORTED" in str(e):
                             print(f"  → Ignored ERR_ABORTED on {current_url}")
                         else:
                             raise
-
-                    await page.wait_for_load_state('networkidle')
-                    locator = page.locator('xpath=//*[@id="root"]/div[3]/div[1]/div[4]/div[2]/div')
+                    await wait_for_grid(page, profile)
+                    observe_navigation(limiter, resp, page_started)
+                metrics.observe("fetch_seconds", time.monotonic() - page_started, site=SITE_NAME)
+                while True:
+                    print(f"[Cat] {current_url} — Page {page_num}")
+                    locator = page.locator(f'xpath={PRODUCT_GRID_XPATH}')
                     blob = await locator.all_text_contents()
-
-                    for card in blob[0].split("Cód:"):
+                    parse_started = time.monotonic()
+                    page_products = []
+                    # No grid at all is an empty category.
+                    for card in (blob[0] if blob else "").split("Cód:"):
                         text = card.strip()
                         if not text:
                             continue
@@ -93,59 +236,163 @@ async def scrape_one_category(browser, url, sem, max_retries: int = 4):
                         price = float(prices[-1].replace(",", "")) if prices else None
 
                         if code and name:
-                            products.append({
+                            page_products.append({
                                 "code": code,
                                 "name": name,
                                 "price": price,
                                 "stock_status": "In Stock",
-                                "url": urljoin(BASE_URL, f"product/{code}")
+                                "url": urljoin(BASE_URL, f"product/{code}"),
+                                "category": url,
                             })
+                    metrics.observe("parse_seconds", time.monotonic() - parse_started, site=SITE_NAME)
+                    metrics.inc("items_parsed", len(page_products), site=SITE_NAME)
+                    count += len(page_products)
+                    if sink is None:
+                        products.extend(page_products)
+                    elif page_products:
+                        await sink(page_products)
 
-                    next_btn = page.locator('//*[@id="root"]/div[3]/div[1]/nav/ul/li[4]/button')
+                    # The next button re-renders the grid in place, so wait for
+                    # its content to change instead of reloading the page.
+                    next_btn = page.locator(NEXT_BUTTON_XPATH)
                     if await next_btn.count() and not await next_btn.is_disabled():
-                        await next_btn.click()
-                        page_num += 1
-                        await page.wait_for_load_state('networkidle')
+                        async with limiter:
+                            page_started = time.monotonic()
+                            await next_btn.click()
+                            slot.count_navigation()
+                            page_num += 1
+                            await wait_for_next_page(page, profile, blob[0] if blob else "")
+                            observe_navigation(limiter, None, page_started)
+                        metrics.observe("fetch_seconds", time.monotonic() - page_started, site=SITE_NAME)
                         current_url = page.url
                     else:
                         break
 
-                print(f"[Cat] Done {url}: {len(products)} products")
+                elapsed = time.time() - started
+                line = f"[Cat] Done {url}: {count} products in {elapsed:.1f}s"
+                downloaded = stats["bytes"] - before["bytes"] if profile["measure"] else None
+                metrics.add_stage("category", started, elapsed, site=SITE_NAME, category=url,
+                                  items=count, bytes=downloaded)
+                metrics.inc("requests", page_num, site=SITE_NAME)
+                if downloaded is not None:
+                    metrics.inc("bytes_downloaded", downloaded, site=SITE_NAME)
+                if profile["measure"]:
+                    line += (f", {(stats['bytes'] - before['bytes']) / 1024:.0f} KiB over"
+                             f" {stats['requests'] - before['requests']} requests"
+                             f" ({stats['blocked'] - before['blocked']} blocked, profile={profile['name']})")
+                print(line)
+                if sink is not None:
+                    await sink([{"done": True, "category": url, "pages": page_num}])
                 return products
 
-            except PlaywrightError as e:
-                if 'TargetClosedError' in e.__class__.__name__ or 'Target closed' in str(e):
-                    print(f"[Cat] attempt {attempt}/{max_retries} failed: {e!r}")
-                    if attempt == max_retries:
-                        raise
-                    backoff = 2 ** (attempt - 1)
-                    print(f"    retrying in {backoff}s…")
-                    await asyncio.sleep(backoff)
-                    continue
-                raise
+        except PlaywrightError as e:
+            if 'TargetClosedError' in e.__class__.__name__ or 'Target closed' in str(e):
+                print(f"[Cat] attempt {attempt}/{max_retries} failed: {e!r}")
+                if attempt == max_retries:
+                    raise
+                metrics.inc("retries", site=SITE_NAME)
+                backoff = limiter.retry_delay(attempt - 1)
+                print(f"    retrying in {backoff:.1f}s…")
+                await asyncio.sleep(backoff)
+                continue
+            raise
 
-            finally:
-                await page.close()
-                await ctx.close()
 
-async def main():
-    start = time.time()
-    async with async_playwright() as pw:
-        browser = await pw.chromium.launch(headless=True, args=browser_args)
-        sem     = asyncio.Semaphore(MAX_CONCURRENT)
+def create_pool(profile=None):
+    profile = profile or get_profile()
 
-        cats = await get_category_urls(pw)
+    async def _setup(ctx):
+        stats = new_stats()
+        archive = capture.from_env()
+        if archive is not None:
+            await capture.route_context(ctx, archive)
+        await apply_profile(ctx, profile, stats)
+        return stats
 
-        tasks = [
-            scrape_one_category(browser, cat_url, sem)
-            for cat_url in cats
-        ]
-        results = await asyncio.gather(*tasks)
+    return BrowserPool(size=MAX_CONCURRENT, launch_args=browser_args, user_agent=USER_AGENT,
+                       context_setup=_setup)
+
+
+def resolve_engine(engine=None):
+    engine = (engine or os.getenv("MOBILEZONE_ENGINE") or DEFAULT_ENGINE).lower()
+    if engine not in ENGINES:
+        print(f"[WARN] Unknown mobilezone engine '{engine}', using '{DEFAULT_ENGINE}'")
+        engine = DEFAULT_ENGINE
+    return engine
 
-        await browser.close()
+
+async def discover_categories(pool=None, engine=None, session=None):
+    # Category list only, for the adaptive scheduler. The browser engine
+    # needs a running pool; the api engine uses session or opens its own.
+    if resolve_engine(engine) == "api":
+        return await mobilezone_api.discover(session=session)
+    profile = get_profile()
+    own_pool = pool is None
+    if own_pool:
+        pool = create_pool(profile)
+    try:
+        if not await pool.health_check():
+            await pool.start()
+        with metrics.stage("discovery", site=SITE_NAME) as stage:
+            urls = await get_category_urls(pool, profile=profile)
+            stage["items"] = len(urls)
+        return urls
+    finally:
+        if own_pool:
+            await pool.close()
+
+
+async def main(pool=None, engine=None, categories=None, sink=None, session=None):
+    # categories restricts the run to those category URLs (the api engine
+    # also takes bare slugs); None discovers all of them. With a sink,
+    # products are streamed into it page by page instead of returned.
+    # session is only used by the api engine.
+    engine = resolve_engine(engine)
+    if engine == "api":
+        return await mobilezone_api.main(categories=categories, sink=sink, session=session)
+
+    # A caller-provided pool is left running so the browser stays warm for
+    # the next run; otherwise the pool lives for this call only.
+    start = time.time()
+    profile = get_profile()
+    own_pool = pool is None
+    if own_pool:
+        pool = create_pool(profile)
+    try:
+        if not await pool.health_check():
+            await pool.start()
+        if categories is not None:
+            cats = list(categories)
+        else:
+            with metrics.stage("discovery", site=SITE_NAME) as stage:
+                cats = await get_category_urls(pool, profile=profile)
+                stage["items"] = len(cats)
+        results = await asyncio.gather(*(
+            scrape_one_category(pool, cat_url, profile=profile, sink=sink)
+            for cat_url in cats
+        ), return_exceptions=True)
+        # One broken category is reported with a {"failed": True} marker so
+        # it can be retried alone; only a run where every category failed
+        # raises, for a retry of the whole site.
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        for i, (cat_url, r) in enumerate(zip(cats, results)):
+            if isinstance(r, BaseException):
+                print(f"[Cat] {cat_url} failed: {r!r}")
+                results[i] = [{"failed": True, "category": cat_url}]
+                if sink is not None:
+                    await sink(results[i])
+                    results[i] = []
+    finally:
+        if own_pool:
+            await pool.close()
+        else:
+            await pool.trim()
 
     all_products = [p for sub in results for p in sub]
     print(f"Finished scraping {len(all_products)} items in {time.time() - start:.1f}s")
+    print(f"Concurrency {get_limiter().summary()}")
     return all_products
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+import hashlib
+import re
+
+PAGE_NUM_BYTES_RE = re.compile(rb"[?&]page=(\d+)")
+
+
+def grid_fingerprint(content: bytes, grid_marker: bytes = b"producto",
+                     pagination_marker: bytes = b"paginaciones") -> str:
+    # Hashes the product grid and the pagination state only, so banners,
+    # tokens and timestamps elsewhere on the page do not count as changes.
+    start = content.find(grid_marker)
+    if start < 0:
+        return hashlib.sha1(content).hexdigest()
+    pag = content.find(pagination_marker, start)
+    h = hashlib.sha1(content[start:pag if pag >= 0 else len(content)])
+    if pag >= 0:
+        tail = content[pag:pag + 4096]
+        h.update(b"|last" if b"active-search" in tail else b"|more")
+        h.update(b"|" + b",".join(sorted(set(PAGE_NUM_BYTES_RE.findall(tail)))))
+    return h.hexdigest()
+
+
+class PageCache:
+    # Per-site view of the http_cache table for one run. Lookups only see
+    # entries whose products were persisted; new entries are staged and only
+    # become visible once committed after those products: process_scraped_data
+    # commits them in the same transaction as the products, StreamingDiff.finish
+    # once the site's last streamed batch has been written.
+    def __init__(self, db, site_name: str):
+        self.db = db
+        self.site_name = site_name
+        self.entries = db.get_page_cache(site_name) if db is not None else {}
+        self.staged = []
+        self.not_modified = 0
+        self.same_hash = 0
+        self.misses = 0
+
+    def conditional_headers(self, url: str) -> dict:
+        entry = self.entries.get(url)
+        headers = {}
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def lookup(self, url: str):
+        return self.entries.get(url)
+
+    def hit(self, url: str, not_modified: bool):
+        if not_modified:
+            self.not_modified += 1
+        else:
+            self.same_hash += 1
+        entry = self.entries[url]
+        return {"unchanged": True, "url": url, "codes": entry["codes"]}
+
+    def stage(self, url: str, headers, content_hash: str, is_last: bool, max_page: int, codes: list):
+        self.misses += 1
+        self.staged.append((url, headers.get("etag"), headers.get("last-modified"),
+                            content_hash, is_last, max_page, codes))
+
+    def flush(self) -> int:
+        if self.db is None or not self.staged:
+            return 0
+        n = self.db.stage_page_cache(self.site_name, self.staged)
+        self.staged = []
+        return n
+
+    def summary(self) -> str:
+        hits = self.not_modified + self.same_hash
+        total = hits + self.misses
+        ratio = hits / total if total else 0.0
+        return (f"page cache: {hits}/{total} unchanged ({ratio:.0%}; "
+                f"{self.not_modified} not modified, {self.same_hash} same content), {self.misses} parsed")
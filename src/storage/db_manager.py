@@ -1,10 +1,109 @@
 import sqlite3
+from contextlib import contextmanager
 from datetime import datetime, timezone
 import os
+import hashlib
+import json
+import re
 import threading
+import time
+
+from unidecode import unidecode
 
 DB_FILE = 'products.db'
 
+UPSERT_PRODUCT_SQL = """
+INSERT INTO products (site_name, product_code, name, url,
+                      last_price_usd, last_stock_status, category,
+                      first_seen_timestamp, last_seen_timestamp, changed_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(site_name, product_code) DO UPDATE SET
+    changed_at = CASE WHEN products.last_price_usd IS NOT excluded.last_price_usd
+                        OR products.last_stock_status IS NOT excluded.last_stock_status
+                        OR products.name IS NOT excluded.name
+                        OR products.is_tracked = 0
+                      THEN excluded.changed_at ELSE products.changed_at END,
+    name = excluded.name,
+    url = excluded.url,
+    last_price_usd = excluded.last_price_usd,
+    last_stock_status = excluded.last_stock_status,
+    category = COALESCE(excluded.category, products.category),
+    is_tracked = 1,
+    last_seen_timestamp = excluded.last_seen_timestamp;
+"""
+
+# Days of observations are rolled up into one row each, merging with the
+# row a previous batch already wrote for the same day. Values in SET see
+# the row as it was, so open_ts/close_ts pick open and close before moving.
+UPSERT_ROLLUP_SQL = """
+INSERT INTO observation_rollups (site_name, product_code, day, open, high, low, close,
+                                 open_ts, close_ts, samples, in_stock)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(site_name, product_code, day) DO UPDATE SET
+    open = CASE WHEN excluded.open_ts < open_ts THEN excluded.open ELSE open END,
+    close = CASE WHEN excluded.close_ts > close_ts THEN excluded.close ELSE close END,
+    high = COALESCE(MAX(high, excluded.high), high, excluded.high),
+    low = COALESCE(MIN(low, excluded.low), low, excluded.low),
+    open_ts = MIN(open_ts, excluded.open_ts),
+    close_ts = MAX(close_ts, excluded.close_ts),
+    samples = samples + excluded.samples,
+    in_stock = in_stock + excluded.in_stock;
+"""
+
+# Observations are kept one per product per this many seconds.
+OBSERVATION_BUCKET = 3600
+DAY = 86400
+
+_WORD = re.compile(r"\w+")
+
+
+def fold_name(name) -> str:
+    # What the search index stores and queries are matched against: ASCII
+    # transliteration, lower case.
+    return unidecode(name or "").lower()
+
+
+def fts_query(query: str) -> str:
+    # Each word of query as a quoted prefix term, all required, so user
+    # input cannot inject FTS5 syntax. Returns '' when query has no words.
+    return " AND ".join(f'"{w}"*' for w in _WORD.findall(fold_name(query)))
+
+
+def model_query(name: str) -> str:
+    # For matching one model across stores: words with a digit in them
+    # (model numbers, capacities) must all appear, the rest only rank.
+    words = _WORD.findall(fold_name(name))
+    model = [f'"{w}"' for w in words if any(c.isdigit() for c in w)]
+    other = [f'"{w}"' for w in words if not any(c.isdigit() for c in w)]
+    if not model:
+        return " OR ".join(other)
+    if not other:
+        return " AND ".join(model)
+    return " AND ".join(model) + " AND (" + " OR ".join(other) + ")"
+
+
+# What the differ needs of a stored product: its last state and, once
+# price_stats has been refreshed for it, what its price usually is.
+PRODUCT_STATE_COLUMNS = ("p.product_code, p.last_price_usd, p.last_stock_status, s.observations,"
+                         " s.low AS all_time_low, s.window_low, s.median AS typical_price")
+PRICE_STATS_JOIN = (" LEFT JOIN price_stats s"
+                    " ON s.site_name = p.site_name AND s.product_code = p.product_code")
+
+
+def outbox_key(chat_id, ts, message: str) -> str:
+    return hashlib.sha1(f"{chat_id}|{ts}|{message}".encode("utf-8")).hexdigest()
+
+
+def _to_epoch(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+
 class DBManager:
     
     def __init__(self, db_file: str = DB_FILE):
@@ -18,10 +117,58 @@ class DBManager:
         try:
             self.conn = sqlite3.connect(db_file, check_same_thread=False)
             self.conn.row_factory = sqlite3.Row
+            # Used by the products_fts triggers, so every connection that
+            # writes products needs it.
+            self.conn.create_function("fold_name", 1, fold_name, deterministic=True)
             print(f"[INFO] Connected to '{db_file}'")
         except sqlite3.Error as e:
             raise RuntimeError(f"Error connecting to database: {e}")
 
+    def record_run(self, run: dict, stages: list) -> int:
+        # run is RunMetrics.to_row(); stages are RunMetrics.stages.
+        row = dict(run, counters=json.dumps(run.get("counters") or {}),
+                   histograms=json.dumps(run.get("histograms") or {}))
+        with self.transaction() as cur:
+            cur.execute(
+                "INSERT INTO runs (kind, started_at, finished_at, duration, status, items, changed,"
+                " alerts_queued, alerts_sent, bytes, requests, retries, peak_rss_mb, counters, histograms)"
+                " VALUES (:kind, :started_at, :finished_at, :duration, :status, :items, :changed,"
+                " :alerts_queued, :alerts_sent, :bytes, :requests, :retries, :peak_rss_mb,"
+                " :counters, :histograms);",
+                row,
+            )
+            run_id = cur.lastrowid
+            cur.executemany(
+                "INSERT INTO run_stages (run_id, stage, site, category, started_at, duration, items, bytes)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+                ((run_id, s["stage"], s["site"], s["category"], s["started_at"], s["duration"],
+                  s["items"], s["bytes"]) for s in stages),
+            )
+        return run_id
+
+    def get_runs(self, limit: int = 20) -> list:
+        rows = self._execute(
+            "SELECT id, kind, started_at, duration, status, items, changed, alerts_queued, alerts_sent,"
+            " bytes, requests, retries, peak_rss_mb FROM runs ORDER BY id DESC LIMIT ?;",
+            (limit,), fetch='all')
+        return [dict(r) for r in rows]
+
+    def get_stage_summary(self, stage: str = "category", since: float = None, limit: int = 20) -> list:
+        # Slowest (site, category) pairs for a stage by mean duration.
+        rows = self._execute(
+            "SELECT site, category, COUNT(*) AS runs, AVG(duration) AS avg_duration,"
+            " MAX(duration) AS max_duration, AVG(items) AS avg_items, SUM(bytes) AS bytes"
+            " FROM run_stages WHERE stage = ? AND started_at >= ?"
+            " GROUP BY site, category ORDER BY avg_duration DESC LIMIT ?;",
+            (stage, since or 0, limit), fetch='all')
+        return [dict(r) for r in rows]
+
+    def optimize(self):
+        # Cheap periodic upkeep for long-lived connections: refreshes the
+        # planner statistics SQLite decides are stale.
+        with self._lock:
+            self.conn.execute("PRAGMA optimize;")
+
     def close_connection(self):
         if self.conn:
             self.conn.close()
@@ -42,7 +189,20 @@ class DBManager:
             cursor.close()
             return result
 
+    def _add_column(self, table: str, column: str, decl: str):
+        # For databases created before the column was added to the schema.
+        columns = {r["name"] for r in self._execute(f"PRAGMA table_info({table});", fetch='all')}
+        if column not in columns:
+            self._execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl};")
+
     def initialize_database(self):
+        # Incremental auto-vacuum lets the retention job hand freed pages
+        # back a few at a time. It is free to set before the first table is
+        # created; an existing database needs a full VACUUM to switch over,
+        # which is left to enable_incremental_vacuum().
+        if not self._execute("SELECT COUNT(*) FROM sqlite_master;", fetch='one')[0]:
+            self._execute("PRAGMA auto_vacuum = INCREMENTAL;")
+
         create_table = """
         CREATE TABLE IF NOT EXISTS products (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -55,12 +215,303 @@ class DBManager:
             is_tracked INTEGER DEFAULT 1,
             first_seen_timestamp TEXT NOT NULL,
             last_seen_timestamp TEXT NOT NULL,
+            category TEXT,
             UNIQUE(site_name, product_code)
         );
         """
         self._execute(create_table)
+        self._add_column("products", "category", "TEXT")
+        # Epoch seconds of the last change to name, price, stock or tracking,
+        # for readers that refresh incrementally.
+        self._add_column("products", "changed_at", "REAL")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_products_changed ON products(changed_at);")
+        # Delisting scans a site's tracked products per category.
+        self._execute("CREATE INDEX IF NOT EXISTS idx_products_tracked"
+                      " ON products(site_name, is_tracked, category);")
         print("[INFO] 'products' table ready.")
 
+        # Full-text index over folded product names, rowid = products.id.
+        # Triggers keep it in step with inserts and with updates that
+        # actually change a name, so the per-run upsert of unchanged
+        # products costs it nothing. A database created before the index
+        # existed is backfilled once.
+        had_fts = self._execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts';", fetch='one')
+        self._execute("CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+                      "name, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3');")
+        self._execute("CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN"
+                      " INSERT INTO products_fts (rowid, name) VALUES (new.id, fold_name(new.name)); END;")
+        self._execute("CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name ON products"
+                      " WHEN old.name IS NOT new.name BEGIN"
+                      " UPDATE products_fts SET name = fold_name(new.name) WHERE rowid = new.id; END;")
+        self._execute("CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN"
+                      " DELETE FROM products_fts WHERE rowid = old.id; END;")
+        if not had_fts:
+            self._execute("INSERT INTO products_fts (rowid, name) SELECT id, fold_name(name) FROM products;")
+        print("[INFO] 'products_fts' index ready.")
+
+        # One row per product per observed change. WITHOUT ROWID clusters rows
+        # by (site_name, product_code, ts), so a product's history is a single
+        # contiguous range scan even with tens of millions of rows.
+        create_history = """
+        CREATE TABLE IF NOT EXISTS price_history (
+            site_name TEXT NOT NULL,
+            product_code TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            price_usd REAL,
+            stock_status TEXT,
+            PRIMARY KEY (site_name, product_code, ts)
+        ) WITHOUT ROWID;
+        """
+        self._execute(create_history)
+        print("[INFO] 'price_history' table ready.")
+
+        # Alerts waiting for delivery. status moves pending -> sending -> sent,
+        # or to dead once max attempts are used up. For pending rows
+        # next_attempt_at is the retry time; for sending rows it is the lease
+        # expiry after which a crashed dispatcher's claim is taken over.
+        create_outbox = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            chat_id TEXT NOT NULL,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            sent_at REAL,
+            last_error TEXT
+        );
+        """
+        self._execute(create_outbox)
+        self._execute("CREATE INDEX IF NOT EXISTS idx_outbox_status_next"
+                      " ON outbox(status, next_attempt_at);")
+        print("[INFO] 'outbox' table ready.")
+
+        create_category_cache = """
+        CREATE TABLE IF NOT EXISTS category_cache (
+            site_name TEXT PRIMARY KEY,
+            urls TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        );
+        """
+        self._execute(create_category_cache)
+        print("[INFO] 'category_cache' table ready.")
+
+        # Validators and grid fingerprints per category page. pending_* holds
+        # what this run fetched; commit_page_cache() promotes it in the same
+        # transaction that persists the page's products.
+        create_http_cache = """
+        CREATE TABLE IF NOT EXISTS http_cache (
+            site_name TEXT NOT NULL,
+            url TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            is_last INTEGER,
+            max_page INTEGER,
+            codes TEXT,
+            pending_etag TEXT,
+            pending_last_modified TEXT,
+            pending_hash TEXT,
+            pending_is_last INTEGER,
+            pending_max_page INTEGER,
+            pending_codes TEXT,
+            updated_at REAL,
+            PRIMARY KEY (site_name, url)
+        ) WITHOUT ROWID;
+        """
+        self._execute(create_http_cache)
+        print("[INFO] 'http_cache' table ready.")
+
+        # Adaptive scheduler state per (site, category). changes and
+        # exposure_hours are exponentially decayed sums, so their ratio is a
+        # recent change rate; category_observations keeps every fetch result
+        # so the schedule can be replayed offline.
+        create_category_schedule = """
+        CREATE TABLE IF NOT EXISTS category_schedule (
+            site_name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            changes REAL NOT NULL DEFAULT 0,
+            exposure_hours REAL NOT NULL DEFAULT 0,
+            fetches INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            last_fetch_at REAL,
+            last_change_at REAL,
+            interval REAL,
+            next_due_at REAL,
+            PRIMARY KEY (site_name, category)
+        ) WITHOUT ROWID;
+        """
+        self._execute(create_category_schedule)
+        create_category_observations = """
+        CREATE TABLE IF NOT EXISTS category_observations (
+            site_name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            ts REAL NOT NULL,
+            changed INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (site_name, category, ts)
+        ) WITHOUT ROWID;
+        """
+        self._execute(create_category_observations)
+        print("[INFO] 'category_schedule' tables ready.")
+
+        # One row per scrape run with its headline numbers; counters and
+        # histograms hold the full metrics as JSON. run_stages has one row per
+        # timed stage (discovery, category, db_write, ...), so slow
+        # categories can be found with plain SQL.
+        create_runs = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            duration REAL,
+            status TEXT NOT NULL,
+            items INTEGER,
+            changed INTEGER,
+            alerts_queued INTEGER,
+            alerts_sent INTEGER,
+            bytes INTEGER,
+            requests INTEGER,
+            retries INTEGER,
+            peak_rss_mb REAL,
+            counters TEXT,
+            histograms TEXT
+        );
+        """
+        self._execute(create_runs)
+        create_run_stages = """
+        CREATE TABLE IF NOT EXISTS run_stages (
+            run_id INTEGER NOT NULL REFERENCES runs(id),
+            stage TEXT NOT NULL,
+            site TEXT,
+            category TEXT,
+            started_at REAL NOT NULL,
+            duration REAL NOT NULL,
+            items INTEGER,
+            bytes INTEGER
+        );
+        """
+        self._execute(create_run_stages)
+        self._execute("CREATE INDEX IF NOT EXISTS idx_run_stages_run ON run_stages(run_id);")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_run_stages_stage"
+                      " ON run_stages(stage, site, started_at);")
+        print("[INFO] 'runs' tables ready.")
+
+        # Categories the current run has fully fetched and persisted. Rows are
+        # written in the transaction that stores a category's last batch and
+        # cleared when a run finishes, so after a crash they say what a
+        # restarted run can skip. scrape_in_progress holds one row from the
+        # start of a run to its finish; a row found at the start of the next
+        # run means the previous one was interrupted.
+        create_checkpoints = """
+        CREATE TABLE IF NOT EXISTS scrape_checkpoints (
+            site_name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            pages INTEGER,
+            items INTEGER,
+            changed INTEGER,
+            completed_at REAL NOT NULL,
+            PRIMARY KEY (site_name, category)
+        ) WITHOUT ROWID;
+        """
+        self._execute(create_checkpoints)
+        create_in_progress = """
+        CREATE TABLE IF NOT EXISTS scrape_in_progress (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            started_at REAL NOT NULL
+        );
+        """
+        self._execute(create_in_progress)
+        print("[INFO] 'scrape_checkpoints' table ready.")
+
+        # Subscriber alert rules. NULL columns are conditions left unset;
+        # events is a comma-separated list (NULL for the default set).
+        create_alert_rules = """
+        CREATE TABLE IF NOT EXISTS alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            site_name TEXT,
+            product_code TEXT,
+            keywords TEXT,
+            max_price REAL,
+            min_drop_pct REAL,
+            events TEXT,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            created_at REAL NOT NULL
+        );
+        """
+        self._execute(create_alert_rules)
+        self._execute("CREATE INDEX IF NOT EXISTS idx_alert_rules_chat ON alert_rules(chat_id);")
+        print("[INFO] 'alert_rules' table ready.")
+
+        # Per-product statistics over price_history, recomputed by
+        # price_stats.refresh_price_stats() for the products that changed.
+        # flag says what the latest observation looked like: 'scrape_error',
+        # 'outlier' or NULL.
+        create_price_stats = """
+        CREATE TABLE IF NOT EXISTS price_stats (
+            site_name TEXT NOT NULL,
+            product_code TEXT NOT NULL,
+            observations INTEGER NOT NULL,
+            low REAL,
+            high REAL,
+            window_low REAL,
+            median REAL,
+            mad REAL,
+            volatility REAL,
+            last_price REAL,
+            last_ts INTEGER,
+            score REAL,
+            flag TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (site_name, product_code)
+        ) WITHOUT ROWID;
+        """
+        self._execute(create_price_stats)
+        print("[INFO] 'price_stats' table ready.")
+
+        # The price and stock of every product seen, one row per product per
+        # hour (the last observation in the hour wins). Raw rows are kept for
+        # the retention window and then compacted into observation_rollups.
+        create_observations = """
+        CREATE TABLE IF NOT EXISTS observations (
+            site_name TEXT NOT NULL,
+            product_code TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            price_usd REAL,
+            stock_status TEXT,
+            PRIMARY KEY (site_name, product_code, ts)
+        ) WITHOUT ROWID;
+        """
+        self._execute(create_observations)
+        print("[INFO] 'observations' table ready.")
+
+        # One row per product per UTC day of compacted observations: first,
+        # highest, lowest and last price, and how many samples (in_stock of
+        # them in stock). open_ts/close_ts let a day compacted over several
+        # batches merge in order.
+        create_rollups = """
+        CREATE TABLE IF NOT EXISTS observation_rollups (
+            site_name TEXT NOT NULL,
+            product_code TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            open_ts INTEGER NOT NULL,
+            close_ts INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            in_stock INTEGER NOT NULL,
+            PRIMARY KEY (site_name, product_code, day)
+        ) WITHOUT ROWID;
+        """
+        self._execute(create_rollups)
+        print("[INFO] 'observation_rollups' table ready.")
+
     def add_or_update_product(self,
                               site_name: str,
                               product_code: str,
@@ -71,22 +522,10 @@ class DBManager:
         now_iso = datetime.utcnow().replace(tzinfo=timezone.utc).isoformat()
 
         if sqlite3.sqlite_version_info >= (3, 24, 0):
-            query = """
-            INSERT INTO products (site_name, product_code, name, url,
-                                  last_price_usd, last_stock_status,
-                                  first_seen_timestamp, last_seen_timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(site_name, product_code) DO UPDATE SET
-                name = excluded.name,
-                url = excluded.url,
-                last_price_usd = excluded.last_price_usd,
-                last_stock_status = excluded.last_stock_status,
-                last_seen_timestamp = excluded.last_seen_timestamp;
-            """
             params = (site_name, product_code, name, url,
-                      price_usd, stock_status, now_iso, now_iso)
+                      price_usd, stock_status, None, now_iso, now_iso, time.time())
             try:
-                self._execute(query, params)
+                self._execute(UPSERT_PRODUCT_SQL, params)
                 return True
             except sqlite3.Error as e:
                 print(f"[ERROR] Upsert failed: {e}")
@@ -113,10 +552,701 @@ class DBManager:
                     print(f"[ERROR] Update on conflict failed: {e}")
                     return False
 
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            cursor = self.conn.cursor()
+            try:
+                yield cursor
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def bulk_upsert_products(self, site_name: str, rows: list, cursor=None) -> int:
+        # rows are (product_code, name, url, price_usd, stock_status, category)
+        # tuples; a None category keeps the stored one. Upserted products are
+        # tracked again if they had been delisted. Pass the cursor from
+        # transaction() to join a transaction already held.
+        if not rows:
+            return 0
+        if cursor is None:
+            with self.transaction() as cur:
+                return self.bulk_upsert_products(site_name, rows, cursor=cur)
+
+        now = time.time()
+        now_iso = datetime.fromtimestamp(now, timezone.utc).isoformat()
+        if sqlite3.sqlite_version_info >= (3, 24, 0):
+            cursor.executemany(
+                UPSERT_PRODUCT_SQL,
+                ((site_name, code, name, url, price, stock, category, now_iso, now_iso, now)
+                 for code, name, url, price, stock, category in rows),
+            )
+        else:
+            cursor.executemany(
+                "INSERT OR IGNORE INTO products (site_name, product_code, name, url,"
+                " last_price_usd, last_stock_status, category, first_seen_timestamp, last_seen_timestamp,"
+                " changed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((site_name, code, name, url, price, stock, category, now_iso, now_iso, now)
+                 for code, name, url, price, stock, category in rows),
+            )
+            cursor.executemany(
+                "UPDATE products SET changed_at = CASE WHEN last_price_usd IS NOT ?"
+                " OR last_stock_status IS NOT ? OR name IS NOT ? OR is_tracked = 0"
+                " THEN ? ELSE changed_at END, name = ?, url = ?, last_price_usd = ?,"
+                " last_stock_status = ?, category = COALESCE(?, category), is_tracked = 1,"
+                " last_seen_timestamp = ? WHERE site_name = ? AND product_code = ?",
+                ((price, stock, name, now, name, url, price, stock, category, now_iso, site_name, code)
+                 for code, name, url, price, stock, category in rows),
+            )
+        return len(rows)
+
     def get_product(self, site_name: str, product_code: str):
         query = "SELECT * FROM products WHERE site_name = ? AND product_code = ?;"
         return self._execute(query, (site_name, product_code), fetch='one')
 
+    def get_products_for_site(self, site_name: str, tracked_only: bool = False) -> dict:
+        query = (f"SELECT {PRODUCT_STATE_COLUMNS} FROM products p" + PRICE_STATS_JOIN
+                 + " WHERE p.site_name = ?")
+        if tracked_only:
+            query += " AND p.is_tracked = 1"
+        rows = self._execute(query + ";", (site_name,), fetch='all')
+        return {r["product_code"]: dict(r) for r in rows}
+
+    def delist_missing(self, site_name: str, seen_codes, categories, max_fraction: float = 0.5,
+                       min_guarded: int = 10, seen_before: float = None, cursor=None) -> tuple:
+        # Untracks the products of site_name filed under one of categories
+        # whose codes are not in seen_codes, as one set difference against
+        # temp tables. A category that would lose more than max_fraction of
+        # its tracked products (and at least min_guarded of them) is left
+        # alone, since that looks like a broken page rather than a clearance.
+        # With seen_before (epoch seconds), products last seen at or after it
+        # are kept too: a product that moved keeps its old category until its
+        # new one is fetched, so a run that did not cover the whole site
+        # cannot tell it from a delisted one yet.
+        # Returns (delisted rows, skipped categories).
+        if cursor is None:
+            with self.transaction() as cur:
+                return self.delist_missing(site_name, seen_codes, categories, max_fraction,
+                                           min_guarded, seen_before, cursor=cur)
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS seen_codes (product_code TEXT PRIMARY KEY);")
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS delist_categories (category TEXT PRIMARY KEY);")
+        cursor.execute("DELETE FROM seen_codes;")
+        cursor.execute("DELETE FROM delist_categories;")
+        cursor.executemany("INSERT OR IGNORE INTO seen_codes VALUES (?);", ((c,) for c in seen_codes))
+        cursor.executemany("INSERT OR IGNORE INTO delist_categories VALUES (?);",
+                           ((c,) for c in categories if c is not None))
+
+        missing = ("site_name = ? AND is_tracked = 1"
+                   " AND category IN (SELECT category FROM delist_categories)"
+                   " AND product_code NOT IN (SELECT product_code FROM seen_codes)")
+        params = (site_name,)
+        if seen_before is not None:
+            missing += " AND last_seen_timestamp < ?"
+            params += (datetime.fromtimestamp(seen_before, timezone.utc).isoformat(),)
+        cursor.execute(
+            "SELECT category, COUNT(*) FROM products WHERE " + missing + " GROUP BY category;", params)
+        gone = dict(cursor.fetchall())
+        skipped = []
+        if gone:
+            cursor.execute(
+                "SELECT category, COUNT(*) FROM products WHERE site_name = ? AND is_tracked = 1"
+                " AND category IN (SELECT category FROM delist_categories) GROUP BY category;",
+                (site_name,))
+            for category, tracked in cursor.fetchall():
+                n = gone.get(category, 0)
+                if n >= min_guarded and n > tracked * max_fraction:
+                    skipped.append(category)
+            cursor.executemany("DELETE FROM delist_categories WHERE category = ?;",
+                               ((c,) for c in skipped))
+
+        cursor.execute(
+            "SELECT product_code, name, url, last_price_usd, last_stock_status, category"
+            " FROM products WHERE " + missing + ";", params)
+        rows = [dict(r) for r in cursor.fetchall()]
+        if rows:
+            cursor.execute("UPDATE products SET is_tracked = 0, changed_at = ? WHERE " + missing + ";",
+                           (time.time(),) + params)
+        cursor.execute("DELETE FROM seen_codes;")
+        cursor.execute("DELETE FROM delist_categories;")
+        return rows, skipped
+
+    def get_products_changed_since(self, since: float = None) -> list:
+        # Products whose name, price, stock or tracking changed after since
+        # (epoch seconds), delisted ones included; None returns all. Writes
+        # take their timestamp inside the write transaction, so they commit
+        # in changed_at order and the newest value seen is a safe watermark.
+        query = ("SELECT site_name, product_code, name, url, last_price_usd, last_stock_status, category,"
+                 " is_tracked, changed_at FROM products")
+        if since is None:
+            return self._execute(query + ";", fetch='all')
+        return self._execute(query + " WHERE changed_at > ?;", (since,), fetch='all')
+
+    def search_products(self, query: str, site: str = None, in_stock: bool = None, limit: int = 20,
+                        exclude_site: str = None, match: str = None) -> list:
+        # Tracked products whose names contain words starting with every
+        # word of query, best bm25 rank first; the cost grows with the number
+        # of matches ranked. in_stock=True/False keeps only in- or
+        # out-of-stock ones. match is a prepared FTS5 expression used
+        # instead of query.
+        match = match or fts_query(query)
+        if not match:
+            return []
+        sql = ("SELECT p.site_name, p.product_code, p.name, p.url, p.last_price_usd, p.last_stock_status,"
+               " p.category, bm25(products_fts) AS rank"
+               " FROM products_fts JOIN products p ON p.id = products_fts.rowid"
+               " WHERE products_fts MATCH ? AND p.is_tracked = 1")
+        params = [match]
+        if site is not None:
+            sql += " AND p.site_name = ?"
+            params.append(site)
+        if exclude_site is not None:
+            sql += " AND p.site_name != ?"
+            params.append(exclude_site)
+        if in_stock is not None:
+            sql += " AND p.last_stock_status " + ("" if in_stock else "NOT ") + "LIKE '%in stock%'"
+        rows = self._execute(sql + " ORDER BY rank LIMIT ?;", (*params, limit), fetch='all')
+        return [dict(r) for r in rows]
+
+    def find_same_model(self, site_name: str, product_code: str, limit: int = 5) -> list:
+        # The closest-named products on other sites, for lining up one model
+        # across stores: same model numbers, ranked by the other words shared.
+        row = self.get_product(site_name, product_code)
+        if row is None:
+            return []
+        return self.search_products(None, limit=limit, exclude_site=site_name, match=model_query(row["name"]))
+
+    def get_products_by_codes(self, site_name: str, codes: list, chunk: int = 500) -> dict:
+        # Same shape as get_products_for_site, limited to the given codes, for
+        # diffing one streamed batch without loading the whole site.
+        codes = list(codes)
+        found = {}
+        for i in range(0, len(codes), chunk):
+            part = codes[i:i + chunk]
+            query = (f"SELECT {PRODUCT_STATE_COLUMNS} FROM products p" + PRICE_STATS_JOIN
+                     + f" WHERE p.site_name = ? AND p.product_code IN ({','.join('?' * len(part))});")
+            for r in self._execute(query, (site_name, *part), fetch='all'):
+                found[r["product_code"]] = dict(r)
+        return found
+
+    def append_price_history(self, site_name: str, rows: list, ts: int = None, cursor=None) -> int:
+        # rows are (product_code, price_usd, stock_status) tuples; ts is unix seconds.
+        if not rows:
+            return 0
+        if cursor is None:
+            with self.transaction() as cur:
+                return self.append_price_history(site_name, rows, ts=ts, cursor=cur)
+
+        ts = int(time.time()) if ts is None else int(ts)
+        cursor.executemany(
+            "INSERT OR REPLACE INTO price_history"
+            " (site_name, product_code, ts, price_usd, stock_status) VALUES (?, ?, ?, ?, ?)",
+            ((site_name, code, ts, price, stock) for code, price, stock in rows),
+        )
+        return len(rows)
+
+    def get_history(self, site_name: str, product_code: str, since=None) -> list:
+        query = ("SELECT ts, price_usd, stock_status FROM price_history"
+                 " WHERE site_name = ? AND product_code = ? AND ts >= ? ORDER BY ts;")
+        rows = self._execute(query, (site_name, product_code, _to_epoch(since)), fetch='all')
+        return [tuple(r) for r in rows]
+
+    def get_history_bulk(self, keys, since=None) -> dict:
+        # keys is an iterable of (site_name, product_code). Joining through a
+        # temp table keeps this one indexed query however many keys are asked for.
+        keys = list(dict.fromkeys(keys))
+        result = {k: [] for k in keys}
+        if not keys:
+            return result
+        with self.transaction() as cur:
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS history_keys"
+                        " (site_name TEXT NOT NULL, product_code TEXT NOT NULL)")
+            cur.execute("DELETE FROM history_keys")
+            cur.executemany("INSERT INTO history_keys VALUES (?, ?)", keys)
+            # CROSS JOIN pins history_keys as the outer loop so every key is a
+            # primary-key range lookup rather than a scan of price_history.
+            cur.execute(
+                "SELECT h.site_name, h.product_code, h.ts, h.price_usd, h.stock_status"
+                " FROM history_keys k CROSS JOIN price_history h"
+                " ON h.site_name = k.site_name AND h.product_code = k.product_code"
+                " WHERE h.ts >= ?",
+                (_to_epoch(since),),
+            )
+            for site_name, code, ts, price, stock in cur:
+                result[(site_name, code)].append((ts, price, stock))
+            cur.execute("DELETE FROM history_keys")
+        for series in result.values():
+            series.sort()
+        return result
+
+    def get_history_series(self, keys, since=None) -> list:
+        # (i, ts, price_usd) rows for keys[i] = (site_name, product_code),
+        # ordered by i then ts and all numeric, so they load straight into
+        # one array.
+        keys = list(keys)
+        if not keys:
+            return []
+        with self.transaction() as cur:
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS series_keys"
+                        " (i INTEGER PRIMARY KEY, site_name TEXT NOT NULL, product_code TEXT NOT NULL)")
+            cur.execute("DELETE FROM series_keys")
+            cur.executemany("INSERT INTO series_keys VALUES (?, ?, ?)",
+                            ((i, site, code) for i, (site, code) in enumerate(keys)))
+            cur.row_factory = None
+            cur.execute(
+                "SELECT k.i, h.ts, h.price_usd"
+                " FROM series_keys k CROSS JOIN price_history h"
+                " ON h.site_name = k.site_name AND h.product_code = k.product_code"
+                " WHERE h.ts >= ? ORDER BY k.i, h.ts",
+                (_to_epoch(since),),
+            )
+            rows = cur.fetchall()
+            cur.execute("DELETE FROM series_keys")
+        return rows
+
+    def store_price_stats(self, rows: list, cursor=None) -> int:
+        # rows are tuples in price_stats column order.
+        if not rows:
+            return 0
+        if cursor is None:
+            with self.transaction() as cur:
+                return self.store_price_stats(rows, cursor=cur)
+        cursor.executemany(
+            "INSERT OR REPLACE INTO price_stats (site_name, product_code, observations, low, high, window_low,"
+            " median, mad, volatility, last_price, last_ts, score, flag, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        return len(rows)
+
+    def get_price_stats(self, site_name: str = None, flag: str = None, limit: int = None) -> list:
+        query = "SELECT * FROM price_stats"
+        where, params = [], []
+        if site_name is not None:
+            where.append("site_name = ?")
+            params.append(site_name)
+        if flag is not None:
+            where.append("flag = ?")
+            params.append(flag)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY site_name, product_code"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return self._execute(query + ";", tuple(params), fetch='all')
+
+    def get_price_stats_watermark(self):
+        # When stats were last refreshed; products changed after it are stale.
+        row = self._execute("SELECT MAX(updated_at) AS at FROM price_stats;", fetch='one')
+        return row["at"] if row else None
+
+    def append_observations(self, site_name: str, rows: list, ts: int = None, cursor=None) -> int:
+        # rows are (product_code, price_usd, stock_status) tuples; ts is
+        # rounded down to its hour, replacing an earlier row for that hour.
+        if not rows:
+            return 0
+        if cursor is None:
+            with self.transaction() as cur:
+                return self.append_observations(site_name, rows, ts=ts, cursor=cur)
+
+        ts = int(time.time()) if ts is None else int(ts)
+        ts -= ts % OBSERVATION_BUCKET
+        cursor.executemany(
+            "INSERT OR REPLACE INTO observations (site_name, product_code, ts, price_usd, stock_status)"
+            " VALUES (?, ?, ?, ?, ?)",
+            ((site_name, code, ts, price, stock) for code, price, stock in rows),
+        )
+        return len(rows)
+
+    def append_observations_from_products(self, site_name: str, codes: list, ts: int = None, cursor=None,
+                                          chunk: int = 500) -> int:
+        # Observes products on pages that came back unchanged at their
+        # stored state. Rows already in the hour are left alone.
+        codes = list(codes)
+        if not codes:
+            return 0
+        if cursor is None:
+            with self.transaction() as cur:
+                return self.append_observations_from_products(site_name, codes, ts=ts, cursor=cur, chunk=chunk)
+
+        ts = int(time.time()) if ts is None else int(ts)
+        ts -= ts % OBSERVATION_BUCKET
+        for i in range(0, len(codes), chunk):
+            part = codes[i:i + chunk]
+            cursor.execute(
+                "INSERT OR IGNORE INTO observations (site_name, product_code, ts, price_usd, stock_status)"
+                " SELECT site_name, product_code, ?, last_price_usd, last_stock_status FROM products"
+                f" WHERE site_name = ? AND product_code IN ({','.join('?' * len(part))})",
+                (ts, site_name, *part),
+            )
+        return len(codes)
+
+    def get_observations(self, site_name: str, product_code: str, since=None) -> list:
+        query = ("SELECT ts, price_usd, stock_status FROM observations"
+                 " WHERE site_name = ? AND product_code = ? AND ts >= ? ORDER BY ts;")
+        rows = self._execute(query, (site_name, product_code, _to_epoch(since)), fetch='all')
+        return [tuple(r) for r in rows]
+
+    def get_observation_rollups(self, site_name: str, product_code: str, since=None) -> list:
+        query = ("SELECT day, open, high, low, close, samples, in_stock FROM observation_rollups"
+                 " WHERE site_name = ? AND product_code = ? AND day >= ? ORDER BY day;")
+        rows = self._execute(query, (site_name, product_code, _to_epoch(since)), fetch='all')
+        return [tuple(r) for r in rows]
+
+    def compact_observations(self, before: int, after: tuple = None, limit: int = 5000) -> tuple:
+        # One bounded step of compaction: up to limit observations older
+        # than before, in key order past after (a (site_name, product_code,
+        # ts) key), are merged into their daily rollups and deleted, in one
+        # transaction. Returns (observations, rollup rows, key to continue
+        # after), the key being None once nothing is left.
+        with self.transaction() as cur:
+            query = "SELECT site_name, product_code, ts, price_usd, stock_status FROM observations WHERE ts < ?"
+            params = (before,)
+            if after is not None:
+                query += " AND (site_name, product_code, ts) > (?, ?, ?)"
+                params += tuple(after)
+            cur.execute(query + " ORDER BY site_name, product_code, ts LIMIT ?;", params + (limit,))
+            rows = cur.fetchall()
+            if not rows:
+                return 0, 0, None
+
+            days = {}
+            for site_name, code, ts, price, stock in rows:
+                key = (site_name, code, ts - ts % DAY)
+                in_stock = int("in stock" in (stock or ""))
+                day = days.get(key)
+                if day is None:
+                    days[key] = [price, price, price, price, ts, ts, 1, in_stock]
+                    continue
+                if price is not None:
+                    day[1] = price if day[1] is None else max(day[1], price)
+                    day[2] = price if day[2] is None else min(day[2], price)
+                day[3] = price
+                day[5] = ts
+                day[6] += 1
+                day[7] += in_stock
+            cur.executemany(UPSERT_ROLLUP_SQL, ((*key, *day) for key, day in days.items()))
+
+            last = tuple(rows[-1][:3])
+            query = ("DELETE FROM observations WHERE ts < ?"
+                     " AND (site_name, product_code, ts) <= (?, ?, ?)")
+            params = (before, *last)
+            if after is not None:
+                query += " AND (site_name, product_code, ts) > (?, ?, ?)"
+                params += tuple(after)
+            cur.execute(query + ";", params)
+        return len(rows), len(days), (last if len(rows) == limit else None)
+
+    def storage_stats(self) -> dict:
+        # Size of the database file in bytes and how much of it is free pages.
+        with self._lock:
+            page_size = self.conn.execute("PRAGMA page_size;").fetchone()[0]
+            pages = self.conn.execute("PRAGMA page_count;").fetchone()[0]
+            free = self.conn.execute("PRAGMA freelist_count;").fetchone()[0]
+            mode = self.conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+        return {"bytes": pages * page_size, "free_bytes": free * page_size, "incremental": mode == 2}
+
+    def incremental_vacuum(self, pages: int = 0) -> int:
+        # Returns up to pages free pages (all of them for 0) to the
+        # filesystem. Returns how many were released.
+        with self._lock:
+            before = self.conn.execute("PRAGMA freelist_count;").fetchone()[0]
+            # execute() steps the pragma once, which frees a single page;
+            # executescript() runs it to completion.
+            self.conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            after = self.conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        return before - after
+
+    def enable_incremental_vacuum(self) -> bool:
+        # Switches a database created without incremental auto-vacuum over.
+        # This takes a full VACUUM, which rewrites the whole file and holds
+        # the connection until it is done. Returns False if already switched.
+        if self._execute("PRAGMA auto_vacuum;", fetch='one')[0] == 2:
+            return False
+        self._execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        self._execute("VACUUM;")
+        return True
+
+    def enqueue_outbox(self, chat_id: str, messages: list, ts: float = None, cursor=None) -> int:
+        if not messages:
+            return 0
+        if cursor is None:
+            with self.transaction() as cur:
+                return self.enqueue_outbox(chat_id, messages, ts=ts, cursor=cur)
+
+        ts = time.time() if ts is None else ts
+        before = self.conn.total_changes
+        cursor.executemany(
+            "INSERT OR IGNORE INTO outbox (idempotency_key, chat_id, message,"
+            " next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            ((outbox_key(chat_id, ts, m), str(chat_id), m, ts, ts) for m in messages),
+        )
+        return self.conn.total_changes - before
+
+    def claim_outbox(self, limit: int = 100, lease_seconds: float = 300) -> list:
+        now = time.time()
+        with self.transaction() as cur:
+            cur.execute(
+                "SELECT id, chat_id, message, attempts, created_at FROM outbox"
+                " WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?"
+                " ORDER BY id LIMIT ?",
+                (now, limit),
+            )
+            rows = [dict(r) for r in cur.fetchall()]
+            cur.executemany(
+                "UPDATE outbox SET status = 'sending', next_attempt_at = ? WHERE id = ?",
+                ((now + lease_seconds, r["id"]) for r in rows),
+            )
+        return rows
+
+    def mark_outbox_sent(self, ids: list) -> int:
+        now = time.time()
+        with self.transaction() as cur:
+            cur.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                ((now, i) for i in ids),
+            )
+        return len(ids)
+
+    def mark_outbox_failed(self, ids: list, error: str, max_attempts: int = 5,
+                           retry_delay: float = 60) -> int:
+        # Retries back off exponentially; rows that used their last attempt
+        # are dead-lettered and kept for inspection.
+        now = time.time()
+        with self.transaction() as cur:
+            cur.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ?,"
+                " status = CASE WHEN attempts + 1 >= ? THEN 'dead' ELSE 'pending' END,"
+                " next_attempt_at = ? + ? * (1 << MIN(attempts, 10))"
+                " WHERE id = ?",
+                ((error, max_attempts, now, retry_delay, i) for i in ids),
+            )
+            cur.execute("SELECT COUNT(*) FROM outbox WHERE status = 'dead' AND id IN (%s)"
+                        % ",".join("?" * len(ids)), ids)
+            return cur.fetchone()[0]
+
+    def release_outbox(self, ids: list, delay: float = 0) -> int:
+        with self.transaction() as cur:
+            cur.executemany(
+                "UPDATE outbox SET status = 'pending', next_attempt_at = ? WHERE id = ?",
+                ((time.time() + delay, i) for i in ids),
+            )
+        return len(ids)
+
+    def outbox_stats(self, window_seconds: float = 3600) -> dict:
+        now = time.time()
+        counts = {r["status"]: r["n"] for r in self._execute(
+            "SELECT status, COUNT(*) AS n FROM outbox GROUP BY status;", fetch='all')}
+        oldest = self._execute(
+            "SELECT MIN(created_at) FROM outbox WHERE status IN ('pending', 'sending');",
+            fetch='one')[0]
+        latency = self._execute(
+            "SELECT AVG(sent_at - created_at), MAX(sent_at - created_at) FROM outbox"
+            " WHERE status = 'sent' AND sent_at >= ?;", (now - window_seconds,), fetch='one')
+        return {
+            "pending": counts.get("pending", 0) + counts.get("sending", 0),
+            "sent": counts.get("sent", 0),
+            "dead": counts.get("dead", 0),
+            "oldest_pending_age": now - oldest if oldest is not None else 0.0,
+            "avg_latency": latency[0] or 0.0,
+            "max_latency": latency[1] or 0.0,
+        }
+
+    def get_cached_categories(self, site_name: str, max_age: float = None):
+        row = self._execute("SELECT urls, fetched_at FROM category_cache WHERE site_name = ?;",
+                            (site_name,), fetch='one')
+        if not row:
+            return None
+        if max_age is not None and time.time() - row["fetched_at"] > max_age:
+            return None
+        return json.loads(row["urls"])
+
+    def store_cached_categories(self, site_name: str, urls: list) -> int:
+        query = ("INSERT INTO category_cache (site_name, urls, fetched_at) VALUES (?, ?, ?)"
+                 " ON CONFLICT(site_name) DO UPDATE SET urls = excluded.urls,"
+                 " fetched_at = excluded.fetched_at;")
+        return self._execute(query, (site_name, json.dumps(urls), time.time()))
+
+    def get_page_cache(self, site_name: str) -> dict:
+        rows = self._execute(
+            "SELECT url, etag, last_modified, content_hash, is_last, max_page, codes"
+            " FROM http_cache WHERE site_name = ? AND content_hash IS NOT NULL;",
+            (site_name,), fetch='all')
+        return {
+            r["url"]: {
+                "etag": r["etag"],
+                "last_modified": r["last_modified"],
+                "content_hash": r["content_hash"],
+                "is_last": bool(r["is_last"]),
+                "max_page": r["max_page"] or 0,
+                "codes": json.loads(r["codes"] or "[]"),
+            }
+            for r in rows
+        }
+
+    def stage_page_cache(self, site_name: str, rows: list) -> int:
+        # rows are (url, etag, last_modified, content_hash, is_last, max_page, codes).
+        now = time.time()
+        with self.transaction() as cur:
+            cur.executemany(
+                "INSERT INTO http_cache (site_name, url, pending_etag, pending_last_modified,"
+                " pending_hash, pending_is_last, pending_max_page, pending_codes, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(site_name, url) DO UPDATE SET"
+                " pending_etag = excluded.pending_etag,"
+                " pending_last_modified = excluded.pending_last_modified,"
+                " pending_hash = excluded.pending_hash,"
+                " pending_is_last = excluded.pending_is_last,"
+                " pending_max_page = excluded.pending_max_page,"
+                " pending_codes = excluded.pending_codes,"
+                " updated_at = excluded.updated_at;",
+                ((site_name, url, etag, last_modified, content_hash, int(bool(is_last)),
+                  max_page, json.dumps(codes), now)
+                 for url, etag, last_modified, content_hash, is_last, max_page, codes in rows),
+            )
+        return len(rows)
+
+    def commit_page_cache(self, site_name: str, cursor=None) -> int:
+        if cursor is None:
+            with self.transaction() as cur:
+                return self.commit_page_cache(site_name, cursor=cur)
+        cursor.execute(
+            "UPDATE http_cache SET etag = pending_etag, last_modified = pending_last_modified,"
+            " content_hash = pending_hash, is_last = pending_is_last,"
+            " max_page = pending_max_page, codes = pending_codes,"
+            " pending_etag = NULL, pending_last_modified = NULL, pending_hash = NULL,"
+            " pending_is_last = NULL, pending_max_page = NULL, pending_codes = NULL"
+            " WHERE site_name = ? AND pending_hash IS NOT NULL;",
+            (site_name,),
+        )
+        return cursor.rowcount
+
+    def get_category_schedule(self) -> list:
+        rows = self._execute(
+            "SELECT site_name, category, changes, exposure_hours, fetches, failures,"
+            " last_fetch_at, last_change_at, interval, next_due_at FROM category_schedule;",
+            fetch='all')
+        return [dict(r) for r in rows]
+
+    def save_category_schedule(self, rows: list, observations: list = ()) -> int:
+        # rows are dicts shaped like get_category_schedule(); observations are
+        # (site_name, category, ts, changed, total).
+        with self.transaction() as cur:
+            cur.executemany(
+                "INSERT OR REPLACE INTO category_schedule (site_name, category, changes,"
+                " exposure_hours, fetches, failures, last_fetch_at, last_change_at, interval,"
+                " next_due_at) VALUES (:site_name, :category, :changes, :exposure_hours,"
+                " :fetches, :failures, :last_fetch_at, :last_change_at, :interval, :next_due_at);",
+                rows,
+            )
+            cur.executemany(
+                "INSERT OR REPLACE INTO category_observations (site_name, category, ts, changed, total)"
+                " VALUES (?, ?, ?, ?, ?);",
+                observations,
+            )
+        return len(rows)
+
+    def delete_category_schedule(self, site_name: str, keep: list) -> int:
+        # Drops categories of site_name that discovery no longer returns.
+        with self.transaction() as cur:
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS keep_categories (category TEXT PRIMARY KEY);")
+            cur.execute("DELETE FROM keep_categories;")
+            cur.executemany("INSERT OR IGNORE INTO keep_categories VALUES (?);", ((c,) for c in keep))
+            cur.execute(
+                "DELETE FROM category_schedule WHERE site_name = ?"
+                " AND category NOT IN (SELECT category FROM keep_categories);",
+                (site_name,))
+            return cur.rowcount
+
+    def get_category_observations(self, site_name: str = None) -> list:
+        query = "SELECT site_name, category, ts, changed, total FROM category_observations"
+        if site_name is None:
+            return self._execute(query + " ORDER BY ts;", fetch='all')
+        return self._execute(query + " WHERE site_name = ? ORDER BY ts;", (site_name,), fetch='all')
+
+    def store_checkpoints(self, site_name: str, rows: list, cursor=None) -> int:
+        # rows are (category, pages, items, changed).
+        if not rows:
+            return 0
+        if cursor is None:
+            with self.transaction() as cur:
+                return self.store_checkpoints(site_name, rows, cursor=cur)
+        now = time.time()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO scrape_checkpoints"
+            " (site_name, category, pages, items, changed, completed_at) VALUES (?, ?, ?, ?, ?, ?);",
+            ((site_name, category, pages, items, changed, now) for category, pages, items, changed in rows),
+        )
+        return len(rows)
+
+    def get_checkpoints(self, max_age: float = None) -> dict:
+        # {site_name: {category: {"pages", "items", "changed"}}}, ignoring
+        # checkpoints older than max_age seconds.
+        since = time.time() - max_age if max_age is not None else 0
+        rows = self._execute(
+            "SELECT site_name, category, pages, items, changed FROM scrape_checkpoints"
+            " WHERE completed_at >= ?;", (since,), fetch='all')
+        found = {}
+        for r in rows:
+            found.setdefault(r["site_name"], {})[r["category"]] = {
+                "pages": r["pages"], "items": r["items"], "changed": r["changed"]}
+        return found
+
+    def begin_checkpointed_run(self) -> bool:
+        # Marks a scrape run as in progress and returns whether the previous
+        # one was interrupted, i.e. never reached finish_checkpointed_run().
+        # Its checkpoints are kept for resuming; any others are dropped.
+        with self.transaction() as cur:
+            cur.execute("SELECT started_at FROM scrape_in_progress;")
+            interrupted = cur.fetchone() is not None
+            if not interrupted:
+                cur.execute("DELETE FROM scrape_checkpoints;")
+            cur.execute("INSERT OR REPLACE INTO scrape_in_progress (id, started_at) VALUES (1, ?);",
+                        (time.time(),))
+        return interrupted
+
+    def finish_checkpointed_run(self) -> int:
+        # Clears the in-progress mark and every checkpoint, those of sites
+        # that failed included. Returns the number of checkpoints cleared.
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM scrape_in_progress;")
+            cur.execute("DELETE FROM scrape_checkpoints;")
+            return cur.rowcount
+
+    def add_alert_rule(self, chat_id: str, site: str = None, code: str = None, keywords: str = None,
+                       max_price: float = None, min_drop_pct: float = None, events: str = None) -> int:
+        with self.transaction() as cur:
+            cur.execute(
+                "INSERT INTO alert_rules (chat_id, site_name, product_code, keywords, max_price,"
+                " min_drop_pct, events, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+                (str(chat_id), site, code, keywords, max_price, min_drop_pct, events, time.time()),
+            )
+            return cur.lastrowid
+
+    def remove_alert_rule(self, rule_id: int, chat_id: str = None) -> int:
+        # With chat_id, only removes the rule if it belongs to that chat.
+        with self.transaction() as cur:
+            if chat_id is None:
+                cur.execute("DELETE FROM alert_rules WHERE id = ?;", (rule_id,))
+            else:
+                cur.execute("DELETE FROM alert_rules WHERE id = ? AND chat_id = ?;", (rule_id, str(chat_id)))
+            return cur.rowcount
+
+    def get_alert_rules(self, chat_id: str = None, enabled_only: bool = True) -> list:
+        query = ("SELECT id, chat_id, site_name, product_code, keywords, max_price, min_drop_pct, events, enabled"
+                 " FROM alert_rules")
+        where, params = [], []
+        if enabled_only:
+            where.append("enabled = 1")
+        if chat_id is not None:
+            where.append("chat_id = ?")
+            params.append(str(chat_id))
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        return self._execute(query + " ORDER BY id;", tuple(params), fetch='all')
+
     def update_product_tracking(self,
                                 site_name: str,
                                 product_code: str,
@@ -149,4 +1279,107 @@ if __name__ == '__main__':
         prod2 = db.get_product('site', 'code1')
         print(dict(prod2))
 
+        print("Testing bulk upsert...")
+        assert db.bulk_upsert_products('site', [('code1', 'Name3', 'url3', 8.5, 'OK', 'cat'),
+                                                ('code2', 'Other', 'url4', 20.0, 'OK', 'cat')]) == 2
+        print(db.get_products_for_site('site'))
+
+        print("Testing delisting...")
+        assert db.delist_missing('site', ['code1'], ['other']) == ([], [])
+        rows, skipped = db.delist_missing('site', ['code1'], ['cat'])
+        assert [r['product_code'] for r in rows] == ['code2'] and not skipped
+        assert list(db.get_products_for_site('site', tracked_only=True)) == ['code1']
+        db.bulk_upsert_products('site', [('code2', 'Other', 'url4', 20.0, 'OK', None)])
+        assert db.get_product('site', 'code2')['is_tracked'] == 1
+        assert db.get_product('site', 'code2')['category'] == 'cat'
+        assert db.delist_missing('site', [], ['cat'], min_guarded=1)[1] == ['cat']
+        # code2 was just seen (as if in another category), so a grace period keeps it.
+        assert db.delist_missing('site', ['code1'], ['cat'], seen_before=time.time() - 3600) == ([], [])
+        assert db.get_product('site', 'code2')['is_tracked'] == 1
+
+        print("Testing price history...")
+        db.append_price_history('site', [('code1', 8.5, 'OK')], ts=1000)
+        db.append_price_history('site', [('code1', 7.5, 'OK'), ('code2', 20.0, 'OK')], ts=2000)
+        assert db.get_history('site', 'code1') == [(1000, 8.5, 'OK'), (2000, 7.5, 'OK')]
+        assert db.get_history('site', 'code1', since=1500) == [(2000, 7.5, 'OK')]
+        print(db.get_history_bulk([('site', 'code1'), ('site', 'code2'), ('site', 'none')]))
+        assert db.get_history_series([('site', 'none'), ('site', 'code1')]) == [(1, 1000, 8.5), (1, 2000, 7.5)]
+
+        print("Testing price stats...")
+        assert db.get_price_stats_watermark() is None
+        db.store_price_stats([('site', 'code1', 2, 7.5, 8.5, 7.5, 8.0, 0.5, 0.1, 7.5, 2000, 1.0, None, 3000.0)])
+        assert db.get_products_by_codes('site', ['code1'])['code1']['typical_price'] == 8.0
+        assert db.get_products_for_site('site')['code2']['typical_price'] is None
+        assert db.get_price_stats_watermark() == 3000.0 and not db.get_price_stats(flag='outlier')
+
+        print("Testing observations...")
+        db.append_observations('site', [('code1', 9.0, 'in stock')], ts=DAY + 100)
+        db.append_observations('site', [('code1', 8.0, 'in stock')], ts=DAY + 200)
+        db.append_observations('site', [('code1', 12.0, 'out of stock')], ts=DAY + 7200)
+        db.append_observations_from_products('site', ['code1', 'code2'], ts=DAY + 7300)
+        db.append_observations('site', [('code1', 7.0, 'in stock')], ts=3 * DAY)
+        assert db.get_observations('site', 'code1') == [(DAY, 8.0, 'in stock'), (DAY + 7200, 12.0, 'out of stock'),
+                                                        (3 * DAY, 7.0, 'in stock')]
+        assert db.compact_observations(2 * DAY, limit=2) == (2, 1, ('site', 'code1', DAY + 7200))
+        assert db.compact_observations(2 * DAY, after=('site', 'code1', DAY + 7200), limit=2) == (1, 1, None)
+        assert db.get_observation_rollups('site', 'code1') == [(DAY, 8.0, 12.0, 8.0, 12.0, 2, 1)]
+        assert db.get_observation_rollups('site', 'code2')[0][1] == 20.0
+        assert db.get_observations('site', 'code1') == [(3 * DAY, 7.0, 'in stock')]
+        db.incremental_vacuum()
+        assert db.storage_stats()['free_bytes'] == 0
+        assert db.storage_stats()['incremental'] and not db.enable_incremental_vacuum()
+
+        print("Testing checkpoints...")
+        db.store_checkpoints('site', [('cat', 3, 40, 2)])
+        assert db.get_checkpoints() == {'site': {'cat': {'pages': 3, 'items': 40, 'changed': 2}}}
+        assert db.get_checkpoints(max_age=-1) == {}
+        # Left by a run that finished without clearing them, so not resumed.
+        assert not db.begin_checkpointed_run()
+        assert db.get_checkpoints() == {}
+        db.store_checkpoints('site', [('cat', 3, 40, 2)])
+        # The run above never finished: the next one resumes from its checkpoints.
+        assert db.begin_checkpointed_run()
+        assert list(db.get_checkpoints()) == ['site']
+        db.store_checkpoints('other', [('cat', 1, 5, 0)])
+        assert db.finish_checkpointed_run() == 2
+        assert db.get_checkpoints() == {}
+        assert not db.begin_checkpointed_run()
+        db.finish_checkpointed_run()
+
+        print("Testing alert rules...")
+        rule_id = db.add_alert_rule('chat', site='site', keywords='iphone 15', max_price=900)
+        assert [r['id'] for r in db.get_alert_rules(chat_id='chat')] == [rule_id]
+        assert db.remove_alert_rule(rule_id, chat_id='other') == 0
+        assert db.remove_alert_rule(rule_id) == 1 and not db.get_alert_rules()
+
+        print("Testing product search...")
+        db.bulk_upsert_products('other', [('x1', 'Cámara Canon EOS R50', 'u', 700.0, 'in stock', None),
+                                          ('x2', 'Canon EOS R50 Kit 18-45', 'u', 820.0, 'out of stock', None)])
+        assert [r['product_code'] for r in db.search_products('camara can')] == ['x1']
+        assert [r['product_code'] for r in db.search_products('eos r50', in_stock=False)] == ['x2']
+        assert db.search_products('"); DROP TABLE products; --') == []
+        db.bulk_upsert_products('other', [('x1', 'Camera Nikon Z50', 'u', 650.0, 'in stock', None)])
+        assert db.search_products('canon', site='other')[0]['product_code'] == 'x2'
+        db.bulk_upsert_products('site2', [('y1', 'Nikon Z50 Camera Body', 'u', 600.0, 'in stock', None)])
+        assert [r['product_code'] for r in db.find_same_model('site2', 'y1')] == ['x1']
+
+        print("Testing outbox...")
+        assert db.enqueue_outbox('chat', ['m1', 'm2'], ts=1) == 2
+        assert db.enqueue_outbox('chat', ['m1'], ts=1) == 0
+        rows = db.claim_outbox()
+        assert [r['message'] for r in rows] == ['m1', 'm2'] and not db.claim_outbox()
+        db.mark_outbox_sent([rows[0]['id']])
+        assert db.mark_outbox_failed([rows[1]['id']], 'boom', max_attempts=1) == 1
+        print(db.outbox_stats())
+
+    if os.path.exists(test_db): os.remove(test_db)
+
+    print("Testing incremental vacuum switch...")
+    with sqlite3.connect(test_db) as conn:
+        conn.execute("CREATE TABLE legacy (x);")
+    conn.close()
+    with DBManager(db_file=test_db) as db:
+        db.initialize_database()
+        assert not db.storage_stats()['incremental']
+        assert db.enable_incremental_vacuum() and db.storage_stats()['incremental']
     if os.path.exists(test_db): os.remove(test_db)
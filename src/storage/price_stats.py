@@ -0,0 +1,180 @@
+import time
+
+import numpy as np
+
+DAY = 86400
+# Lows are also reported over this trailing window ("lowest in 30 days").
+WINDOW_DAYS = 30
+# A product's typical price is the median of its last this many observations.
+REF_POINTS = 20
+# A price this many times above or below the typical one is taken for a
+# scrape error: a lost decimal point, cents read as units, a wrong currency.
+ERROR_RATIO = 5.0
+# Robust z-score from which a new price is flagged as an outlier.
+OUTLIER_Z = 3.5
+# With fewer observations than this there is no typical price to judge by.
+MIN_POINTS = 3
+# Lower bound on the spread behind z-scores, as a fraction of the typical
+# price, so a product whose price never moved does not score every change
+# as infinitely unusual.
+MIN_SPREAD = 0.01
+# Products per history read and stats write during a refresh.
+REFRESH_CHUNK = 5000
+
+FLAGS = (None, "scrape_error", "outlier")
+
+
+def _group_median(values, groups, n):
+    # Median of values per group id in 0..n-1; NaN where a group is empty.
+    counts = np.bincount(groups, minlength=n)
+    if not len(values):
+        return np.full(n, np.nan)
+    # One float sort key instead of lexsort((values, groups)), several
+    # times faster: the group, spaced wider than the values span.
+    span = float(values.max() - values.min()) + 1.0
+    ordered = values[np.argsort(groups * span + (values - values.min()))]
+    first = np.cumsum(counts) - counts
+    top = len(ordered) - 1
+    lo = np.minimum(first + np.maximum(counts - 1, 0) // 2, top)
+    hi = np.minimum(first + counts // 2, top)
+    return np.where(counts > 0, (ordered[lo] + ordered[hi]) / 2, np.nan)
+
+
+def _group_reduce(ufunc, values, mask, starts, empty):
+    # ufunc over the masked values of each group; NaN where none are left.
+    out = ufunc.reduceat(np.where(mask, values, empty), starts)
+    return np.where(out == empty, np.nan, out)
+
+
+def compute_stats(idx, ts, price, now=None, window_days=WINDOW_DAYS) -> tuple:
+    # idx, ts and price are parallel arrays of observations sorted by idx,
+    # then ts, where idx says which product each belongs to. Returns
+    # (products, stats): the distinct idx values and a dict of arrays with
+    # one value per product. Observations more than ERROR_RATIO off the
+    # product's median are left out of the lows, highs and volatility.
+    now = time.time() if now is None else now
+    ok = np.isfinite(price) & (price > 0)
+    idx, ts, price = idx[ok], ts[ok], price[ok]
+    products, groups = np.unique(idx, return_inverse=True)
+    n = len(products)
+    counts = np.bincount(groups, minlength=n)
+    starts = np.cumsum(counts) - counts
+    last = starts + counts - 1
+    # 0 for each product's latest observation, 1 for the one before, ...
+    from_end = np.repeat(last, counts) - np.arange(len(price))
+
+    ratio = price / _group_median(price, groups, n)[groups]
+    clean = (ratio < ERROR_RATIO) & (ratio > 1 / ERROR_RATIO)
+
+    # A price is in effect from its observation until the next one, so the
+    # one that was current when the window opened counts towards its low.
+    until = np.append(ts[1:], np.inf)
+    until[last] = np.inf
+    in_window = clean & (until > now - window_days * DAY)
+
+    # Typical price and spread as of now, for judging the next change.
+    recent = clean & (from_end < REF_POINTS)
+    median = _group_median(price[recent], groups[recent], n)
+    mad = _group_median(np.abs(price[recent] - median[groups[recent]]), groups[recent], n)
+
+    # The latest observation against the ones before it.
+    prior = clean & (from_end >= 1) & (from_end <= REF_POINTS)
+    prior_n = np.bincount(groups[prior], minlength=n)
+    prior_median = _group_median(price[prior], groups[prior], n)
+    prior_mad = _group_median(np.abs(price[prior] - prior_median[groups[prior]]), groups[prior], n)
+    latest = price[last]
+    judged = prior_n >= MIN_POINTS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        spread = np.maximum(1.4826 * prior_mad, MIN_SPREAD * prior_median)
+        score = np.where(judged, np.abs(latest - prior_median) / spread, np.nan)
+        off = latest / prior_median
+    flag = np.zeros(n, dtype=np.int8)
+    flag[judged & (score >= OUTLIER_Z)] = 2
+    flag[judged & ((off >= ERROR_RATIO) | (off <= 1 / ERROR_RATIO))] = 1
+
+    # Standard deviation of the log change from one observation to the next.
+    cp, cg = price[clean], groups[clean]
+    same = cg[1:] == cg[:-1]
+    change = np.diff(np.log(cp))[same]
+    rg = cg[1:][same]
+    changes = np.bincount(rg, minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(rg, weights=change, minlength=n) / changes
+        var = np.bincount(rg, weights=change * change, minlength=n) / changes - mean * mean
+    volatility = np.where(changes >= 2, np.sqrt(np.maximum(var, 0.0)), np.nan)
+
+    return products, {
+        "observations": counts,
+        "low": _group_reduce(np.minimum, price, clean, starts, np.inf),
+        "high": _group_reduce(np.maximum, price, clean, starts, -np.inf),
+        "window_low": _group_reduce(np.minimum, price, in_window, starts, np.inf),
+        "median": median,
+        "mad": mad,
+        "volatility": volatility,
+        "last_price": latest,
+        "last_ts": ts[last],
+        "score": score,
+        "flag": flag,
+    }
+
+
+def _nan_to_none(values) -> list:
+    return [None if v != v else v for v in values.tolist()]
+
+
+def refresh_price_stats(db, now=None, chunk=REFRESH_CHUNK) -> dict:
+    # Recomputes price_stats for every product whose row changed since the
+    # last refresh (all of them the first time), chunk products at a time so
+    # memory and each write transaction stay bounded. now is the time the
+    # trailing window ends at. Returns counts.
+    started = time.time()
+    now = started if now is None else now
+    since = db.get_price_stats_watermark()
+    keys = [(r["site_name"], r["product_code"]) for r in db.get_products_changed_since(since)]
+    totals = {"products": 0, "observations": 0, "scrape_error": 0, "outlier": 0}
+    for i in range(0, len(keys), chunk):
+        part = keys[i:i + chunk]
+        rows = db.get_history_series(part)
+        if not rows:
+            continue
+        data = np.array(rows, dtype=float)
+        products, stats = compute_stats(data[:, 0].astype(np.int64), data[:, 1], data[:, 2], now=now)
+        if not len(products):
+            continue
+        columns = [stats["observations"].tolist()] + [
+            _nan_to_none(stats[name]) for name in ("low", "high", "window_low", "median", "mad", "volatility",
+                                                   "last_price")]
+        last_ts = stats["last_ts"].astype(np.int64).tolist()
+        score = _nan_to_none(stats["score"])
+        flags = [FLAGS[f] for f in stats["flag"].tolist()]
+        db.store_price_stats([(*part[p], *values, ts, s, f, started) for p, *values, ts, s, f
+                              in zip(products.tolist(), *columns, last_ts, score, flags)])
+        totals["products"] += len(products)
+        totals["observations"] += len(rows)
+        totals["scrape_error"] += flags.count("scrape_error")
+        totals["outlier"] += flags.count("outlier")
+    return totals
+
+
+def assess_price_change(price, old_price, stats) -> tuple:
+    # Judges a price change against the product's stored stats (the row
+    # from get_products_by_codes). Returns (suppress, notes): suppress says
+    # why the alert should not go out, or is None; notes are extra lines
+    # for the alert.
+    typical = stats.get("typical_price") if stats else None
+    if not typical or (stats.get("observations") or 0) < MIN_POINTS:
+        return None, []
+    # Either side being far off means a bad scrape, or recovery from one.
+    for p in (price, old_price):
+        if not p or p / typical >= ERROR_RATIO or typical / p >= ERROR_RATIO:
+            return "scrape_error", []
+    notes = []
+    if price < old_price:
+        low, window_low = stats.get("all_time_low"), stats.get("window_low")
+        if low is not None and price < low:
+            notes.append(f"🏆 All-time low (previous ${low:.2f})")
+        elif window_low is not None and price < window_low:
+            notes.append(f"Lowest in {WINDOW_DAYS} days")
+        if price < typical:
+            notes.append(f"{(1 - price / typical) * 100:.0f}% below the typical ${typical:.2f}")
+    return None, notes
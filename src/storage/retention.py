@@ -0,0 +1,112 @@
+import argparse
+import os
+import time
+
+from .db_manager import DAY, DBManager
+
+# Raw hourly observations are kept this many days, then rolled up per day.
+RETAIN_DAYS = 7
+# Observations per compaction transaction; each holds the connection for
+# a few milliseconds, so a scrape waiting to write is not held up long.
+COMPACT_BATCH = 5000
+# Free pages handed back per incremental vacuum step.
+VACUUM_STEP = 2048
+# Pause between steps so writers waiting on the connection get in.
+STEP_PAUSE = 0.01
+
+
+def retention_settings(config) -> dict:
+    return {
+        "retain_days": float(os.getenv("MAINTENANCE_RETAIN_DAYS")
+                             or config.get("MAINTENANCE", "RETAIN_DAYS", fallback=str(RETAIN_DAYS))),
+        "batch": int(os.getenv("MAINTENANCE_COMPACT_BATCH")
+                     or config.get("MAINTENANCE", "COMPACT_BATCH", fallback=str(COMPACT_BATCH))),
+    }
+
+
+def compact(db, retain_days: float = RETAIN_DAYS, batch: int = COMPACT_BATCH, now: float = None,
+            pause: float = STEP_PAUSE) -> dict:
+    # Rolls observations older than retain_days into daily rollups, batch
+    # rows per transaction, then gives the freed pages back with
+    # incremental vacuum, also in steps. The cutoff is the start of a UTC
+    # day, so a day is never split between raw rows and its rollup. Returns
+    # what was done, with the database size before and after.
+    now = time.time() if now is None else now
+    before = int(now - retain_days * DAY)
+    before -= before % DAY
+    size_before = db.storage_stats()
+
+    started = time.monotonic()
+    compacted = rollups = batches = 0
+    longest = 0.0
+    after = None
+    while True:
+        step_started = time.monotonic()
+        rows, days, after = db.compact_observations(before, after=after, limit=batch)
+        longest = max(longest, time.monotonic() - step_started)
+        compacted += rows
+        rollups += days
+        batches += bool(rows)
+        if after is None:
+            break
+        time.sleep(pause)
+    compact_seconds = time.monotonic() - started
+
+    started = time.monotonic()
+    released = 0
+    while True:
+        step = db.incremental_vacuum(VACUUM_STEP)
+        released += step
+        if step < VACUUM_STEP:
+            break
+        time.sleep(pause)
+    vacuum_seconds = time.monotonic() - started
+
+    size_after = db.storage_stats()
+    return {
+        "cutoff": before,
+        "compacted": compacted,
+        "rollups": rollups,
+        "batches": batches,
+        "compact_seconds": compact_seconds,
+        "longest_batch_seconds": longest,
+        "rows_per_second": compacted / compact_seconds if compact_seconds else 0.0,
+        "vacuum_seconds": vacuum_seconds,
+        "pages_released": released,
+        "bytes_before": size_before["bytes"],
+        "bytes_after": size_after["bytes"],
+        "free_bytes": size_after["free_bytes"],
+        "incremental": size_after["incremental"],
+    }
+
+
+def main(argv=None):
+    # One-off maintenance from the command line against the bot's database.
+    parser = argparse.ArgumentParser(description="Compact observations and reclaim database space.")
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--retain-days", type=float, default=RETAIN_DAYS)
+    parser.add_argument("--batch", type=int, default=COMPACT_BATCH)
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="switch a database created before retention to incremental auto-vacuum "
+                             "(one full VACUUM; stop the bot first)")
+    args = parser.parse_args(argv)
+
+    with (DBManager(args.db) if args.db else DBManager()) as db:
+        db.initialize_database()
+        if args.enable_incremental_vacuum:
+            before = db.storage_stats()
+            started = time.monotonic()
+            if not db.enable_incremental_vacuum():
+                print("Incremental auto-vacuum is already enabled.")
+                return
+            after = db.storage_stats()
+            print(f"Enabled incremental auto-vacuum in {time.monotonic() - started:.1f}s: "
+                  f"DB {before['bytes'] / 2**20:.1f} -> {after['bytes'] / 2**20:.1f} MiB")
+            return
+        report = compact(db, retain_days=args.retain_days, batch=args.batch)
+        print(f"Compacted {report['compacted']} observations into {report['rollups']} daily rollups, "
+              f"DB {report['bytes_before'] / 2**20:.1f} -> {report['bytes_after'] / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+from benchmarks.fake_telegram_server import FakeTelegramServer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@pytest.fixture
+def telegram_server():
+    with FakeTelegramServer() as server:
+        yield server
+
+
+@pytest.fixture
+def fixtures_dir():
+    return FIXTURES
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from src.core import bot
+from src.core.bot import Alerter, run_all_scrapers_async
+from src.storage.db_manager import DBManager
+
+CATEGORIES = ["a", "b", "c"]
+
+
+class FakeSite:
+    # Streams two products per category, or a failed marker for the
+    # categories in broken, and records which categories were asked for.
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+        self.asked = []
+
+    async def __call__(self, db=None, categories=None, sink=None, session=None):
+        self.asked.append(list(categories))
+        for c in categories:
+            if c in self.broken:
+                await sink([{"failed": True, "category": c}])
+                continue
+            await sink([{"code": f"{c}{i}", "name": f"Product {c}{i}", "url": f"/p/{c}{i}", "price": 10.0,
+                         "stock_status": "In Stock", "category": c} for i in range(2)]
+                       + [{"done": True, "category": c, "pages": 1}])
+        return []
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "CATEGORY_RETRIES", 0)
+    with DBManager(db_file=str(tmp_path / "products.db")) as db:
+        db.initialize_database()
+        yield db
+
+
+def run(monkeypatch, db, site):
+    monkeypatch.setattr(bot, "scrape_megaeletronicos", site)
+    return asyncio.run(run_all_scrapers_async(db, Alerter(None, None),
+                                              categories={"megaeletronicos": CATEGORIES}))
+
+
+def test_finished_run_with_failures_is_not_resumed(monkeypatch, db):
+    results = run(monkeypatch, db, FakeSite(broken={"c"}))
+    assert results["megaeletronicos"]["a"] == [2, 2] and results["megaeletronicos"].get("c") is None
+    assert db.get_checkpoints() == {}
+
+    site = FakeSite()
+    results = run(monkeypatch, db, site)
+    assert site.asked == [CATEGORIES]
+    # Counts are this run's own, not replayed from the one before.
+    assert results["megaeletronicos"] == {"a": [0, 2], "b": [0, 2], "c": [2, 2]}
+
+
+def test_interrupted_run_is_resumed(monkeypatch, db):
+    # A run that stored category a and then died before finishing.
+    db.begin_checkpointed_run()
+    db.store_checkpoints("megaeletronicos", [("a", 1, 2, 2)])
+
+    site = FakeSite()
+    results = run(monkeypatch, db, site)
+    assert site.asked == [["b", "c"]]
+    assert results["megaeletronicos"] == {"a": [2, 2], "b": [2, 2], "c": [2, 2]}
+    assert db.get_checkpoints() == {}
+    assert not db.begin_checkpointed_run()
@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+from src.alerter import CommandBot, ProductIndex, TelegramSender
+from src.storage.db_manager import DBManager
+
+# (code, name, url, price, stock, category) per site, the way the scrapers
+# store them.
+CATALOG = {
+    "megaeletronicos": [
+        ("1001", "Apple iPhone 15 128GB", "https://mega.example/p/1001", 1099.0, "In Stock", "celulares"),
+        ("1002", "Samsung Galaxy S24", "https://mega.example/p/1002", 849.5, "Out of Stock", "celulares"),
+        ("1003", "Câmera Canon EOS R50", "https://mega.example/p/1003", 700.0, "In Stock", "camaras"),
+        ("1004", "Cámara Sony ZV-1", "https://mega.example/p/1004", None, "In Stock", "camaras"),
+    ],
+    "mobilezone": [
+        ("1001", "iPhone 15 128GB Apple", "https://mz.example/p/1001", 1049.0, "In Stock", "celulares"),
+        ("2001", "Samsung Galaxy A55", "https://mz.example/p/2001", 399.0, "In Stock", "celulares"),
+    ],
+}
+DAY = 86400
+
+
+@pytest.fixture
+def db(tmp_path):
+    with DBManager(db_file=str(tmp_path / "products.db")) as db:
+        db.initialize_database()
+        for site, rows in CATALOG.items():
+            db.bulk_upsert_products(site, rows)
+        db.append_price_history("megaeletronicos", [("1001", 1199.0, "In Stock")], ts=1_700_000_000)
+        db.append_price_history("megaeletronicos", [("1001", 1099.0, "In Stock")], ts=1_700_000_000 + DAY)
+        yield db
+
+
+@pytest.fixture
+def index(db):
+    index = ProductIndex(db)
+    index.refresh()
+    return index
+
+
+def codes(products):
+    return [(p["site"], p["code"]) for p in products]
+
+
+def ask(bot, text):
+    return asyncio.run(bot.answer(text))
+
+
+def test_index_loads_tracked_products(index):
+    assert len(index) == 6 and index.version == 1
+    p = index.products[("mobilezone", "2001")]
+    assert (p["name"], p["price"], p["stock"], p["category"]) == ("Samsung Galaxy A55", 399.0, "In Stock",
+                                                                  "celulares")
+
+
+def test_lookup_is_cheapest_first_across_sites(index):
+    assert codes(index.lookup("1001")) == [("mobilezone", "1001"), ("megaeletronicos", "1001")]
+    assert codes(index.lookup(1001, site="megaeletronicos")) == [("megaeletronicos", "1001")]
+    assert index.lookup("9999") == []
+
+
+def test_search_matches_every_word_folded(index):
+    assert codes(index.search("galaxy samsung")) == [("mobilezone", "2001"), ("megaeletronicos", "1002")]
+    # Accents and case are folded; products without a price sort last.
+    assert codes(index.search("CAMARA")) == [("megaeletronicos", "1004")]
+    assert codes(index.search("apple 128gb", limit=1)) == [("mobilezone", "1001")]
+    assert index.search("galaxy iphone") == [] and index.search("") == []
+
+
+def test_search_in_stock_skips_sold_out_and_unpriced(index):
+    assert codes(index.search("samsung", in_stock=True)) == [("mobilezone", "2001")]
+    assert index.search("camara sony", in_stock=True) == []
+
+
+def test_refresh_applies_only_changes(db, index):
+    assert index.refresh() == 0 and index.version == 1
+    db.bulk_upsert_products("mobilezone", [("2001", "Samsung Galaxy A55 5G", "https://mz.example/p/2001", 379.0,
+                                            "In Stock", "celulares")])
+    db.delist_missing("megaeletronicos", ["1001", "1003", "1004"], ["celulares"])
+    assert index.refresh() == 2 and index.version == 2
+    assert index.products[("mobilezone", "2001")]["price"] == 379.0
+    assert codes(index.search("5g")) == [("mobilezone", "2001")]
+    # The delisted product is gone from every lookup.
+    assert ("megaeletronicos", "1002") not in index.products
+    assert codes(index.search("galaxy")) == [("mobilezone", "2001")]
+
+
+def test_price_answers(index):
+    bot = CommandBot("token", index, sender=None)
+    reply = ask(bot, "/price 1001")
+    assert reply.index("$1049.00") < reply.index("$1099.00")
+    assert "<b>Apple iPhone 15 128GB</b>" in reply and "<code>1001</code>" in reply
+    # Not a code: falls back to a name search.
+    assert ask(bot, "/price galaxy a55").startswith("Products matching 'galaxy a55':")
+    assert ask(bot, "/price") == "Usage: /price &lt;code&gt;"
+
+
+def test_search_and_cheapest_answers(index):
+    bot = CommandBot("token", index, sender=None)
+    reply = ask(bot, "/search samsung")
+    assert reply.startswith("Products matching 'samsung':") and "Out of Stock" in reply
+    reply = ask(bot, "/cheapest@pricebot samsung")
+    assert reply.startswith("Cheapest in stock for 'samsung':")
+    assert "Galaxy A55" in reply and "Galaxy S24" not in reply
+    assert ask(bot, "/search tablet") == "Products matching 'tablet': nothing found."
+    assert ask(bot, "/search <b>") == "Products matching '&lt;b&gt;': nothing found."
+
+
+def test_history_answer(index):
+    bot = CommandBot("token", index, sender=None)
+    assert ask(bot, "/history 1001 megaeletronicos") == (
+        "<b>Apple iPhone 15 128GB</b> (megaeletronicos)\n"
+        "2023-11-14 22:13  $1199.00  In Stock\n"
+        "2023-11-15 22:13  $1099.00  In Stock")
+    assert ask(bot, "/history 2001").endswith("No history yet.")
+    assert ask(bot, "/history 9999") == "No product with code <code>9999</code>."
+
+
+def test_unknown_text_gets_no_answer(index):
+    bot = CommandBot("token", index, sender=None)
+    assert ask(bot, "hello") is None and ask(bot, "/unknown") is None
+    assert ask(bot, "/help").startswith("/price")
+
+
+def test_answers_cached_per_index_version(db, index):
+    bot = CommandBot("token", index, sender=None)
+    first = ask(bot, "/search Samsung")
+    assert ask(bot, "/search samsung") == first and bot.cache.hits == 1
+    db.bulk_upsert_products("mobilezone", [("2001", "Samsung Galaxy A55", "https://mz.example/p/2001", 299.0,
+                                            "In Stock", "celulares")])
+    index.refresh()
+    assert "$299.00" in ask(bot, "/search samsung") and bot.cache.misses == 2
+
+
+def test_replies_through_bot_api(index, telegram_server):
+    async def run():
+        async with TelegramSender("token", api_url=telegram_server.url, chat_rate=100) as sender:
+            bot = CommandBot("token", index, sender, api_url=telegram_server.url, poll_timeout=1,
+                             allowed_chats=[1])
+            bot.start()
+            telegram_server.push_update(2, "/price 2001")
+            telegram_server.push_update(1, "/price 2001")
+            while not telegram_server.replies(1):
+                await asyncio.sleep(0.01)
+            await bot.stop()
+            return bot
+
+    bot = asyncio.run(run())
+    assert bot.answered == 1 and bot.offset == 3
+    assert "Samsung Galaxy A55" in telegram_server.replies(1)[0]
+    assert telegram_server.replies(2) == []
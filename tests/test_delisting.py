@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.core.bot import DELIST_GRACE, Alerter, StreamingDiff
+from src.storage.db_manager import DBManager
+
+
+def product(code, category):
+    return {"code": code, "name": f"Product {code}", "url": f"/p/{code}", "price": 10.0,
+            "stock_status": "In Stock", "category": category}
+
+
+@pytest.fixture
+def db(tmp_path):
+    # Three products in category a and two in b, as a previous run stored them.
+    with DBManager(db_file=str(tmp_path / "products.db")) as db:
+        db.initialize_database()
+        diff = StreamingDiff(db, "site", Alerter(None, None, delisted=True))
+        diff.process_batch([product(c, "a") for c in "123"] + [product(c, "b") for c in "45"]
+                           + [{"done": True, "category": c, "pages": 1} for c in "ab"])
+        diff.finish()
+        yield db
+
+
+def run(db, batch, partial):
+    diff = StreamingDiff(db, "site", Alerter(None, None, delisted=True), partial=partial)
+    diff.process_batch(batch)
+    diff.finish()
+    return diff
+
+
+def tracked(db):
+    return sorted(db.get_products_for_site("site", tracked_only=True))
+
+
+def age(db, code, seconds):
+    seen = (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+    db._execute("UPDATE products SET last_seen_timestamp = ? WHERE product_code = ?;", (seen, code))
+
+
+def test_full_run_delists_missing_products(db):
+    diff = run(db, [product("1", "a"), product("3", "b"), product("4", "b"), product("5", "b"),
+                    {"done": True, "category": "a"}, {"done": True, "category": "b"}], partial=False)
+    # 3 moved to b and was seen there; 2 is gone from the whole site.
+    assert diff.delisted == 1 and tracked(db) == ["1", "3", "4", "5"]
+    assert db.get_product("site", "3")["category"] == "b"
+
+
+def test_partial_run_keeps_product_that_moved(db):
+    # Only a is fetched; 3 moved to b, which this run did not fetch.
+    diff = run(db, [product("1", "a"), product("2", "a"), {"done": True, "category": "a"}], partial=True)
+    assert diff.delisted == 0 and tracked(db) == ["1", "2", "3", "4", "5"]
+    assert diff.alerter.t_msgs == []
+
+
+def test_partial_run_delists_after_grace(db):
+    age(db, "3", DELIST_GRACE + 60)
+    diff = run(db, [product("1", "a"), product("2", "a"), {"done": True, "category": "a"}], partial=True)
+    assert diff.delisted == 1 and tracked(db) == ["1", "2", "4", "5"]
+    assert len(diff.alerter.t_msgs) == 1
+
+
+def test_failed_category_turns_on_grace(db):
+    # b failed, so a product that moved into it would not have been seen.
+    diff = run(db, [product("1", "a"), product("2", "a"), {"done": True, "category": "a"},
+                    {"failed": True, "category": "b"}], partial=False)
+    assert diff.delisted == 0 and tracked(db) == ["1", "2", "3", "4", "5"]
@@ -0,0 +1,71 @@
+import os
+import tracemalloc
+
+import pytest
+
+from src.scraper.megaeletronicos_scraper import parse_category_page
+
+BACKENDS = ("bs4", "lxml")
+PAGES = ("category_page", "last_page", "edge_cases")
+
+
+def load(fixtures_dir, name):
+    with open(os.path.join(fixtures_dir, "megaeletronicos", f"{name}.html"), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_category_page(fixtures_dir, backend):
+    products, last, max_page = parse_category_page(load(fixtures_dir, "category_page"), backend)
+    assert len(products) == 24 and not last and max_page == 3
+    assert products[0] == {"url": "/producto/3000000", "code": "3000000", "name": "Produto 3-0 Smartphone 0 GB",
+                           "price": 50.0, "stock_status": "In Stock"}
+    assert [p["code"] for p in products] == [str(3000000 + i) for i in range(24)]
+    assert [p["code"] for p in products if p["stock_status"] == "Out of Stock"] == ["3000008", "3000019"]
+    assert all(isinstance(p["price"], float) for p in products)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_last_page(fixtures_dir, backend):
+    products, last, max_page = parse_category_page(load(fixtures_dir, "last_page"), backend)
+    assert len(products) == 12 and last and max_page == 3
+    assert products[-1]["code"] == "3000059" and products[-1]["price"] == 722.21
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_edge_cases(fixtures_dir, backend):
+    products, last, max_page = parse_category_page(load(fixtures_dir, "edge_cases"), backend)
+    assert not last and max_page == 7
+    assert products == [
+        # get_text(strip=True) joins the stripped text nodes without spaces.
+        {"url": "/producto/12345", "code": "12345", "name": "Apple iPhone 15128GB", "price": 1099.5,
+         "stock_status": "In Stock"},
+        {"url": "/producto/67890", "code": "67890", "name": "Câmera Canon EOS", "price": 750.0,
+         "stock_status": "Out of Stock"},
+        {"url": None, "code": None, "name": "Cargador USB-C", "price": None, "stock_status": "Out of Stock"},
+        {"url": "/producto/555", "code": "555", "name": "Funda", "price": "", "stock_status": "Out of Stock"},
+    ]
+
+
+def test_empty_page():
+    assert parse_category_page(b"", "lxml") == ([], True, 0)
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_backends_match(fixtures_dir, page):
+    content = load(fixtures_dir, page)
+    assert parse_category_page(content, "lxml") == parse_category_page(content, "bs4")
+
+
+@pytest.mark.parametrize("page", PAGES)
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_parse_benchmark(benchmark, fixtures_dir, backend, page):
+    # Time per page is pytest-benchmark's; the Python heap peak of one parse
+    # goes in extra_info (libxml2's C allocations are not traced).
+    content = load(fixtures_dir, page)
+    tracemalloc.start()
+    expected = parse_category_page(content, backend)
+    benchmark.extra_info["peak_kib"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    tracemalloc.stop()
+    benchmark.extra_info["page_kib"] = round(len(content) / 1024, 1)
+    assert benchmark(parse_category_page, content, backend) == expected
@@ -0,0 +1,66 @@
+import re
+
+from src.common.metrics import MetricsRegistry, RunMetrics
+
+SAMPLE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+LABEL = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*="[^"]*"$')
+
+
+def parse(text):
+    # A strict reading of the Prometheus text format: one TYPE line per
+    # family, before its samples, which are not interleaved with other
+    # families. Returns {family: (type, [(name, labels, value)])}.
+    families = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split()
+            assert name not in families, f"second TYPE line for {name}"
+            families[name] = (kind, [])
+            current = name
+            continue
+        assert not line.startswith("#"), line
+        m = SAMPLE.match(line)
+        assert m, f"bad sample line: {line!r}"
+        name = m.group("name")
+        assert current is not None and (name == current or name.startswith(current + "_")), \
+            f"{name} outside its family"
+        labels = dict(part.split("=", 1) for part in m.group("labels").split(",")) if m.group("labels") else {}
+        assert all(LABEL.match(f"{k}={v}") for k, v in labels.items()), line
+        families[current][1].append((name, labels, float(m.group("value"))))
+    return families
+
+
+def finished_run(kind, status="ok"):
+    run = RunMetrics(kind)
+    run.inc("requests", 3, site="megaeletronicos")
+    run.inc("requests", 2, site="mobilezone")
+    run.observe("fetch_seconds", 0.2, site="mobilezone")
+    run.finish(status)
+    return run
+
+
+def test_render_is_valid_exposition_format():
+    registry = MetricsRegistry()
+    for kind in ("scrape", "adaptive", "maintenance", "scrape"):
+        registry.absorb(finished_run(kind))
+    families = parse(registry.render())
+
+    kind, samples = families["pricebot_last_run_duration_seconds"]
+    assert kind == "gauge"
+    assert sorted(labels["kind"] for _, labels, _ in samples) == ['"adaptive"', '"maintenance"', '"scrape"']
+    assert len(families["pricebot_last_run_timestamp_seconds"][1]) == 3
+
+    runs = {labels["kind"]: value for _, labels, value in families["pricebot_runs_total"][1]}
+    assert runs == {'"adaptive"': 1, '"maintenance"': 1, '"scrape"': 2}
+    requests = {labels["site"]: value for _, labels, value in families["pricebot_requests_total"][1]}
+    assert requests == {'"megaeletronicos"': 12, '"mobilezone"': 8}
+    kind, samples = families["pricebot_fetch_seconds"]
+    assert kind == "histogram"
+    assert [v for n, _, v in samples if n == "pricebot_fetch_seconds_count"] == [4]
+    assert "pricebot_peak_rss_megabytes" in families
+
+
+def test_render_empty_registry():
+    families = parse(MetricsRegistry().render())
+    assert families["pricebot_runs_total"] == ("counter", [])
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from benchmarks.catalog_server import CatalogServer
+from src.scraper import mobilezone_api
+from src.scraper.host_limiter import HostLimiter
+from src.scraper.mobilezone_api import category_url
+
+
+@pytest.fixture
+def api(monkeypatch, fixtures_dir):
+    # Recorded JSON from tests/fixtures/mobilezone, served like the SPA's backend.
+    with CatalogServer(fixtures_dir=f"{fixtures_dir}/mobilezone") as server:
+        monkeypatch.setenv("MOBILEZONE_API_URL", server.url + "api/")
+        yield server
+
+
+def scrape(**kwargs):
+    batches = []
+
+    async def sink(batch):
+        batches.append(batch)
+
+    products = asyncio.run(mobilezone_api.main(sink=sink, **kwargs))
+    assert products == []
+    return [p for b in batches for p in b]
+
+
+def test_discover_returns_category_urls(api):
+    assert asyncio.run(mobilezone_api.discover()) == [
+        category_url("celulares"), category_url("audio"), category_url("vacia"),
+    ]
+    assert category_url("audio") == "https://www.mobilezone.com.py/query/audio"
+
+
+def test_main_parses_recorded_payloads(api):
+    products = sorted(asyncio.run(mobilezone_api.main()), key=lambda p: p["code"])
+    cel = category_url("celulares")
+    assert products == [
+        {"code": "10001", "name": "Apple iPhone 15 128GB", "price": 1099.0, "stock_status": "In Stock",
+         "url": "https://www.mobilezone.com.py/product/10001", "category": cel},
+        {"code": "10002", "name": "Samsung Galaxy S24", "price": 849.5, "stock_status": "Out of Stock",
+         "url": "https://www.mobilezone.com.py/product/10002", "category": cel},
+        {"code": "10003", "name": "Xiaomi Redmi Note 13", "price": None, "stock_status": "Out of Stock",
+         "url": "https://www.mobilezone.com.py/product/10003", "category": cel},
+        {"code": "10004", "name": "Motorola Edge 50", "price": 399.9, "stock_status": "In Stock",
+         "url": "https://www.mobilezone.com.py/product/10004", "category": cel},
+        {"code": "A-77", "name": "JBL Flip 6", "price": 119.0, "stock_status": "In Stock",
+         "url": "https://www.mobilezone.com.py/product/A-77", "category": category_url("audio")},
+    ]
+    assert api.requests == 5
+
+
+def test_stream_ends_each_category_with_done_marker(api):
+    items = scrape()
+    done = {p["category"]: p["pages"] for p in items if p.get("done")}
+    assert done == {category_url("celulares"): 2, category_url("audio"): 1, category_url("vacia"): 1}
+    assert sum(1 for p in items if p.get("code")) == 5
+
+
+def test_slugs_and_urls_select_the_same_category(api):
+    by_slug = scrape(categories=["celulares"])
+    by_url = scrape(categories=[category_url("celulares")])
+    assert by_slug == by_url and len(by_slug) == 5
+
+
+def test_failed_page_marks_category_failed(api, monkeypatch):
+    monkeypatch.setattr(HostLimiter, "retry_delay", lambda self, attempt: 0)
+    items = scrape(categories=["rota", "audio"])
+    markers = [p for p in items if p.get("failed") or p.get("done")]
+    assert {"failed": True, "category": category_url("rota")} in markers
+    assert {"done": True, "category": category_url("audio"), "pages": 1} in markers
+    # Page 1 was streamed before pages 2 and 3 failed.
+    assert [p["code"] for p in items if p.get("code")] in (["90001", "A-77"], ["A-77", "90001"])
+
+
+def test_main_matches_synthetic_catalog(monkeypatch):
+    with CatalogServer(categories=3, products_per_category=100, page_size=48) as server:
+        monkeypatch.setenv("MOBILEZONE_API_URL", server.url + "api/")
+        products = asyncio.run(mobilezone_api.main())
+    expected = {p["code"]: p for c in range(3) for p in (server.product(c, i) for i in range(100))}
+    assert len(products) == len(expected) == len({p["code"] for p in products})
+    for p in products:
+        e = expected[p["code"]]
+        assert (p["name"], p["price"]) == (e["name"], e["price"])
+        assert p["stock_status"] == ("In Stock" if e["in_stock"] else "Out of Stock")
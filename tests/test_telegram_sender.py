@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from benchmarks.fake_telegram_server import FakeTelegramServer
+from src.alerter.telegram_alerter import MAX_MESSAGE_LENGTH, TelegramSender, TokenBucket
+
+
+def test_token_bucket_paces_to_rate():
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=1)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # The first token is there from the start; the other four take 1/20s each.
+    assert 0.18 <= asyncio.run(run()) < 0.5
+
+
+def test_token_bucket_pause_blocks_until_over():
+    async def run():
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.pause(0.3)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.29
+
+
+def test_sender_delivers_in_order(telegram_server):
+    async def run():
+        async with TelegramSender("token", api_url=telegram_server.url, chat_rate=100) as sender:
+            sent = await sender.send_many("1", [f"alert {i}" for i in range(5)])
+        return sent, sender
+
+    sent, sender = asyncio.run(run())
+    assert sent == 5 and sender.sent == 5 and sender.failed == 0
+    assert telegram_server.replies("1") == [f"alert {i}" for i in range(5)]
+
+
+def test_sender_honors_retry_after():
+    with FakeTelegramServer(retry_after=1, throttle_first=1) as server:
+        async def run():
+            async with TelegramSender("token", api_url=server.url, chat_rate=100) as sender:
+                started = time.monotonic()
+                ok = await sender.send_message("1", "hello")
+                return ok, time.monotonic() - started, sender
+
+        ok, elapsed, sender = asyncio.run(run())
+    assert ok and sender.throttled == 1 and server.throttled == 1
+    assert elapsed >= 0.95
+    assert server.replies("1") == ["hello"]
+
+
+def test_retry_after_pauses_every_chat():
+    # The flood limit is per bot: once one chat gets a 429, a message to
+    # another chat waits for the same retry_after.
+    with FakeTelegramServer(retry_after=1, throttle_first=1) as server:
+        async def run():
+            async with TelegramSender("token", api_url=server.url, chat_rate=100) as sender:
+                started = time.monotonic()
+                first = asyncio.create_task(sender.send_message("1", "first"))
+                while not server.throttled:
+                    await asyncio.sleep(0.01)
+                await sender.send_message("2", "second")
+                other = time.monotonic() - started
+                await first
+                return other
+
+        assert asyncio.run(run()) >= 0.95
+    assert server.replies("1") == ["first"] and server.replies("2") == ["second"]
+
+
+def test_sender_gives_up_after_max_retries():
+    with FakeTelegramServer(retry_after=0, throttle_first=10) as server:
+        async def run():
+            async with TelegramSender("token", api_url=server.url, chat_rate=100, max_retries=2) as sender:
+                return await sender.send_message("1", "hello"), sender
+
+        ok, sender = asyncio.run(run())
+    assert not ok and sender.failed == 1 and server.requests == 2
+
+
+def test_digest_packs_under_message_limit(telegram_server):
+    messages = [f"alert {i} " + "x" * 1000 for i in range(10)]
+
+    async def run():
+        async with TelegramSender("token", api_url=telegram_server.url, chat_rate=100) as sender:
+            return await sender.send_many("1", messages, digest=True)
+
+    sent = asyncio.run(run())
+    replies = telegram_server.replies("1")
+    assert sent == len(replies) < len(messages)
+    assert all(len(r) <= MAX_MESSAGE_LENGTH for r in replies)
+    assert all(any(m in r for r in replies) for m in messages)